@@ -17,36 +17,26 @@ import graphviz
 
 ####  Task Definitions  ####
 
-####  Flow 1 - Downloading Daily Caches - updating annual file
+####  Flow 1 - Downloading Daily Caches
 
-# 1. Set workspace
-set_workspace = task(ot.set_workspace)
-
-# 2. Set Cache Locations
-set_cache_root = task(ot.set_cache_root)
-
-# 3. Get Year for Current and Last Month
+# 1. Get Year for Current and Last Month
 get_update_month = task(ot.get_update_month, name = "get_update_month")
 get_prev_month   = task(ot.get_update_month, name = "get_prev_month")
 
-# 4. Get Current & Previous Months
+# 2. Get Current & Previous Months
 get_update_yr     = task(ot.check_update_yr, name = "get_update_yr")
 get_prev_month_yr = task(ot.check_update_yr, name = "get_prev_month_yr")
 
-# 5. Cache Current & Previous Months
+# 3. Cache Current & Previous Months
 cache_current_month = task(ot.cache_oisst, name = "cache_current_month")
 cache_prev_month    = task(ot.cache_oisst, name = "cache_prev_month")
 
-# 6. Assemble Annual File(s)
-oisst_update = task(ot.build_annual_from_cache)
-
-# 8. Save Update
-oisst_save_update = task(ot.export_annual_update)
-
 
-####  Flow 2 - Updating Global Anomalies
+####  Flow 2 - Updating Annual Files and Global Anomalies
 
-# update_global_anoms = ot.
+# Annual files, anomalies, monthly/annual means and regional timelines for the days that changed
+update_downstream = task(ot.run_oisst_update, name = "update_downstream")
+region_groups = ["gmri_sst_focal_areas", "lme", "nmfs_trawl_regions", "nelme_regions", "gom_physio_regions"]
 
 
 ####  Flow 3 - Regional Timeseries
@@ -66,8 +56,6 @@ oisst_save_update = task(ot.export_annual_update)
 with Flow("OISST weekly download") as oisst_flow:
   # Downloading Daily Files
   workspace = Parameter("workspace", default = "local")        
-  box_root = set_workspace(workspace)
-  cache_root = set_cache_root(box_root)
   this_month = get_update_month(return_this_month = True)
   this_yr = get_update_yr(for_this_month = True)
   this_month_cache = cache_current_month(cache_month = this_month, 
@@ -80,15 +68,12 @@ with Flow("OISST weekly download") as oisst_flow:
                                       update_yr = last_month_yr, 
                                       workspace = workspace, 
                                       verbose = True)
-  oisst_annual_update = oisst_update(last_month = last_month, 
-                                     this_month = this_month, 
-                                     workspace = workspace, 
-                                     verbose = True)
-  save_updated_yr = oisst_save_update(cache_root = cache_root,
-                                      update_yr = this_yr,
-                                      oisst_update = oisst_annual_update)
   
-  # Upcoming: Processing Anomalies
+  # Annual Files, Anomalies and Regional Timelines for the days that changed
+  downstream_update = update_downstream(workspace = workspace, 
+                                        region_groups = region_groups, 
+                                        download = False, 
+                                        upstream_tasks = [this_month_cache, last_month_cache])
 
 
 
@@ -126,8 +111,6 @@ with Flow("OISST weekly download", schedule = schedule) as oisst_flow:
   
   # Downloading Daily Files
   workspace = Parameter("workspace", default = "local")        
-  box_root = set_workspace(workspace)
-  cache_root = set_cache_root(box_root)
   this_month = get_update_month(return_this_month = True)
   this_yr = get_update_yr(for_this_month = True)
   this_month_cache = cache_current_month(cache_month = this_month, 
@@ -140,19 +123,15 @@ with Flow("OISST weekly download", schedule = schedule) as oisst_flow:
                                       update_yr = last_month_yr, 
                                       workspace = workspace, 
                                       verbose = True)
-  oisst_annual_update = oisst_update(last_month = last_month, 
-                                     this_month = this_month, 
-                                     workspace = workspace, 
-                                     verbose = True)
-  save_updated_yr = oisst_save_update(cache_root = cache_root,
-                                      update_yr = this_yr,
-                                      oisst_update = oisst_annual_update)
   
-  # Upcoming: Processing Anomalies
+  # Annual Files, Anomalies and Regional Timelines for the days that changed
+  downstream_update = update_downstream(workspace = workspace, 
+                                        region_groups = region_groups, 
+                                        download = False, 
+                                        upstream_tasks = [this_month_cache, last_month_cache])
   
   
   
-  # Upcoming: Regional Timelines
 
 
 
@@ -3,12 +3,26 @@
 
 import requests
 from bs4 import BeautifulSoup
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import email.utils
+import functools
+import hashlib
+import inspect
+import json
+import multiprocessing
+import pickle
+import tempfile
 import os
+import shutil
 import xarray as xr
 import datetime
+import netCDF4
 import regionmask
+import geopandas as gpd
+import zarr
 import numpy as np
 import pandas as pd
+from scipy import sparse, stats
 
 
 
@@ -109,28 +123,441 @@ def check_update_yr(for_this_month: bool) -> True:
 
   
   
-#----------------------------------------------------
+#-----------------------------------------------------
 #
-# Check for repeated list elements
+#  List Daily Files in NCEI Month Directory
 #
-#----------------------------------------------------
-def Repeat(x): 
+#-----------------------------------------------------
+def list_oisst_files(fetch_url, session = None):
+  """
+  Scrape the http directory listing for a month of OISSTv2 daily files
+  and return the file names that end with ".nc"
+  
+  Args:
+    fetch_url (str): Url of the month directory listing, ending in "/"
+    session : Optional requests.Session to reuse connections with
+  
+  """
+  # Open the http directory listing
+  getter = requests if session is None else session
+  req = getter.get(fetch_url)
+  
+  # Print error message if link does not work
+  if req.status_code != requests.codes.ok:
+    print(f"Request Error, Reason: {req.reason}")
+    return []
+  
+  # Parse the url with BS and its html parser, pull all href anchors
+  soup = BeautifulSoup(req.text, 'html.parser')
+  anchors = soup.find_all("a")
+  
+  # Keep the links that end with ".nc"
+  nc_files = []
+  for link in anchors:
+    href = link.get('href')
+    if href is not None and href.endswith('.nc') and href not in nc_files:
+      nc_files.append(href)
+  
+  return nc_files
+
+
+
+#-----------------------------------------------------
+#
+#  Check Cached File Against Server Copy
+#
+#-----------------------------------------------------
+def cached_file_current(dl_path, headers):
+  """
+  Compare a cached daily file against the headers of the server copy. A file
+  is current when it exists, its size matches Content-Length, and its 
+  modification time matches Last-Modified (set when the file was downloaded).
+  Headers the server does not send are not used in the comparison.
+  
+  Args:
+    dl_path (str): Path to the file in the month cache
+    headers : Response headers from a HEAD request for the file
+  
+  """
+  # Nothing to compare against
+  if not os.path.exists(dl_path):
+    return False
+  
+  # Size check
+  remote_size = headers.get("Content-Length")
+  if remote_size is not None and int(remote_size) != os.path.getsize(dl_path):
+    return False
+  
+  # Last-Modified check, compared to the whole second
+  remote_modified = headers.get("Last-Modified")
+  if remote_modified is not None:
+    remote_time = email.utils.parsedate_to_datetime(remote_modified).timestamp()
+    if int(remote_time) != int(os.path.getmtime(dl_path)):
+      return False
+  
+  return True
+
+
+
+#-----------------------------------------------------
+#
+#  Download One Daily File Atomically
+#
+#-----------------------------------------------------
+def download_oisst_file(session, file_url, dl_path, chunk_size = 1048576):
+  """
+  Download a single daily NetCDF file into the month cache, skipping it
+  if the cached copy is unchanged. Data is streamed to a temporary file in 
+  the cache folder and renamed into place once complete, so an interrupted
+  download never leaves a partial .nc file behind.
+  
+  Args:
+    session : requests.Session shared by the download workers
+    file_url (str): Url of the daily file on the server
+    dl_path (str): Destination path in the month cache
+    chunk_size (int): Bytes to write at a time
+  
+  Returns:
+    True if the file was downloaded, False if the cached copy was kept
+  
+  """
+  # Check the server copy before pulling anything down
+  head = session.head(file_url, allow_redirects = True)
+  head.raise_for_status()
+  if cached_file_current(dl_path, head.headers):
+    return False
+  
+  # Stream into a temp file next to the destination
+  req = session.get(file_url, stream = True)
+  req.raise_for_status()
+  cache_dir = os.path.dirname(dl_path)
+  tmp_file = tempfile.NamedTemporaryFile(dir = cache_dir, suffix = ".part", delete = False)
+  try:
+    with tmp_file:
+      for chunk in req.iter_content(chunk_size):
+        tmp_file.write(chunk)
+    
+    # Stamp with the server modification time for the next comparison
+    remote_modified = req.headers.get("Last-Modified")
+    if remote_modified is not None:
+      remote_time = email.utils.parsedate_to_datetime(remote_modified).timestamp()
+      os.utime(tmp_file.name, (remote_time, remote_time))
+    
+    # Move into place
+    os.replace(tmp_file.name, dl_path)
+  except BaseException:
+    if os.path.exists(tmp_file.name):
+      os.remove(tmp_file.name)
+    raise
+  finally:
+    req.close()
+  
+  return True
+
+
+
+#-----------------------------------------------------
+#
+#  Download a Month of Daily Files Concurrently
+#
+#-----------------------------------------------------
+def download_month_files(fetch_url, month_cache, max_workers = 4, verbose = True, final_dates = None):
+  """
+  Fetch all daily files listed at fetch_url into month_cache using a bounded
+  pool of workers over one pooled http session. Files that are already cached
+  and unchanged on the server are skipped, as are preliminary files for days
+  that are already cached as final.
+  
+  Args:
+    fetch_url (str): Url of the month directory listing, ending in "/"
+    month_cache (str): Local folder for the month, ending in "/"
+    max_workers (int): Number of concurrent downloads
+    verbose : True or False to print progress
+    final_dates : Date ids ("YYYYMMDD") with final data in the cache, e.g. from the cache manifest
+  
+  Returns:
+    List of paths that were newly downloaded
+  
+  """
+  # Make sure the cache folder is there
+  os.makedirs(month_cache, exist_ok = True)
+  
+  # One session, with a connection pool sized to the workers
+  session = requests.Session()
+  adapter = requests.adapters.HTTPAdapter(pool_connections = 1, pool_maxsize = max_workers)
+  session.mount("http://", adapter)
+  session.mount("https://", adapter)
+  
+  try:
+    # Files available for the month, never preliminary data for a finalized day
+    nc_files = list_oisst_files(fetch_url, session = session)
+    if final_dates is not None:
+      final_dates = set(final_dates)
+      skipped  = [href for href in nc_files 
+                  if parse_oisst_fname(href)[1] == "preliminary" and parse_oisst_fname(href)[0] in final_dates]
+      nc_files = [href for href in nc_files if href not in skipped]
+      if verbose == True:
+        for href in skipped:
+          print(f"Preliminary File Skipped, Final Data Cached: {href}")
+    
+    # Fetch them through the worker pool
+    def fetch(href):
+      return download_oisst_file(session, f"{fetch_url}{href}", f"{month_cache}{href}")
+    
+    with ThreadPoolExecutor(max_workers = max_workers) as pool:
+      results = list(pool.map(fetch, nc_files))
+  finally:
+    session.close()
+  
+  # Log and report downloads
+  new_downloads = []
+  for href, downloaded in zip(nc_files, results):
+    if downloaded:
+      new_downloads.append(f"{month_cache}{href}")
+      if verbose == True:
+        print(f"Caching Daily NETCDF File: {href}")
+    elif verbose == True:
+      print(f"Cached File Unchanged: {href}")
+  
+  return new_downloads
+
+
+
+#-----------------------------------------------------
+#
+#  Cache Manifest for update_caches
+#
+#-----------------------------------------------------
+def get_manifest_path(cache_root):
+  """
+  Path to the JSON manifest that indexes the daily files in update_caches/
+  
+  Args:
+    cache_root (str): Path to Box/RES_Data/OISST/oisst_mainstays/ from ot.set_cache_root()
+  
+  """
+  return f"{cache_root}update_caches/cache_manifest.json"
+
+
+
+#-----------------------------------------------------
+#
+#  Pull Date and Status from Daily File Name
+#
+#-----------------------------------------------------
+def parse_oisst_fname(file_name):
+  """
+  Return the date id and data status for an OISSTv2 daily file name,
+  e.g. "oisst-avhrr-v02r01.20210301_preliminary.nc" -> ("20210301", "preliminary").
+  Returns (None, None) for anything that is not a daily file.
+  
+  Args:
+    file_name (str): Daily file name, with or without its folder
+  
+  """
+  file_name = os.path.basename(file_name)
+  if not (file_name.startswith("oisst-avhrr-") and file_name.endswith(".nc")):
+    return None, None
+  
+  # Date follows the version stamp
+  date_part = file_name.split(".")[1]
+  date_id   = date_part[0:8]
+  status    = "preliminary" if date_part.endswith("_preliminary") else "final"
+  return date_id, status
+
+
+
+#-----------------------------------------------------
+#
+#  Checksum for Cached Files
+#
+#-----------------------------------------------------
+def file_checksum(file_path, chunk_size = 1048576):
+  """
+  md5 checksum of a file, read in chunks
+  
+  Args:
+    file_path (str): File to checksum
+    chunk_size (int): Bytes to read at a time
+  
+  """
+  file_hash = hashlib.md5()
+  with open(file_path, "rb") as f:
+    for chunk in iter(lambda: f.read(chunk_size), b""):
+      file_hash.update(chunk)
+  return file_hash.hexdigest()
+
+
+
+#-----------------------------------------------------
+#
+#  Load / Save Cache Manifest
+#
+#-----------------------------------------------------
+def load_cache_manifest(cache_root, prune = False):
+  """
+  Load the update_caches manifest, a dictionary keyed by "YYYYMMDD" date id.
+  Each entry records the status ("preliminary" or "final"), the path relative 
+  to update_caches/, size, and checksum of the file cached for that day.
+  
+  The manifest is built with one scan of the month folders the first time it 
+  is needed, after that it is maintained by ot.cache_oisst() and trusted as is,
+  without checking the files on Box. If files were deleted from the cache by 
+  hand, load it with prune = True or rebuild it with ot.rebuild_cache_manifest().
+  
+  Args:
+    cache_root (str): Path to Box/RES_Data/OISST/oisst_mainstays/ from ot.set_cache_root()
+    prune (bool): True to drop entries whose file no longer exists, one stat per entry
+  
+  """
+  manifest_file = get_manifest_path(cache_root)
+  if not os.path.exists(manifest_file):
+    manifest = rebuild_cache_manifest(cache_root)
+    save_cache_manifest(cache_root, manifest)
+    return manifest
+  
+  with open(manifest_file, "r") as f:
+    manifest = json.load(f)
+  if prune == True and len(prune_cache_manifest(cache_root, manifest)) > 0:
+    save_cache_manifest(cache_root, manifest)
+  return manifest
+
+
+def save_cache_manifest(cache_root, manifest):
+  """
+  Write the update_caches manifest, replacing the old copy in one step
+  
+  Args:
+    cache_root (str): Path to Box/RES_Data/OISST/oisst_mainstays/ from ot.set_cache_root()
+    manifest (dict): Manifest from ot.load_cache_manifest()
+  
+  """
+  manifest_file = get_manifest_path(cache_root)
+  os.makedirs(os.path.dirname(manifest_file), exist_ok = True)
+  tmp_file = f"{manifest_file}.part"
+  with open(tmp_file, "w") as f:
+    json.dump(manifest, f, indent = 1, sort_keys = True)
+  os.replace(tmp_file, manifest_file)
+
+
+
+def prune_cache_manifest(cache_root, manifest):
+  """
+  Remove manifest entries whose cached file no longer exists
+  
+  Args:
+    cache_root (str): Path to Box/RES_Data/OISST/oisst_mainstays/ from ot.set_cache_root()
+    manifest (dict): Manifest from ot.load_cache_manifest(), updated in place
+  
+  Returns:
+    List of the date ids that were removed
+  
+  """
+  update_root = f"{cache_root}update_caches/"
+  missing = [date_id for date_id, cache_entry in manifest.items() 
+             if not os.path.exists(f"{update_root}{cache_entry['path']}")]
+  for date_id in missing:
+    del manifest[date_id]
+  return missing
+
+
+
+#-----------------------------------------------------
+#
+#  Rebuild Cache Manifest from Month Folders
+#
+#-----------------------------------------------------
+def rebuild_cache_manifest(cache_root):
+  """
+  Build a fresh manifest by scanning every month folder in update_caches/ once.
+  Only needed when the manifest is missing or suspected to be out of date. 
+  Dates with both a preliminary and a final file are recorded as final, and
+  the preliminary file is removed.
+  
+  Args:
+    cache_root (str): Path to Box/RES_Data/OISST/oisst_mainstays/ from ot.set_cache_root()
+  
+  """
+  manifest = {}
+  update_root = f"{cache_root}update_caches/"
+  if not os.path.exists(update_root):
+    return manifest
+  
+  for folder in sorted(os.listdir(update_root)):
+    if not os.path.isdir(f"{update_root}{folder}"):
+      continue
+    for file in os.listdir(f"{update_root}{folder}"):
+      date_id, status = parse_oisst_fname(file)
+      if date_id is None:
+        continue
+      record_cache_file(manifest, cache_root, f"{update_root}{folder}/{file}", verbose = False)
+  
+  return manifest
+
+
+
+#-----------------------------------------------------
+#
+#  Record Cached Files in Manifest
+#
+#-----------------------------------------------------
+def cache_manifest_entry(cache_root, rel_path):
   """
-  Check for repeated list contents:
-  Code contributed by Sandeep_anand, somewhere on stack overflow
+  Build the manifest record for one cached daily file
   
   Args:
-    x: list
+    cache_root (str): Path to Box/RES_Data/OISST/oisst_mainstays/ from ot.set_cache_root()
+    rel_path (str): Path of the file relative to update_caches/, e.g. "03/oisst-avhrr-v02r01.20210301.nc"
+  
+  """
+  full_path = f"{cache_root}update_caches/{rel_path}"
+  date_id, status = parse_oisst_fname(rel_path)
+  return {"status"   : status,
+          "path"     : rel_path,
+          "size"     : os.path.getsize(full_path),
+          "checksum" : file_checksum(full_path)}
+
+
+def record_cache_file(manifest, cache_root, file_path, verbose = True):
+  """
+  Add a newly downloaded daily file to the manifest. When final data arrives
+  for a date with a preliminary file, the preliminary file is removed from the
+  cache. A preliminary file arriving for a date that is already final is removed
+  instead.
+  
+  Args:
+    manifest (dict): Manifest from ot.load_cache_manifest(), updated in place
+    cache_root (str): Path to Box/RES_Data/OISST/oisst_mainstays/ from ot.set_cache_root()
+    file_path (str): Full path to the downloaded file
+    verbose : True or False to print progress
+  
+  Returns:
+    Path of the file removed from the cache, or None
   
   """
-  _size = len(x) 
-  repeated = [] 
-  for i in range(_size): 
-      k = i + 1
-      for j in range(k, _size): 
-          if x[i] == x[j] and x[i] not in repeated: 
-              repeated.append(x[i]) 
-  return repeated 
+  update_root = f"{cache_root}update_caches/"
+  rel_path = os.path.relpath(file_path, update_root).replace(os.sep, "/")
+  date_id, status = parse_oisst_fname(rel_path)
+  old_entry = manifest.get(date_id)
+  
+  # Don't downgrade final data to preliminary
+  if old_entry is not None and old_entry["status"] == "final" and status == "preliminary":
+    os.remove(file_path)
+    return file_path
+  
+  # Record the new file
+  manifest[date_id] = cache_manifest_entry(cache_root, rel_path)
+  
+  # Drop the file it replaces
+  if old_entry is not None and old_entry["path"] != rel_path:
+    old_file = f"{update_root}{old_entry['path']}"
+    if os.path.exists(old_file):
+      os.remove(old_file)
+    if verbose == True:
+      print(f"File Removed for Finalized Data: {old_file}")
+    return old_file
+  
+  return None
 
 
 
@@ -139,7 +566,7 @@ def Repeat(x):
 #  Cache Daily Files for Updating Month of OISST
 #
 #-----------------------------------------------------
-def cache_oisst(cache_month, update_yr, workspace = "local", verbose = True):
+def cache_oisst(cache_month, update_yr, workspace = "local", verbose = True, max_workers = 4):
     """
     Download OISSTv2 Daily Updates using Beautiful Soup
 
@@ -148,6 +575,7 @@ def cache_oisst(cache_month, update_yr, workspace = "local", verbose = True):
         update_yr (str): Year directory for month
         workspace (str): String indicating whether to build local paths or docker paths
         verbose : True or False to print progress
+        max_workers (int): Number of concurrent downloads to run against NCEI
         
 
     """
@@ -182,143 +610,33 @@ def cache_oisst(cache_month, update_yr, workspace = "local", verbose = True):
     fetch_url = f"https://www.ncei.noaa.gov/data/sea-surface-temperature-optimum-interpolation/v2.1/access/avhrr/{update_yr}{this_month}/"
   
   
-    ####  Open the http directory listing
-    req = requests.get(fetch_url)
-  
-    # Print error message if link does not work
-    if req.status_code != requests.codes.ok:
-        print(f"Request Error, Reason: {req.reason}")
-    
-    ####   Parse with BS4
-    
-    # Parse the url with BS and its html parser.
-    soup = BeautifulSoup(req.text, 'html.parser')
-
-    # Find all href anchors in the html text
-    anchors = soup.find_all("a")
-    
-    
-    ####  Downloading The Current Month
-  
-    # list to store download paths
-    new_downloads = []
-  
-    # Find all the links in fetch_url which end with ".nc"
-    for link in anchors:
-        
-        # Find links that match update year
-        if link.get('href').endswith(f'.nc'):
-            
-            # Get the link(s) that match
-            href = link.get('href')
-            
-            # Use requests to build download paths
-            req_link = fetch_url + href
-            req = requests.get(fetch_url + href)
-            if req.raise_for_status():
-                exit()
-            
-            # Open link
-            dl_path = f"{month_cache}{href}"
-            file = open(dl_path, 'wb')
-            chunk_size = 17000000
-            
-            # Add to log
-            new_downloads.append(dl_path)
-            
-            # Process in chunks to save daily files
-            for chunk in req.iter_content(chunk_size):
-                file.write(chunk)
-            file.close()
-            
-            # Download Progress Text
-            if verbose == True:
-                print(f"Caching Daily NETCDF File: {href}")
-    
-    
-    ####  Review Cache Files
-    
-    # list for files that have preliminary data suffix
-    prelim_dates = []
-    
-    # Check cache for preliminary data
-    for cache_file in os.listdir(month_cache):
-        if cache_file.endswith("_preliminary.nc"): 
-          
-            # locate date text by its position relative to update yr/month in file
-            start_idx = cache_file.find(f"{update_yr}{this_month}")
-            end_idx = start_idx + 8
-            step = int(1)
-            date_id = cache_file[start_idx: end_idx: step]
-            prelim_dates.append(date_id)
-            
-            # Report what files are preliminary data
-            if verbose == True:
-                print(f"Current month preliminary data found for: {date_id}")
-            
+    ####  Download new or changed daily files
     
+    # Days already final in the manifest are not fetched again as preliminary
+    manifest = load_cache_manifest(_cache_root)
+    final_dates = [date_id for date_id, cache_entry in manifest.items() if cache_entry["status"] == "final"]
     
-    # # Code from stackoverflow to check for repeated values:
-    # # Program to check for repeated list contents
-    # # This code was contributed by Sandeep_anand , origins unknown
-    # def Repeat(x): 
-    #     _size = len(x) 
-    #     repeated = [] 
-    #     for i in range(_size): 
-    #         k = i + 1
-    #         for j in range(k, _size): 
-    #             if x[i] == x[j] and x[i] not in repeated: 
-    #                 repeated.append(x[i]) 
-    #     return repeated 
+    # Skips files already in the cache that match the server copy
+    new_downloads = download_month_files(fetch_url = fetch_url, 
+                                         month_cache = month_cache, 
+                                         max_workers = max_workers, 
+                                         verbose = verbose,
+                                         final_dates = final_dates)
     
     
-    ####  Check among the cache for files that were preliminary but have been finalized
+    ####  Update the Cache Manifest
     
-    # list of finalized dates, dates where we can ignore the preliminary data
-    finalized_dates = []
+    # Record new files, preliminary files replaced by final data are removed here
+    for dl_path in new_downloads:
+        record_cache_file(manifest, _cache_root, dl_path, verbose = verbose)
+    save_cache_manifest(_cache_root, manifest)
     
-    # check all download links for this month
-    for link in os.listdir(month_cache):
-        
-        # check each preliminary data date
-        for prelim_date in prelim_dates:
-            
-            # If the date for the link matches dates with preliminary data for a link, flag the date
-            if prelim_date in link:
-                start_idx = link.find(f"{update_yr}{this_month}")
-                end_idx = start_idx + 8
-                step = int(1)
-                date_id = link[start_idx: end_idx: step]
-                
-                # and add those to the list of dates where there is prelim and final data
-                finalized_dates.append(date_id)
-                
-        
-    # Report the dates with both preliminary and finalized data  
+    # Report what files are preliminary data
     if verbose == True:
-        print("Prelim and Finalized Data Found for:")
-        print (Repeat(finalized_dates))    
-      
-      
-    ####  Remove Preliminary data that is no longer needed
-    # Pull out the dates for situations where there is both a preliminary and final file.
-    remove_prelim = Repeat(finalized_dates)
-    
+        for date_id in sorted(manifest):
+            if date_id.startswith(f"{update_yr}{this_month}") and manifest[date_id]["status"] == "preliminary":
+                print(f"Current month preliminary data found for: {date_id}")
     
-    # Build out the preliminary names that these would be, drop them from cache.
-    for repeated_date in remove_prelim:
-        
-        # Build full file name
-        file_name = f"{month_cache}oisst-avhrr-v02r01.{repeated_date}_preliminary.nc"
-        
-        # Print the ones we removed    
-        if verbose == True:
-            print(f"File Removed for Finalized Data: {file_name}")
-        
-        # Remove them from the folder. Don't need them anymore.
-        if os.path.exists(file_name):
-            os.remove(file_name)
-            
     
     
     # End Function
@@ -332,17 +650,20 @@ def cache_oisst(cache_month, update_yr, workspace = "local", verbose = True):
 #  Build Annual File from Month Caches
 #
 #-----------------------------------------------------
-def build_annual_from_cache(last_month, this_month, workspace = "local", verbose = True):
+def build_annual_from_cache(last_month, this_month, workspace = "local", verbose = True, update_yr = None):
     """
     Assemble OISSTv2 Annual File Using Monthly Caches:
       
     Should be run after the current and last month have had their caches updated.
+    Only days of update_yr are used, the month folders also hold days cached for 
+    other years.
 
     Args:
         last_month (str): Previous Month's data to assemble from cache
         this_month (str): Previous Month's data to assemble from cache
         workspace (str): String indicating whether to build local paths or docker paths
         verbose : True or False to print progress
+        update_yr (int): Year to assemble, defaults to the year of this_month from ot.check_update_yr()
         
 
     """
@@ -353,15 +674,11 @@ def build_annual_from_cache(last_month, this_month, workspace = "local", verbose
     last_month = str(last_month).rjust(2, "0")
     this_month = str(this_month).rjust(2, "0")
     
-    # Root paths
-    root_locations = {"local"  : "/Users/akemberling/Box/",
-                      "docker" : "/home/jovyan/"}
-  
     # Set root with workspace
-    box_root = root_locations[workspace]
+    box_root = set_workspace(workspace)
     
     # Global cache root
-    _cache_root = f"{box_root}RES_Data/OISST/oisst_mainstays/"
+    _cache_root = set_cache_root(box_root)
     
     # Cache Subdirectory Locations
     cache_locs = {
@@ -382,11 +699,17 @@ def build_annual_from_cache(last_month, this_month, workspace = "local", verbose
     daily_files = []
     
     # Option 1 :  Using any month prior to build dataset from caches only
+    # One file per day of the update year, looked up from the cache manifest
+    if update_yr is None:
+      update_yr = check_update_yr(for_this_month = True)
     month_folders = ["%.2d" % i for i in range(1, int(this_month) + 1)]
-    for folder in month_folders:
-      for file in os.listdir(f"{_cache_root}update_caches/{folder}"):
-        if file.endswith(".nc"):
-          daily_files.append(f"{_cache_root}update_caches/{folder}/{file}")
+    manifest = load_cache_manifest(_cache_root)
+    for date_id in sorted(manifest):
+      cache_entry = manifest[date_id]
+      if date_id[0:4] == str(update_yr) and date_id[4:6] in month_folders:
+        daily_files.append(f"{_cache_root}update_caches/{cache_entry['path']}")
+    if len(daily_files) == 0:
+      raise ValueError(f"No cached daily files for {update_yr} through month {this_month}")
     
     # Use open_mfdataset to access all the new downloads as one file
     oisst_update = xr.open_mfdataset(daily_files, combine = "by_coords")     
@@ -463,583 +786,4694 @@ def export_annual_update(cache_root, update_yr, oisst_update):
   out_folder       = f"{cache_root}annual_observations/"
   naming_structure = f"sst.day.mean.{update_yr}.v2.nc"
   out_path         = f"{out_folder}{naming_structure}"
+  os.makedirs(out_folder, exist_ok = True)
   
   # Set the Time encodings
   oisst_update.time.encoding = {"units" : "days since '1800-01-01'"}
   
-  # Save File to Output Path
-  oisst_update.to_netcdf(path = out_path)
+  # Save File to Output Path, unlimited time lets ot.update_annual_file() append days
+  oisst_update.to_netcdf(path = out_path, unlimited_dims = ["time"])
   print(f"File Saved to {out_path}")
   
   
   
-########################################################
-#########  Begin Anomaly Processing Section  ###########
-########################################################
-  
-  
-  
-  
 #-----------------------------------------------------
 #
-# Load OISST from Box
+# Incremental Update of OISST Annual File
 #
 #-----------------------------------------------------
-def load_box_oisst(box_root, start_yr, end_yr, anomalies = False, do_parallel = False):
+def update_annual_file(last_month, this_month, update_yr, workspace = "local", write_zarr = False, verbose = True):
   """
-  Load OISST Resources from box using xr.open_mfdataset()
+  Update sst.day.mean.YYYY.v2.nc in place from the month caches, writing only
+  the days that are new or have changed since they were last written (e.g. 
+  preliminary days that have been finalized). New days are appended along the
+  unlimited time dimension, changed days are overwritten in place, one daily 
+  slice at a time.
   
-  Shorthand to reduce copying this code everywhere.
-  """
+  Days are tracked with the "annual_checksum" field of the cache manifest. If the
+  annual file does not exist yet, has a fixed-length time dimension, or a new day 
+  would land before the end of the file, the full year is rebuilt with 
+  ot.build_annual_from_cache() and ot.export_annual_update() instead.
   
+  With write_zarr the year is also synced into the observation map Zarr store with 
+  ot.update_zarr_store() once the annual file is written.
   
-  # Set location to OISST data & base file name
-  if anomalies == False:
-    oisst_location  = f"{box_root}RES_Data/OISST/oisst_mainstays/annual_observations/"
-    base_fname      = "sst.day.mean."
-    file_ending     = ".v2.nc"
+  Args:
+    last_month (str): Previous month, passed through to ot.build_annual_from_cache() for full rebuilds
+    this_month (str): Most recent month to include from the caches
+    update_yr (int): Year of the annual file to update
+    workspace (str): String indicating whether to build local paths or docker paths
+    write_zarr (bool): True to sync the updated year into the Zarr stores
+    verbose : True or False to print progress
   
-  elif anomalies == True:
-    oisst_location = f"{box_root}RES_Data/OISST/oisst_mainstays/annual_anomalies/1982to2011_climatology/"
-    base_fname     = "daily_anoms_"
-    file_ending    = ".nc"
+  """
+  # Paths
+  this_month  = str(this_month).rjust(2, "0")
+  box_root    = set_workspace(workspace)
+  cache_root  = set_cache_root(box_root)
+  update_root = f"{cache_root}update_caches/"
+  out_path    = f"{cache_root}annual_observations/sst.day.mean.{update_yr}.v2.nc"
   
+  # Days in the caches for this year, and the ones that need writing
+  manifest    = load_cache_manifest(cache_root)
+  year_dates  = [date_id for date_id in sorted(manifest) 
+                 if date_id[0:4] == str(update_yr) and date_id[4:6] <= this_month]
+  stale_dates = [date_id for date_id in year_dates 
+                 if manifest[date_id].get("annual_checksum") != manifest[date_id]["checksum"]]
   
-  # Set start and end years for the update
-  start_yr = int(start_yr)
-  end_yr   = int(end_yr)
+  if len(stale_dates) == 0:
+    if verbose == True:
+      print(f"Annual file for {update_yr} already up to date.")
+    return out_path
   
-  # Load the annual files for oisst
-  fpaths = []
-  for yr in range(start_yr, end_yr + 1):
-      fpaths.append(f'{oisst_location}{base_fname}{yr}{file_ending}')
+  
+  ####  Decide whether the file can be updated in place
+  
+  rebuild = not os.path.exists(out_path)
+  if not rebuild:
+    with netCDF4.Dataset(out_path, mode = "r") as annual_nc:
+      time_var   = annual_nc.variables["time"]
+      time_units = time_var.units.replace("'", "")
+      calendar   = getattr(time_var, "calendar", "standard")
       
-  # Lazy-load using xr.open_mfdataset
-  grid_obj = xr.open_mfdataset(fpaths, combine = "by_coords", parallel = do_parallel)
+      # Existing days, as YYYYMMDD
+      written = netCDF4.num2date(time_var[:], time_units, calendar)
+      written = {f"{d.year:04d}{d.month:02d}{d.day:02d}" : i for i, d in enumerate(written)}
+      
+      # Appending needs an unlimited time dimension and days after the last one written
+      last_written = max(written) if len(written) > 0 else ""
+      new_dates = [date_id for date_id in stale_dates if date_id not in written]
+      if not annual_nc.dimensions["time"].isunlimited() or any(d < last_written for d in new_dates):
+        rebuild = True
   
-  return grid_obj
-
-
-
-
-#-----------------------------------------------------
-#
-# Load OISST Climatologies
-#
-#-----------------------------------------------------
-def load_oisst_climatology(box_root, reference_period = "1982-2011"):
-  """
-  Load climatology NetCDF from box 
   
-  Args:
-    box_root (str): Base location to box from either local path or docker volume
-    reference_period (str): start and end year of climatology linked by "-", e.g. "1982-2011"
+  ####  Full rebuild
   
-  """
+  if rebuild:
+    if verbose == True:
+      print(f"Rebuilding annual file for {update_yr} from caches.")
+    oisst_update = build_annual_from_cache(last_month = last_month, 
+                                           this_month = this_month, 
+                                           workspace = workspace, 
+                                           verbose = verbose, 
+                                           update_yr = update_yr)
+    export_annual_update(cache_root, update_yr, oisst_update)
+    for date_id in year_dates:
+      manifest[date_id]["annual_checksum"] = manifest[date_id]["checksum"]
+    save_cache_manifest(cache_root, manifest)
+    if write_zarr == True:
+      update_zarr_store(box_root, update_yr, verbose = verbose)
+    return out_path
   
-  # Set climatology source choices
-  climatologies = {"1982-2011" : "daily_clims_1982to2011.nc",
-                   "1985-2014" : "daily_clims_1985to2014.nc",
-                   "1991-2020" : "daily_clims_1991to2020.nc"}
-
-  # Build file name
-  clim_root = f"{box_root}RES_Data/OISST/oisst_mainstays/daily_climatologies/"
-  climate_period = climatologies[reference_period]
-  clim_file = f"{clim_root}{climate_period}"
   
-  # Open and return climatology
-  oisst_clim = xr.open_dataset(clim_file)
-  return oisst_clim
-
+  ####  Write only the stale days
   
-
-
-#-----------------------------------------------------
-#
-#  Add Modified Ordinal Day
-#
-#-----------------------------------------------------
-def add_mod(grid_obj, time_dim, out_coord = "modified_ordinal_day"):
-    """
-    Add modified ordinal day to xarray dataset as new coordinate dimension
-
-    Args:
-        grid_obj : xarray object to add the new coordinate dimension
-        time_dim (str) : Time coordinate dimension to pull day of year from
-        out_coord (str) : 
-
-    """
-    # Flag days that are not in leap years
-    not_leap_year        = ~grid_obj.indexes[time_dim].is_leap_year
-    
-    # Flag days in the year that are march or later
-    march_or_later       = grid_obj[time_dim].dt.month >= 3
-    
-    # Pull day of year
-    ordinal_day          = grid_obj[time_dim].dt.dayofyear
-    
-    # Bump day of year if after march and a leap year
-    modified_ordinal_day = ordinal_day + (not_leap_year & march_or_later)
-    
-    # Add MOD as a variable
-    grid_obj = grid_obj.assign(modified_ordinal_day = modified_ordinal_day)
-    
-    # Add as coordinate as well
-    grid_obj = grid_obj.assign_coords(MOD = modified_ordinal_day)
-    
-    # return the grid with new var/coordinates
-    return grid_obj
-    
-#-----------------------------------------------------
-#   
-# Calculate Anomalies from Observed SST and Climatology  
-# 
-#-----------------------------------------------------
-def calc_anom(daily_sst, daily_clims):
-    """
-    Return Anomaly for Matching Modified Ordinal Day (day of year 1-366 adjusted for leap-years)
-    
-    daily_sst : xarray data array of sea surface temperatures containing "MOD" coordinate to pair with daily_clims
-    daily_clim : xarray data array of sea surface temperature climatologic means.
-    
-    """
+  try:
+    with netCDF4.Dataset(out_path, mode = "a") as annual_nc:
+      time_var = annual_nc.variables["time"]
+      sst_var  = annual_nc.variables["sst"]
+      for date_id in stale_dates:
+        cache_entry = manifest[date_id]
+        
+        # One daily slice, drop zlev
+        with xr.open_dataset(f"{update_root}{cache_entry['path']}") as daily_ds:
+          daily_sst  = daily_ds["sst"][0, 0, :, :].values
+          daily_time = pd.Timestamp(daily_ds["time"].values[0]).to_pydatetime()
+        
+        # Overwrite existing day or add to the end
+        if date_id in written:
+          time_idx = written[date_id]
+          action   = "Overwriting"
+        else:
+          time_idx = len(time_var)
+          time_var[time_idx] = netCDF4.date2num(daily_time, time_units, calendar)
+          written[date_id] = time_idx
+          action = "Appending"
+        sst_var[time_idx, :, :] = np.ma.masked_array(np.nan_to_num(daily_sst), mask = np.isnan(daily_sst))
+        
+        # Mark the day as written
+        cache_entry["annual_checksum"] = cache_entry["checksum"]
+        if verbose == True:
+          print(f"{action} {cache_entry['status']} data for {date_id}")
+  finally:
+    save_cache_manifest(cache_root, manifest)
+  
+  print(f"File Updated at {out_path}")
+  if write_zarr == True:
+    update_zarr_store(box_root, update_yr, date_ids = stale_dates, verbose = verbose)
+  return out_path
   
-    return daily_sst - daily_clims.sel(modified_ordinal_day = daily_sst["MOD"])
   
   
+########################################################
+#########  Begin Anomaly Processing Section  ###########
+########################################################
   
   
-#------------------------------------------------------
+  
+  
+#-----------------------------------------------------
 #
-# Apply OISST Attributes
+# Load Profiles for load_box_oisst
 #
-#------------------------------------------------------
-def apply_oisst_attributes(oisst_grid, anomalies = False, reference_period = "1982-2011"):
+#-----------------------------------------------------
+def get_load_profile(profile):
   """
-  Attach appropriate NetCDF attributes to OISST observations or Anomalies
+  Chunks and variables to keep for a named access pattern of ot.load_box_oisst().
+  Chunks are per annual file and no larger than dask's default 128MiB target. Sizes
+  below are for a 366 day year of float32 sst on the 720 x 1440 grid.
   
   Args:
-    oisst_grid : xr.Dataset to apply attributes to
-    anomalies (bool): False to apply OISSTv2 attributes, True for anomaly specs
-    reference_period (str): Optional string to apply for anomaly reference period, default 1982-2011
+    profile (str): One of
+      "map" : whole grid for a month of days (~129MB), for maps and spatial means of a day
+      "timeseries" : whole year for 120 x 120 cell tiles (~21MB), for point and gridded timeseries
+      "region" : whole year for 60 x 60 cell tiles (~5MB), for regional timeseries of a bounding box
+      "full" : whole year for quarter-globe tiles (~95MB), for climatologies and full record reductions
+  
   """
-  # Attributes for Anomalies
-  anom_attrs = {
-    'title'         : f'Sea surface temperature anomalies from NOAA OISSTv2 SST Data using {reference_period} Climatology',
-    'institution'   : 'Gulf of Maine Research Institute',
-    'source'        : 'NOAA/NCDC  ftp://eclipse.ncdc.noaa.gov/pub/OI-daily-v2/',
-    'comment'       : 'Climatology used represents mean SST for the years 1982-2011',
-    'history'       : 'Anomalies calculated 3/9/2021',
-    'references'    : 'https://www.esrl.noaa.gov/psd/data/gridded/data.noaa.oisst.v2.highres.html',
-    'dataset_title' : 'Sea Surface Temperature Anomalies - OISSTv2',
+  profiles = {
+    "map"        : {"chunks" : {"time" : 31, "lat" : -1, "lon" : -1}},
+    "timeseries" : {"chunks" : {"time" : -1, "lat" : 120, "lon" : 120}},
+    "region"     : {"chunks" : {"time" : -1, "lat" : 60, "lon" : 60}},
+    "full"       : {"chunks" : {"time" : -1, "lat" : 180, "lon" : 360}}
+  }
+  if profile not in profiles:
+    raise ValueError(f"Unknown load profile: {profile}, use one of {list(profiles.keys())}")
+  load_profile = profiles[profile]
+  load_profile["var_names"] = ["sst"]
+  return load_profile
 
 
-  }
+def keep_load_vars(ds, var_names):
+  """
+  Preprocess hook for xr.open_mfdataset(), drops every data variable not in var_names 
+  (e.g. time_bnds) before the files are combined.
   
-  # Attributes for Observed SST
-  obs_attrs = {
-    "Conventions"   : "CF-1.5",
-    "title"         : "NOAA/NCEI 1/4 Degree Daily Optimum Interpolation Sea Surface Temperature (OISST) Analysis, Version 2.1",
-    "institution"   : "NOAA/National Centers for Environmental Information",
-    "source"        : "NOAA/NCEI https://www.ncei.noaa.gov/data/sea-surface-temperature-optimum-interpolation/v2.1/access/avhrr/",
-    "References"    : "https://www.psl.noaa.gov/data/gridded/data.noaa.oisst.v2.highres.html",
-    "dataset_title" : "NOAA Daily Optimum Interpolation Sea Surface Temperature",
-    "version"       : "Version 2.1",
-    "comment"       : "Reynolds, et al.(2007) Daily High-Resolution-Blended Analyses for Sea Surface Temperature (available at https://doi.org/10.1175/2007JCLI1824.1). Banzon, et al.(2016) A long-term record of blended satellite and in situ sea-surface temperature for climate monitoring, modeling and environmental studies (available at https://doi.org/10.5194/essd-8-165-2016). Huang et al. (2020) Improvements of the Daily Optimum Interpolation Sea Surface Temperature (DOISST) Version v02r01, submitted.Climatology is based on 1971-2000 OI.v2 SST. Satellite data: Pathfinder AVHRR SST and Navy AVHRR SST. Ice data: NCEP Ice and GSFC Ice. Data less than 15 days old may be subject to revision."
-    
-  }
+  Args:
+    ds (xr.Dataset): One annual file
+    var_names : Data variables to keep
   
+  """
+  return ds[[var_name for var_name in var_names if var_name in ds.data_vars]]
+
+
+def subset_oisst(grid_obj, lon_range = None, lat_range = None, date_range = None, var_names = None):
+  """
+  Narrow OISST to a bounding box, date range and variables without reading any data.
+  Used as the preprocess hook of ot.load_box_oisst() so each file is cut down before 
+  the files are combined.
   
-  # Toggle which to use
-  if anomalies == True:
-    attr_dict = anom_attrs
-  elif anomalies == False:
-    attr_dict = obs_attrs
+  Longitudes can be given as 0 to 360 or -180 to 180, they are wrapped onto the 
+  grid's convention. A box that crosses the grid's longitude edge, e.g. (-10, 10) on 
+  the 0 to 360 OISST grid, comes back with continuous longitudes in the other convention.
   
-  # Apply them
-  oisst_grid.attrs = attr_dict
+  Args:
+    grid_obj : xr.Dataset with "time", "lat" and "lon" coordinates
+    lon_range : (west, east) longitudes, None for all
+    lat_range : (south, north) latitudes, None for all
+    date_range : (start, end) dates e.g. ("2010-01-01", "2010-06-30"), None for all
+    var_names : Data variables to keep, None for all
   
-  # Set the Time encodings
-  oisst_grid.time.encoding = {"units" : "days since '1800-01-01'"}
+  """
+  if var_names is not None:
+    grid_obj = keep_load_vars(grid_obj, var_names)
   
-  # Return the grid
-  return oisst_grid
+  if date_range is not None:
+    grid_obj = grid_obj.sel(time = slice(date_range[0], date_range[1]))
+  
+  if lat_range is not None:
+    lat = np.asarray(grid_obj["lat"].values, dtype = "float64")
+    lat_hits = np.flatnonzero((lat >= min(lat_range)) & (lat <= max(lat_range)))
+    if len(lat_hits) == 0:
+      raise ValueError(f"No latitudes in {lat_range}")
+    grid_obj = grid_obj.isel(lat = slice(int(lat_hits[0]), int(lat_hits[-1]) + 1))
+  
+  if lon_range is not None and (lon_range[1] - lon_range[0]) % 360 != 0:
+    lon = np.asarray(grid_obj["lon"].values, dtype = "float64")
+    
+    # Longitudes in the grid's convention
+    if lon.max() > 180:
+      wrap_lon  = lambda x: x % 360
+      flip_lon  = lambda x: ((x + 180) % 360) - 180
+    else:
+      wrap_lon  = lambda x: ((x + 180) % 360) - 180
+      flip_lon  = lambda x: x % 360
+    west, east = wrap_lon(lon_range[0]), wrap_lon(lon_range[1])
+    
+    if west <= east:
+      lon_hits = np.flatnonzero((lon >= west) & (lon <= east))
+      if len(lon_hits) == 0:
+        raise ValueError(f"No longitudes in {lon_range}")
+      grid_obj = grid_obj.isel(lon = slice(int(lon_hits[0]), int(lon_hits[-1]) + 1))
+    
+    # Across the edge, take both ends and relabel so longitudes increase
+    else:
+      lon_hits = np.concatenate([np.flatnonzero(lon >= west), np.flatnonzero(lon <= east)])
+      grid_obj = grid_obj.isel(lon = lon_hits)
+      grid_obj = grid_obj.assign_coords(lon = flip_lon(grid_obj["lon"]))
   
+  return grid_obj
+
+
 
 #-----------------------------------------------------
 #
-#  Get Log-Likelihood of Anomaly
+# Annual File Index
 #
 #-----------------------------------------------------
-def calc_ll(row, var_name, clim_mu, clim_sd):
+def get_load_index_path(box_root, anomalies = False, reference_period = "1982-2011"):
+  """
+  Path to the JSON index of the annual files ot.load_box_oisst() reads,
+  in oisst_mainstays/load_index/
   
-    """
-    Get Log-Likelihood of Event from Normal Distribution (mu, sigma) for use with assign()
-
-    Args:
-        row : Row of pandas dataframe
-        var name (str): String for column name indicating the values to be assessed for their likelihood
-        clim_mu (str): String for column name indicating mean of the distribution
-        clim_sd (str): String for column name indicating the standard deviation of the distribution
-        
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    anomalies (bool): True for the anomaly files, False for observations
+    reference_period (str): Climatology the anomalies use, e.g. "1982-2011"
+  
+  """
+  index_root = f"{box_root}RES_Data/OISST/oisst_mainstays/load_index/"
+  if anomalies == True:
+    climate_period = reference_period.replace("-", "to")
+    return f"{index_root}annual_anomalies_{climate_period}_index.json"
+  return f"{index_root}annual_observations_index.json"
 
-    """
-    # log likelihood of event from normal distribution.
-    n = 1
-    anom  = row[f"{var_name}"]
-    mu    = row[f"{clim_mu}"]
-    sigma = row[f"{clim_sd}"]
-    log_lik = n * math.log(2 * math.pi * (sigma ** 2)) / 2 + np.sum(((anom - mu) ** 2) / (2 * (sigma ** 2)))
-    return log_lik
 
+def load_file_index(box_root, fpaths, anomalies = False, reference_period = "1982-2011"):
+  """
+  Time span and grid size of each annual file, keyed by file name. Entries are 
+  read from the saved index and only files whose size or modification time changed 
+  since are opened again, so combining many years does not re-scan every file.
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    fpaths : Annual file paths
+    anomalies (bool): True for the anomaly files, False for observations
+    reference_period (str): Climatology the anomalies use, e.g. "1982-2011"
+  
+  """
+  index_path = get_load_index_path(box_root, anomalies = anomalies, reference_period = reference_period)
+  file_index = {}
+  if os.path.exists(index_path):
+    with open(index_path, "r") as f:
+      file_index = json.load(f)
+  
+  # Refresh stale entries from the time variable and grid dimensions only
+  changed = False
+  for fpath in fpaths:
+    fname = os.path.basename(fpath)
+    fstat = os.stat(fpath)
+    entry = file_index.get(fname, {})
+    if entry.get("size") == fstat.st_size and entry.get("mtime") == fstat.st_mtime:
+      continue
+    with netCDF4.Dataset(fpath, "r") as annual_nc:
+      time_var = annual_nc.variables["time"]
+      times = netCDF4.num2date(time_var[:], time_var.units, getattr(time_var, "calendar", "standard"))
+      file_index[fname] = {
+        "size"   : fstat.st_size,
+        "mtime"  : fstat.st_mtime,
+        "start"  : times[0].strftime("%Y-%m-%d") if len(times) > 0 else None,
+        "end"    : times[-1].strftime("%Y-%m-%d") if len(times) > 0 else None,
+        "n_time" : len(times),
+        "n_lat"  : len(annual_nc.dimensions["lat"]),
+        "n_lon"  : len(annual_nc.dimensions["lon"])}
+    changed = True
+  
+  if changed == True:
+    os.makedirs(os.path.dirname(index_path), exist_ok = True)
+    tmp_file = f"{index_path}.part"
+    with open(tmp_file, "w") as f:
+      json.dump(file_index, f, indent = 1, sort_keys = True)
+    os.replace(tmp_file, index_path)
+  
+  return {os.path.basename(fpath) : file_index[os.path.basename(fpath)] for fpath in fpaths}
 
 
 
+#-----------------------------------------------------
+#
+# Load OISST from Box
+#
+#-----------------------------------------------------
+def load_box_oisst(box_root, start_yr, end_yr, anomalies = False, do_parallel = False, backend = "netcdf", zarr_layout = "map", 
+                   profile = None, lon_range = None, lat_range = None, date_range = None, var_names = None, 
+                   reference_period = "1982-2011"):
+  """
+  Load OISST Resources from box using xr.open_mfdataset()
+  
+  Shorthand to reduce copying this code everywhere. With backend = "zarr" the 
+  years are read from the consolidated Zarr store instead, see ot.update_zarr_store().
+  Use zarr_layout = "timeseries" for point and regional timeseries, "map" for maps.
+  The timeseries store is only as current as its last ot.rechunk_zarr_store().
+  
+  With a profile ("map", "timeseries", "region" or "full", see ot.get_load_profile())
+  the files are opened with chunks for that access pattern, only sst is kept, and 
+  the years are stacked in the order of the saved file index without comparing 
+  coordinates between files. Without one the files are combined by coordinates as before.
+  
+  lon_range, lat_range, date_range and var_names are applied to each file as it is 
+  opened with ot.subset_oisst(), before anything is read, and only the years that 
+  overlap date_range are opened. e.g. the Gulf of Maine with lon_range = (-72, -62), 
+  lat_range = (40, 46).
+  
+  Anomalies are read for the climatology in reference_period, e.g. "1991-2020".
+  """
+  
+  # Years that overlap the date range
+  start_yr = int(start_yr)
+  end_yr   = int(end_yr)
+  if date_range is not None:
+    if pd.Timestamp(date_range[0]).year > end_yr or pd.Timestamp(date_range[1]).year < start_yr:
+      raise ValueError(f"No years between {start_yr} and {end_yr} overlap {date_range}")
+    start_yr = max(start_yr, pd.Timestamp(date_range[0]).year)
+    end_yr   = min(end_yr, pd.Timestamp(date_range[1]).year)
+  subset_kwargs = {"lon_range" : lon_range, "lat_range" : lat_range, "date_range" : date_range, "var_names" : var_names}
+  do_subset = any(subset_arg is not None for subset_arg in subset_kwargs.values())
+  
+  # Read from the Zarr store
+  if backend == "zarr":
+    store_path = get_zarr_store_path(box_root, layout = zarr_layout, anomalies = anomalies, reference_period = reference_period)
+    grid_obj   = xr.open_zarr(store_path, consolidated = True)
+    grid_obj   = grid_obj.sel(time = slice(f"{start_yr}-01-01", f"{end_yr}-12-31"))
+    if do_subset == True:
+      grid_obj = subset_oisst(grid_obj, **subset_kwargs)
+    return grid_obj
+  elif backend != "netcdf":
+    raise ValueError(f"Unknown backend: {backend}, use 'netcdf' or 'zarr'")
+  
+  # Load the annual files for oisst
+  fpaths = []
+  for yr in range(start_yr, end_yr + 1):
+      fpaths.append(get_annual_path(box_root, yr, anomalies = anomalies, reference_period = reference_period))
+      
+  # Lazy-load using xr.open_mfdataset
+  if profile is None:
+    if do_subset == True:
+      grid_obj = xr.open_mfdataset(fpaths, combine = "by_coords", parallel = do_parallel, 
+                                   preprocess = functools.partial(subset_oisst, **subset_kwargs))
+    else:
+      grid_obj = xr.open_mfdataset(fpaths, combine = "by_coords", parallel = do_parallel)
+    return grid_obj
+  
+  # Order files from the index, they all share one grid so nothing else needs checking
+  load_profile = get_load_profile(profile)
+  if var_names is not None:
+    load_profile["var_names"] = list(var_names)
+  file_index   = load_file_index(box_root, fpaths, anomalies = anomalies, reference_period = reference_period)
+  fpaths = sorted([fpath for fpath in fpaths if file_index[os.path.basename(fpath)]["n_time"] > 0], 
+                  key = lambda fpath: file_index[os.path.basename(fpath)]["start"])
+  if date_range is not None:
+    start_date = pd.Timestamp(date_range[0]).strftime("%Y-%m-%d")
+    end_date   = pd.Timestamp(date_range[1]).strftime("%Y-%m-%d")
+    fpaths = [fpath for fpath in fpaths 
+              if file_index[os.path.basename(fpath)]["start"] <= end_date and file_index[os.path.basename(fpath)]["end"] >= start_date]
+    if len(fpaths) == 0:
+      raise ValueError(f"No annual files overlap {date_range}")
+  grid_sizes = set((entry["n_lat"], entry["n_lon"]) for entry in file_index.values())
+  if len(grid_sizes) > 1:
+    raise ValueError(f"Annual files are on different grids: {sorted(grid_sizes)}")
+  
+  grid_obj = xr.open_mfdataset(fpaths, combine = "nested", concat_dim = "time", 
+                               chunks = load_profile["chunks"], 
+                               data_vars = "minimal", coords = "minimal", 
+                               compat = "override", join = "override", 
+                               preprocess = functools.partial(subset_oisst, **dict(subset_kwargs, var_names = load_profile["var_names"])),
+                               parallel = do_parallel)
+  
+  return grid_obj
 
 
 
 
+#-----------------------------------------------------
+#
+# Load OISST Climatologies
+#
+#-----------------------------------------------------
+def load_oisst_climatology(box_root, reference_period = "1982-2011"):
+  """
+  Load climatology NetCDF from box 
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    reference_period (str): start and end year of climatology linked by "-", e.g. "1982-2011".
+      Any period built with ot.build_oisst_climatology() can be loaded.
+  
+  """
+  
+  # Build file name, e.g. "1982-2011" -> daily_clims_1982to2011.nc
+  clim_root = f"{box_root}RES_Data/OISST/oisst_mainstays/daily_climatologies/"
+  climate_period = reference_period.replace("-", "to")
+  clim_file = f"{clim_root}daily_clims_{climate_period}.nc"
+  
+  # Open and return climatology
+  oisst_clim = xr.open_dataset(clim_file)
+  return oisst_clim
 
+  
 
 
+#-----------------------------------------------------
+#
+# Modified Ordinal Day Values for a Time Index
+#
+#-----------------------------------------------------
+def get_mod_values(time_index):
+  """
+  Return modified ordinal day (1-366) as a numpy array for a pd.DatetimeIndex,
+  same leap-year adjustment as ot.add_mod()
+  
+  Args:
+    time_index : pd.DatetimeIndex, e.g. grid_obj.indexes["time"]
+  
+  """
+  not_leap_year  = ~time_index.is_leap_year
+  march_or_later = time_index.month >= 3
+  return np.asarray(time_index.dayofyear + (not_leap_year & march_or_later))
 
 
 
-#---------------------------------------------------
+#-----------------------------------------------------
 #
-# Masked Timseries from xr.Dataset
+# Climatology Accumulator State
 #
-#----------------------------------------------------
-def calc_ts_mask(grid_obj, shp_obj, shp_name, var_name = "sst", climatology = False):
+#-----------------------------------------------------
+def new_clim_state(lat, lon, var_name = "sst", ocean_cells = None):
   """
-  Return a timeseries using data that falls within shapefile. 
+  Empty per-MOD accumulator state for building a climatology one year at a time.
   
-  Standard deviation
-  not included so that this function can be used for any period of time.
+  The state holds Welford accumulators for every modified ordinal day and ocean cell:
+  n_obs (count), {var_name}_mean (running mean), and {var_name}_m2 (sum of squared 
+  deviations from the mean). The sum and sum of squares are n * mean and 
+  m2 + n * mean^2. Cells are packed on a "cell" dimension of flat lat/lon indices, 
+  land is never stored, and the grid is kept as the lat and lon coordinates.
   
   Args:
-    grid_obj       : xr.Dataset of the desired input data to mask
-    shp_obj        : shapefile polygon to use as a mask
-    shp_name (str) : String to use as name when making mask
-    var_name (str) : Optional string identifying the variable to use
-    climatology (bool): Whether you are masking a cliimatology, informs naming conventions and
-    whether to process standard deviation
+    lat : Latitude coordinate of the grid
+    lon : Longitude coordinate of the grid
+    var_name (str): Variable the climatology is built for
+    ocean_cells : Flat cell indices from ot.get_ocean_cells(), None for every cell
+  
   """
+  if ocean_cells is None:
+    ocean_cells = np.arange(len(lat) * len(lon))
+  mods  = np.arange(1, 367)
+  shape = (len(mods), len(ocean_cells))
+  dims  = ("modified_ordinal_day", "cell")
+  clim_state = xr.Dataset(
+    {"n_obs"             : (dims, np.zeros(shape, dtype = "int16")),
+     f"{var_name}_mean"  : (dims, np.zeros(shape, dtype = "float64")),
+     f"{var_name}_m2"    : (dims, np.zeros(shape, dtype = "float64"))},
+    coords = {"modified_ordinal_day" : mods, "cell" : np.asarray(ocean_cells, dtype = "int64"), "lat" : lat, "lon" : lon})
+  clim_state.attrs["years"] = ""
+  return clim_state
 
-  #### 1. Make the mask
-  area_mask = regionmask.Regions(shp_obj.geometry,
-                                 name = shp_name)
-
-  #### 2. Mask the array with gom_mask to get nan test
-  mask = area_mask.mask(grid_obj, lon_name = "lon", lat_name = "lat")
 
+def update_clim_state(clim_state, year_obs, var_name = "sst", time_chunk = 31, remove = False):
+  """
+  Add one year of observations to a climatology accumulator state, in place.
+  Every MOD appears at most once in a year, so each time chunk is one 
+  vectorized Welford update of the matching MOD slices. Missing values 
+  (land, sea ice) are skipped cell by cell.
   
-  #### 3. Extract data that falls within the mask
-  masked_ds = grid_obj.where(~np.isnan(mask))
-
+  With remove = True the year is taken back out of the state with the inverse
+  Welford update, so a reference period can be moved forward by adding the new
+  year and removing the dropped one.
   
-  #### 4. Calculate timeseries mean
-
-  # Get the timeseries mean of the desired variable
-  if climatology == False:
-    masked_ts = getattr(masked_ds, var_name).mean(dim = ("lat", "lon"))
-    
-  elif climatology == True:
-    masked_ts = getattr(masked_ds, var_name).mean(dim = ("lat", "lon"))
-    masked_ts["clim_sd"] = getattr(masked_ds, var_name).std(dim = ("lat", "lon"))
-
+  Only the cells of the state are read from each time chunk.
   
-  #### 5. Change time index rownames to a column 
-
-  # Convert to Timeseries Dataframe
-  masked_ts_df = masked_ts.to_dataframe()
-
-  # Reset the index, rename variables
-  if climatology == False:
-    masked_ts_df = masked_ts_df.reset_index()[["time", var_name]]
+  Args:
+    clim_state : xr.Dataset from ot.new_clim_state() or ot.load_clim_state()
+    year_obs : xr.Dataset with one year of daily observations
+    var_name (str): Variable to accumulate
+    time_chunk (int): Number of days to read into memory at once
+    remove (bool): True to remove the year from the state instead of adding it
+  
+  """
+  # State arrays are (MOD, cell), updated in place
+  n_obs = clim_state["n_obs"].values
+  mean  = clim_state[f"{var_name}_mean"].values
+  m2    = clim_state[f"{var_name}_m2"].values
+  ocean_cells = clim_state["cell"].values
+  mod_idx = get_mod_values(year_obs.indexes["time"]) - 1
+  
+  # Keep track of the years in the state
+  obs_yr = int(year_obs.indexes["time"].year[0])
+  state_yrs = [int(yr) for yr in clim_state.attrs["years"].split()]
+  if remove == True and obs_yr not in state_yrs:
+    raise ValueError(f"{obs_yr} is not part of the climatology state")
+  if remove == False and obs_yr in state_yrs:
+    raise ValueError(f"{obs_yr} is already part of the climatology state")
+  
+  for start in range(0, len(mod_idx), time_chunk):
+    idx  = (mod_idx[start : start + time_chunk], slice(None))
+    obs  = pack_cells(year_obs[var_name][start : start + time_chunk].values, ocean_cells).astype("float64")
+    valid = np.isfinite(obs)
+    obs   = np.where(valid, obs, 0)
     
-  elif climatology == True:
-    clim_name = clim_name = f"{var_name}_clim"
-    masked_ts_df = masked_ts_df.reset_index()[["modified_ordinal_day", var_name, "clim_sd"]]
-    masked_ts_df = masked_ts_df.rename(columns = {f"{var_name}" : f"{clim_name}"})
+    if remove == False:
+      # Welford update for the valid cells
+      n_new    = n_obs[idx] + valid
+      delta    = np.where(valid, obs - mean[idx], 0)
+      mean_new = mean[idx] + np.where(valid, delta / np.maximum(n_new, 1), 0)
+      m2_new   = m2[idx] + delta * np.where(valid, obs - mean_new, 0)
+    else:
+      # Inverse update, state goes back to zero when the last value is removed
+      n_new    = n_obs[idx] - valid
+      delta    = np.where(valid, obs - mean[idx], 0)
+      mean_new = mean[idx] - np.where(valid, delta / np.maximum(n_new, 1), 0)
+      m2_new   = m2[idx] - delta * np.where(valid, obs - mean_new, 0)
+      mean_new = np.where(n_new > 0, mean_new, 0)
+      m2_new   = np.where(n_new > 1, np.maximum(m2_new, 0), 0)
+    
+    m2[idx]    = m2_new
+    mean[idx]  = mean_new
+    n_obs[idx] = n_new
   
-  # Return the table as output
-  return masked_ts_df
+  # Update the year list
+  if remove == True:
+    state_yrs.remove(obs_yr)
+  else:
+    state_yrs.append(obs_yr)
+  clim_state.attrs["years"] = " ".join(str(yr) for yr in sorted(state_yrs))
   
+  return clim_state
 
 
-#-----------------------------------------------------
-#
+def clim_from_state(clim_state, start_yr, end_yr, var_name = "sst"):
+  """
+  Turn a climatology accumulator state into the daily climatology: mean,
+  sample standard deviation, and count by modified ordinal day, unpacked 
+  onto the lat/lon grid. Cells with no observations (and land) are NaN.
+  
+  Args:
+    clim_state : xr.Dataset from ot.update_clim_state()
+    start_yr (int): First year of the reference period, used in the attributes
+    end_yr (int): Last year of the reference period, used in the attributes
+    var_name (str): Variable the climatology was built for
+  
+  """
+  n_obs = clim_state["n_obs"].values
+  with np.errstate(invalid = "ignore", divide = "ignore"):
+    clim_mean = np.where(n_obs > 0, clim_state[f"{var_name}_mean"].values, np.nan)
+    clim_sd   = np.where(n_obs > 1, np.sqrt(clim_state[f"{var_name}_m2"].values / (n_obs - 1)), np.nan)
+  
+  # Back onto the grid
+  cells = clim_state["cell"].values
+  n_lat, n_lon = clim_state.sizes["lat"], clim_state.sizes["lon"]
+  dims = ("modified_ordinal_day", "lat", "lon")
+  daily_clims = xr.Dataset({var_name         : (dims, unpack_cells(clim_mean.astype("float32"), cells, n_lat, n_lon)),
+                            f"{var_name}_sd" : (dims, unpack_cells(clim_sd.astype("float32"), cells, n_lat, n_lon)),
+                            "n_obs"          : (dims, unpack_cells(n_obs, cells, n_lat, n_lon, fill_value = 0))},
+                           coords = {"modified_ordinal_day" : clim_state["modified_ordinal_day"].values,
+                                     "lat" : clim_state["lat"].values, "lon" : clim_state["lon"].values})
+  
+  daily_clims.attrs = {
+    "title"         : "30-Year sea surface temperature climatology from NOAA OISSTv2 SST Data",
+    "institution"   : "Gulf of Maine Research Institute",
+    "source"        : "NOAA/NCDC  ftp://eclipse.ncdc.noaa.gov/pub/OI-daily-v2/",
+    "comment"       : f"Climatologies represent mean SST and its standard deviation for the years {start_yr}-{end_yr}",
+    "history"       : f"Climatologies calculated {datetime.date.today().strftime('%m/%d/%Y')}",
+    "references"    : "https://www.esrl.noaa.gov/psd/data/gridded/data.noaa.oisst.v2.highres.html",
+    "dataset_title" : "GMRI 30-Year Climatology - OISST"}
+  return daily_clims
+
+
+
+#-----------------------------------------------------
+#
+# Build Climatology for any Reference Period
+#
+#-----------------------------------------------------
+def build_oisst_climatology(box_root, start_yr, end_yr, var_name = "sst", save = True, use_cache = False, verbose = True):
+  """
+  Build the daily climatology (mean, standard deviation, count by modified ordinal day)
+  for any reference period, reading each annual file once and accumulating it with 
+  ot.update_clim_state(). Saved to daily_climatologies/daily_clims_{start_yr}to{end_yr}.nc
+  where ot.load_oisst_climatology() can find it, with the accumulator state saved 
+  next to it for ot.roll_oisst_climatology().
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    start_yr (int): First year of the reference period
+    end_yr (int): Last year of the reference period
+    var_name (str): Variable to build the climatology for
+    save (bool): Whether to save the climatology and state NetCDF files
+    use_cache (bool): True to go through ot.cached_product(), rebuilding only when the 
+    annual files or this function change. With save = True only the file paths are
+    cached and the saved climatology is opened lazily
+    verbose : True or False to print progress
+  
+  """
+  if use_cache == True:
+    clim_kwargs = {"box_root" : box_root, "start_yr" : int(start_yr), "end_yr" : int(end_yr), 
+                   "var_name" : var_name, "verbose" : verbose}
+    input_paths = get_annual_paths(box_root, start_yr, end_yr) + [get_ocean_mask_path(box_root)]
+    if save == True:
+      clim_paths = cached_product(box_root, build_climatology_files, clim_kwargs, input_paths = input_paths,
+                                  output_paths = [get_climatology_path(box_root, start_yr, end_yr), get_clim_state_path(box_root, start_yr, end_yr)], 
+                                  verbose = verbose)
+      return xr.open_dataset(clim_paths[0])
+    return cached_product(box_root, build_oisst_climatology, dict(clim_kwargs, save = False), 
+                          input_paths = input_paths, verbose = verbose)
+  
+  obs_root   = f"{box_root}RES_Data/OISST/oisst_mainstays/annual_observations/"
+  clim_state = None
+  
+  for yr in range(int(start_yr), int(end_yr) + 1):
+    with xr.open_dataset(f"{obs_root}sst.day.mean.{yr}.v2.nc") as year_obs:
+      if clim_state is None:
+        ocean_cells = get_ocean_cells(box_root, year_obs["lat"].values, year_obs["lon"].values)
+        clim_state  = new_clim_state(year_obs["lat"].values, year_obs["lon"].values, var_name = var_name, ocean_cells = ocean_cells)
+      update_clim_state(clim_state, year_obs, var_name = var_name)
+    if verbose == True:
+      print(f"Climatology accumulated for {yr}")
+  
+  # Means and standard deviations
+  daily_clims = clim_from_state(clim_state, start_yr, end_yr, var_name = var_name)
+  
+  if save == True:
+    save_oisst_climatology(box_root, daily_clims, clim_state, start_yr, end_yr, verbose = verbose)
+  
+  return daily_clims
+
+
+def build_climatology_files(box_root, start_yr, end_yr, var_name = "sst", verbose = True):
+  """
+  Build and save a climatology with ot.build_oisst_climatology() and return the paths 
+  of the climatology and state files, what the result cache keeps for saved climatologies
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    start_yr (int): First year of the reference period
+    end_yr (int): Last year of the reference period
+    var_name (str): Variable to build the climatology for
+    verbose : True or False to print progress
+  
+  """
+  build_oisst_climatology(box_root, start_yr, end_yr, var_name = var_name, save = True, verbose = verbose)
+  return [get_climatology_path(box_root, start_yr, end_yr), get_clim_state_path(box_root, start_yr, end_yr)]
+
+
+
+#-----------------------------------------------------
+#
+# Save / Load Climatology and Accumulator State
+#
+#-----------------------------------------------------
+def get_climatology_path(box_root, start_yr, end_yr):
+  """
+  Path to daily_clims_{start_yr}to{end_yr}.nc in daily_climatologies/
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    start_yr (int): First year of the reference period
+    end_yr (int): Last year of the reference period
+  
+  """
+  clim_root = f"{box_root}RES_Data/OISST/oisst_mainstays/daily_climatologies/"
+  return f"{clim_root}daily_clims_{start_yr}to{end_yr}.nc"
+
+
+def get_clim_state_path(box_root, start_yr, end_yr):
+  """
+  Path to the accumulator state saved next to daily_clims_{start_yr}to{end_yr}.nc
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    start_yr (int): First year of the reference period
+    end_yr (int): Last year of the reference period
+  
+  """
+  clim_root = f"{box_root}RES_Data/OISST/oisst_mainstays/daily_climatologies/"
+  return f"{clim_root}daily_clims_{start_yr}to{end_yr}_state.nc"
+
+
+def save_oisst_climatology(box_root, daily_clims, clim_state, start_yr, end_yr, verbose = True):
+  """
+  Save a climatology and its accumulator state to daily_climatologies/, the 
+  state in its packed (MOD, cell) form
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    daily_clims : xr.Dataset from ot.clim_from_state()
+    clim_state : xr.Dataset of accumulators the climatology came from
+    start_yr (int): First year of the reference period
+    end_yr (int): Last year of the reference period
+    verbose : True or False to print progress
+  
+  """
+  clim_root = f"{box_root}RES_Data/OISST/oisst_mainstays/daily_climatologies/"
+  os.makedirs(clim_root, exist_ok = True)
+  daily_clims.to_netcdf(get_climatology_path(box_root, start_yr, end_yr))
+  clim_state.to_netcdf(get_clim_state_path(box_root, start_yr, end_yr))
+  if verbose == True:
+    print(f"Saving {start_yr}-{end_yr} Climatology")
+
+
+def load_clim_state(box_root, start_yr, end_yr):
+  """
+  Load the accumulator state for a reference period into memory. States saved
+  on the full (MOD, lat, lon) grid are packed with every cell.
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    start_yr (int): First year of the reference period
+    end_yr (int): Last year of the reference period
+  
+  """
+  with xr.open_dataset(get_clim_state_path(box_root, start_yr, end_yr)) as clim_state:
+    clim_state = clim_state.load()
+  
+  # Older full grid states
+  if "cell" not in clim_state.dims:
+    n_cells = clim_state.sizes["lat"] * clim_state.sizes["lon"]
+    packed = xr.Dataset({state_var : (("modified_ordinal_day", "cell"), clim_state[state_var].values.reshape(366, n_cells)) 
+                         for state_var in clim_state.data_vars},
+                        coords = {"modified_ordinal_day" : clim_state["modified_ordinal_day"].values, "cell" : np.arange(n_cells),
+                                  "lat" : clim_state["lat"].values, "lon" : clim_state["lon"].values})
+    packed.attrs = clim_state.attrs
+    clim_state = packed
+  return clim_state
+
+
+
+#-----------------------------------------------------
+#
+# Roll Climatology Forward by Single Years
+#
+#-----------------------------------------------------
+def roll_oisst_climatology(box_root, start_yr, end_yr, steps = 1, var_name = "sst", save = True, verbose = True):
+  """
+  Move a saved climatology forward one year at a time. Each step adds the year after
+  the period and removes its first year from the saved accumulator state, so it reads 
+  two annual files instead of the whole period. Each new climatology and state is
+  saved to daily_climatologies/.
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    start_yr (int): First year of the saved reference period
+    end_yr (int): Last year of the saved reference period
+    steps (int): Number of years to move the period forward
+    var_name (str): Variable the climatology was built for
+    save (bool): Whether to save each new climatology and state
+    verbose : True or False to print progress
+  
+  Returns:
+    The climatology for the last period
+  
+  """
+  obs_root   = f"{box_root}RES_Data/OISST/oisst_mainstays/annual_observations/"
+  start_yr   = int(start_yr)
+  end_yr     = int(end_yr)
+  clim_state = load_clim_state(box_root, start_yr, end_yr)
+  
+  for step in range(steps):
+    
+    # Add the new year, drop the old one
+    with xr.open_dataset(f"{obs_root}sst.day.mean.{end_yr + 1}.v2.nc") as year_obs:
+      update_clim_state(clim_state, year_obs, var_name = var_name)
+    with xr.open_dataset(f"{obs_root}sst.day.mean.{start_yr}.v2.nc") as year_obs:
+      update_clim_state(clim_state, year_obs, var_name = var_name, remove = True)
+    start_yr, end_yr = start_yr + 1, end_yr + 1
+    
+    daily_clims = clim_from_state(clim_state, start_yr, end_yr, var_name = var_name)
+    if save == True:
+      save_oisst_climatology(box_root, daily_clims, clim_state, start_yr, end_yr, verbose = verbose)
+    elif verbose == True:
+      print(f"Climatology rolled forward to {start_yr}-{end_yr}")
+  
+  return daily_clims
+
+
+def build_sliding_climatologies(box_root, first_yr, last_yr, window = 30, var_name = "sst", verbose = True):
+  """
+  Build every sliding climatology of length window between first_yr and last_yr,
+  e.g. 1982-2011, 1983-2012, ... The first period is built with 
+  ot.build_oisst_climatology(), the rest are rolled forward from it one year at a time.
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    first_yr (int): First year of the first period
+    last_yr (int): Last year of the last period
+    window (int): Number of years in each period
+    var_name (str): Variable to build the climatologies for
+    verbose : True or False to print progress
+  
+  """
+  first_yr = int(first_yr)
+  first_end_yr = first_yr + window - 1
+  build_oisst_climatology(box_root, first_yr, first_end_yr, var_name = var_name, verbose = verbose)
+  
+  steps = int(last_yr) - first_end_yr
+  if steps > 0:
+    roll_oisst_climatology(box_root, first_yr, first_end_yr, steps = steps, var_name = var_name, verbose = verbose)
+  
+  
+  
+  
+#-----------------------------------------------------
+#
+#  Add Modified Ordinal Day
+#
+#-----------------------------------------------------
+def add_mod(grid_obj, time_dim, out_coord = "modified_ordinal_day"):
+    """
+    Add modified ordinal day to xarray dataset as new coordinate dimension
+
+    Args:
+        grid_obj : xarray object to add the new coordinate dimension
+        time_dim (str) : Time coordinate dimension to pull day of year from
+        out_coord (str) : 
+
+    """
+    # Flag days that are not in leap years
+    not_leap_year        = ~grid_obj.indexes[time_dim].is_leap_year
+    
+    # Flag days in the year that are march or later
+    march_or_later       = grid_obj[time_dim].dt.month >= 3
+    
+    # Pull day of year
+    ordinal_day          = grid_obj[time_dim].dt.dayofyear
+    
+    # Bump day of year if after march and a leap year
+    modified_ordinal_day = ordinal_day + (not_leap_year & march_or_later)
+    
+    # Add MOD as a variable
+    grid_obj = grid_obj.assign(modified_ordinal_day = modified_ordinal_day)
+    
+    # Add as coordinate as well
+    grid_obj = grid_obj.assign_coords(MOD = modified_ordinal_day)
+    
+    # return the grid with new var/coordinates
+    return grid_obj
+    
+#-----------------------------------------------------
+#   
+# Calculate Anomalies from Observed SST and Climatology  
+# 
+#-----------------------------------------------------
+def calc_anom(daily_sst, daily_clims):
+    """
+    Return Anomaly for Matching Modified Ordinal Day (day of year 1-366 adjusted for leap-years)
+    
+    daily_sst : xarray data array of sea surface temperatures containing "MOD" coordinate to pair with daily_clims
+    daily_clim : xarray data array of sea surface temperature climatologic means.
+    
+    """
+  
+    return daily_sst - daily_clims.sel(modified_ordinal_day = daily_sst["MOD"])
+  
+  
+  
+  
+#-----------------------------------------------------
+#   
+# Vectorized Anomalies for a Cube of Daily SST
+# 
+#-----------------------------------------------------
+def calc_daily_anoms(sst_obs, daily_clims, var_name = "sst"):
+    """
+    Return anomalies for every day of sst_obs in one vectorized step. The climatology
+    is fancy-indexed by each day's modified ordinal day, so there is one subtraction
+    over the whole cube (or each of its dask time chunks) rather than one per day 
+    as with sst_obs.groupby('time').map(calc_anom).
+    
+    When sst_obs is chunked the climatology is chunked the same way before the 
+    lookup, so each time chunk only reads the climatology days it needs instead of
+    the lookup pulling a full (days, lat, lon) array into the graph.
+    
+    sst_obs : xarray dataset of sea surface temperatures, "MOD" coordinate is added if missing
+    daily_clims : xarray dataset of sea surface temperature climatologic means by modified_ordinal_day
+    var_name (str) : Variable to calculate anomalies for
+    
+    """
+    # Modified ordinal day for every time step
+    if "MOD" not in sst_obs.coords:
+        sst_obs = add_mod(sst_obs, "time")
+    
+    # Lazy lookups for chunked observations, in blocks of the observation time chunks
+    daily_clim = daily_clims[var_name]
+    obs_chunks = sst_obs[var_name].chunks
+    if obs_chunks is not None:
+        time_chunks = obs_chunks[sst_obs[var_name].get_axis_num("time")]
+        if daily_clim.chunks is None:
+            daily_clim = daily_clim.chunk({"modified_ordinal_day" : max(time_chunks)})
+    
+    # Climatology for each time step, lined up on time
+    clim_by_day = daily_clim.sel(modified_ordinal_day = sst_obs["MOD"])
+    clim_by_day = clim_by_day.drop_vars(["modified_ordinal_day", "MOD"], errors = "ignore")
+    if obs_chunks is not None:
+        clim_by_day = clim_by_day.chunk({"time" : time_chunks})
+    
+    # Subtract, keep MOD as a coordinate like calc_anom
+    anoms = sst_obs[var_name] - clim_by_day
+    anoms = anoms.assign_coords(MOD = sst_obs["MOD"])
+    return xr.Dataset({var_name : anoms})
+  
+  
+  
+  
+#------------------------------------------------------
+#
+# Apply OISST Attributes
+#
+#------------------------------------------------------
+def apply_oisst_attributes(oisst_grid, anomalies = False, reference_period = "1982-2011"):
+  """
+  Attach appropriate NetCDF attributes to OISST observations or Anomalies
+  
+  Args:
+    oisst_grid : xr.Dataset to apply attributes to
+    anomalies (bool): False to apply OISSTv2 attributes, True for anomaly specs
+    reference_period (str): Optional string to apply for anomaly reference period, default 1982-2011
+  """
+  # Attributes for Anomalies
+  today = datetime.date.today()
+  anom_attrs = {
+    'title'         : f'Sea surface temperature anomalies from NOAA OISSTv2 SST Data using {reference_period} Climatology',
+    'institution'   : 'Gulf of Maine Research Institute',
+    'source'        : 'NOAA/NCDC  ftp://eclipse.ncdc.noaa.gov/pub/OI-daily-v2/',
+    'comment'       : f'Climatology used represents mean SST for the years {reference_period}',
+    'history'       : f'Anomalies calculated {today.month}/{today.day}/{today.year} from the {reference_period} climatology',
+    'references'    : 'https://www.esrl.noaa.gov/psd/data/gridded/data.noaa.oisst.v2.highres.html',
+    'dataset_title' : 'Sea Surface Temperature Anomalies - OISSTv2',
+
+
+  }
+  
+  # Attributes for Observed SST
+  obs_attrs = {
+    "Conventions"   : "CF-1.5",
+    "title"         : "NOAA/NCEI 1/4 Degree Daily Optimum Interpolation Sea Surface Temperature (OISST) Analysis, Version 2.1",
+    "institution"   : "NOAA/National Centers for Environmental Information",
+    "source"        : "NOAA/NCEI https://www.ncei.noaa.gov/data/sea-surface-temperature-optimum-interpolation/v2.1/access/avhrr/",
+    "References"    : "https://www.psl.noaa.gov/data/gridded/data.noaa.oisst.v2.highres.html",
+    "dataset_title" : "NOAA Daily Optimum Interpolation Sea Surface Temperature",
+    "version"       : "Version 2.1",
+    "comment"       : "Reynolds, et al.(2007) Daily High-Resolution-Blended Analyses for Sea Surface Temperature (available at https://doi.org/10.1175/2007JCLI1824.1). Banzon, et al.(2016) A long-term record of blended satellite and in situ sea-surface temperature for climate monitoring, modeling and environmental studies (available at https://doi.org/10.5194/essd-8-165-2016). Huang et al. (2020) Improvements of the Daily Optimum Interpolation Sea Surface Temperature (DOISST) Version v02r01, submitted.Climatology is based on 1971-2000 OI.v2 SST. Satellite data: Pathfinder AVHRR SST and Navy AVHRR SST. Ice data: NCEP Ice and GSFC Ice. Data less than 15 days old may be subject to revision."
+    
+  }
+  
+  
+  # Toggle which to use
+  if anomalies == True:
+    attr_dict = anom_attrs
+  elif anomalies == False:
+    attr_dict = obs_attrs
+  
+  # Apply them
+  oisst_grid.attrs = attr_dict
+  
+  # Set the Time encodings
+  oisst_grid.time.encoding = {"units" : "days since '1800-01-01'"}
+  
+  # Return the grid
+  return oisst_grid
+  
+
+#------------------------------------------------------
+#
+# Stream Anomalies to Annual Files
+#
+#------------------------------------------------------
+def export_annual_anomalies(box_root, start_yr, end_yr, reference_period = "1982-2011", time_chunk = 31, use_cache = False, verbose = True):
+  """
+  Calculate daily anomalies year by year with ot.calc_daily_anoms() and save them
+  to annual_anomalies/<period>_climatology/daily_anoms_YYYY.nc. Each year is opened
+  in chunks of time_chunk days with the climatology looked up in matching chunks, 
+  and to_netcdf() computes and writes one chunk at a time, so memory stays at a 
+  few chunks of the global grid.
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    start_yr (int): First year to process
+    end_yr (int): Last year to process
+    reference_period (str): Climatology to use, e.g. "1982-2011"
+    time_chunk (int): Number of days to hold in memory at once
+    use_cache (bool): True to go through ot.cached_product(), skipping the years when 
+    their annual files, the climatology and this function are unchanged and the 
+    anomaly files are still there
+    verbose : True or False to print progress
+  
+  """
+  if use_cache == True:
+    anom_kwargs = {"box_root" : box_root, "start_yr" : int(start_yr), "end_yr" : int(end_yr), 
+                   "reference_period" : reference_period, "time_chunk" : time_chunk, "verbose" : verbose}
+    start_clim, end_clim = reference_period.split("-")
+    return cached_product(box_root, export_annual_anomalies, anom_kwargs, key_exclude = ["box_root", "verbose", "time_chunk"],
+                          input_paths = get_annual_paths(box_root, start_yr, end_yr) + [get_climatology_path(box_root, start_clim, end_clim)],
+                          verbose = verbose)
+  
+  # Output folder for the reference period
+  climate_period = reference_period.replace("-", "to")
+  anom_folder = f"{box_root}RES_Data/OISST/oisst_mainstays/annual_anomalies/{climate_period}_climatology/"
+  os.makedirs(anom_folder, exist_ok = True)
+  
+  # Climatology is used by every year
+  daily_clims = load_oisst_climatology(box_root, reference_period = reference_period)
+  
+  out_paths = []
+  for yr in range(int(start_yr), int(end_yr) + 1):
+    
+    # Lazy-load the year in time chunks
+    obs_path = f"{box_root}RES_Data/OISST/oisst_mainstays/annual_observations/sst.day.mean.{yr}.v2.nc"
+    with xr.open_dataset(obs_path, chunks = {"time" : time_chunk}) as sst_obs:
+      
+      # Anomalies and attributes
+      daily_anoms = calc_daily_anoms(sst_obs, daily_clims)
+      daily_anoms = apply_oisst_attributes(oisst_grid = daily_anoms, 
+                                           anomalies = True, 
+                                           reference_period = reference_period)
+      
+      # Write chunk by chunk
+      out_path = f"{anom_folder}daily_anoms_{yr}.nc"
+      daily_anoms.to_netcdf(out_path, unlimited_dims = ["time"])
+      out_paths.append(out_path)
+    
+    if verbose == True:
+      print(f"Saving Anomalies for {yr}, using {reference_period} climate reference period.")
+  
+  daily_clims.close()
+  return out_paths
+  
+  
+  
+#-----------------------------------------------------
+#
+#  Get Log-Likelihood of Anomaly
+#
+#-----------------------------------------------------
+def calc_ll(row, var_name, clim_mu, clim_sd):
+  
+    """
+    Get Log-Likelihood of Event from Normal Distribution (mu, sigma) for use with assign()
+    
+    Works on a single row or on a whole dataframe at once, returning a column.
+
+    Args:
+        row : Row of pandas dataframe, or the dataframe
+        var name (str): String for column name indicating the values to be assessed for their likelihood
+        clim_mu (str): String for column name indicating mean of the distribution
+        clim_sd (str): String for column name indicating the standard deviation of the distribution
+        
+
+    """
+    # log likelihood of event from normal distribution.
+    n = 1
+    anom  = row[f"{var_name}"]
+    mu    = row[f"{clim_mu}"]
+    sigma = row[f"{clim_sd}"]
+    log_lik = n * np.log(2 * np.pi * (sigma ** 2)) / 2 + ((anom - mu) ** 2) / (2 * (sigma ** 2))
+    return log_lik
+
+
+
+
+
+
+
+
+
+
+
+
+
+
+#---------------------------------------------------
+#
+# Region Mask Cache
+#
+#----------------------------------------------------
+def get_grid_signature(grid_obj):
+  """
+  Short hash of the lat/lon coordinates of a grid, so cached masks are only
+  reused on the grid they were made for.
+  
+  Args:
+    grid_obj : xr.Dataset or xr.DataArray with "lat" and "lon" coordinates
+  
+  """
+  grid_hash = hashlib.md5()
+  grid_hash.update(np.asarray(grid_obj["lat"].values, dtype = "float64").tobytes())
+  grid_hash.update(np.asarray(grid_obj["lon"].values, dtype = "float64").tobytes())
+  return grid_hash.hexdigest()[0:12]
+
+
+def get_geometry_hash(shp_obj):
+  """
+  Short hash of the polygon geometries in a shapefile, so cached masks are
+  rebuilt whenever a region outline changes.
+  
+  Args:
+    shp_obj : geopandas GeoDataFrame of the region polygon(s)
+  
+  """
+  geom_hash = hashlib.md5()
+  for geom in shp_obj.geometry:
+    geom_hash.update(geom.wkb)
+  return geom_hash.hexdigest()[0:12]
+
+
+def get_mask_cache_path(box_root, region_group, region_name, grid_sig, geom_hash):
+  """
+  Path to a cached region mask in oisst_mainstays/mask_cache/
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    region_group (str): Region group from ot.get_region_names()
+    region_name (str): Region name from ot.get_region_names()
+    grid_sig (str): Grid signature from ot.get_grid_signature()
+    geom_hash (str): Geometry hash from ot.get_geometry_hash()
+  
+  """
+  mask_root = f"{box_root}RES_Data/OISST/oisst_mainstays/mask_cache/{region_group}/"
+  return f"{mask_root}{region_name}_{grid_sig}_{geom_hash}.npz"
+
+
+def get_area_weights(lat):
+  """
+  Relative area of grid cells by latitude. On a regular lat/lon grid cell area
+  scales with cos(latitude), so these are the weights for area-weighted means.
+  
+  Args:
+    lat : Latitude values in degrees
+  
+  """
+  return np.cos(np.deg2rad(np.asarray(lat, dtype = "float64")))
+
+
+def get_bounds_window(grid_obj, shp_obj):
+  """
+  Index bounds of the window of the grid that covers a region's total bounds, 
+  padded by one cell. Longitudes of the polygons are wrapped onto the grid's 
+  convention (0 to 360 or -180 to 180). Regions that cross the edge of the grid's
+  longitudes get two longitude slices, one at each end of the grid, as in ot.subset_oisst().
+  
+  Args:
+    grid_obj : xr.Dataset with "lat" and "lon" coordinates
+    shp_obj : geopandas GeoDataFrame of the region polygon(s)
+  
+  Returns:
+    lat_idx : (start, stop) index bounds on the lat coordinate
+    lon_runs : list of (start, stop) index bounds on the lon coordinate, in the 
+    order the columns join up, empty if the region misses the grid
+  
+  """
+  lat = np.asarray(grid_obj["lat"].values, dtype = "float64")
+  lon = np.asarray(grid_obj["lon"].values, dtype = "float64")
+  min_x, min_y, max_x, max_y = shp_obj.total_bounds
+  lat_step = np.abs(np.diff(lat)).max() if len(lat) > 1 else 0
+  lon_step = np.abs(np.diff(lon)).max() if len(lon) > 1 else 0
+  
+  # Latitude rows within the bounds
+  lat_hits = np.flatnonzero((lat >= min_y - lat_step) & (lat <= max_y + lat_step))
+  
+  # Longitudes in the grid's convention
+  if lon.max() > 180:
+    wrap_lon = lambda x: x % 360
+  else:
+    wrap_lon = lambda x: ((x + 180) % 360) - 180
+  west, east = wrap_lon(min_x - lon_step), wrap_lon(max_x + lon_step)
+  if (max_x - min_x) + 2 * lon_step >= 360:
+    lon_hits = [np.arange(len(lon))]
+  elif west <= east:
+    lon_hits = [np.flatnonzero((lon >= west) & (lon <= east))]
+  
+  # Across the edge, the western end of the grid then the eastern end
+  else:
+    lon_hits = [np.flatnonzero(lon >= west), np.flatnonzero(lon <= east)]
+  lon_runs = [(int(hits[0]), int(hits[-1]) + 1) for hits in lon_hits if len(hits) > 0]
+  
+  if len(lat_hits) == 0 or len(lon_runs) == 0:
+    return (0, 0), []
+  return (int(lat_hits[0]), int(lat_hits[-1]) + 1), lon_runs
+
+
+def get_lon_runs(lon_idx, n_lon):
+  """
+  Split the lon bounds of a region mask into (start, stop) slices of the grid. 
+  Masks of regions across the grid's longitude edge have a stop past the last 
+  column, those columns wrap around to the start of the grid.
+  
+  Args:
+    lon_idx : (start, stop) lon bounds from ot.build_region_mask()
+    n_lon (int): Number of longitudes in the grid
+  
+  """
+  if lon_idx[1] <= n_lon:
+    return [(lon_idx[0], lon_idx[1])]
+  return [(lon_idx[0], n_lon), (0, lon_idx[1] - n_lon)]
+
+
+def build_region_mask(grid_obj, shp_obj, shp_name):
+  """
+  Rasterize a region onto the grid and store it compactly as the index bounds
+  of its bounding box on the grid plus a boolean mask of the cells inside it.
+  Area weights for the cells inside are stored with it. Only the window of the 
+  grid inside the region's total bounds is rasterized, for regions across the 
+  grid's longitude edge that is a slice at each end of the grid.
+  
+  Args:
+    grid_obj : xr.Dataset with "lat" and "lon" coordinates
+    shp_obj : shapefile polygon to use as a mask
+    shp_name (str) : String to use as name when making mask
+  
+  Returns:
+    dict with "lat_idx" and "lon_idx" (start, stop) index bounds, "sub_mask", and
+    "sub_weights", the area weight of each cell in the mask (0 outside). For regions
+    across the grid's longitude edge the lon stop runs past the last column, see 
+    ot.get_lon_runs()
+  
+  """
+  # Window of the grid around the polygons, grid columns in the order they join up
+  lat_win, lon_runs = get_bounds_window(grid_obj, shp_obj)
+  lon_cols = np.concatenate([np.arange(*run) for run in lon_runs] + [np.zeros(0, dtype = int)])
+  in_region = np.zeros((lat_win[1] - lat_win[0], len(lon_cols)), dtype = bool)
+  
+  # Make the mask on each slice of the window, True inside the region. The lon and 
+  # lat arrays are passed directly, regionmask 0.5 needs lon_name/lat_name to read 
+  # them from a dataset and later versions no longer take those keywords
+  if in_region.size > 0:
+    area_mask = regionmask.Regions(shp_obj.geometry, name = shp_name)
+    run_masks = []
+    for lon_run in lon_runs:
+      window = grid_obj.isel(lat = slice(*lat_win), lon = slice(*lon_run))
+      mask = area_mask.mask(window["lon"].values, window["lat"].values)
+      run_masks.append(~np.isnan(np.asarray(mask)))
+    in_region = np.concatenate(run_masks, axis = 1)
+  
+  # Bounding box of the cells inside, on the full grid
+  lat_hits = np.flatnonzero(in_region.any(axis = 1))
+  lon_hits = np.flatnonzero(in_region.any(axis = 0))
+  if len(lat_hits) == 0:
+    lat_idx, lon_idx = (0, 0), (0, 0)
+    sub_mask = np.zeros((0, 0), dtype = bool)
+  else:
+    sub_mask = in_region[lat_hits[0]:lat_hits[-1] + 1, lon_hits[0]:lon_hits[-1] + 1]
+    lat_idx = (lat_win[0] + int(lat_hits[0]), lat_win[0] + int(lat_hits[-1]) + 1)
+    lon_idx = (int(lon_cols[lon_hits[0]]), int(lon_cols[lon_hits[-1]]) + 1)
+    if lon_idx[1] <= lon_idx[0]:
+      lon_idx = (lon_idx[0], lon_idx[1] + grid_obj.sizes["lon"])
+  
+  sub_weights = get_region_weights(grid_obj, lat_idx, sub_mask)
+  return {"lat_idx" : lat_idx, "lon_idx" : lon_idx, "sub_mask" : sub_mask, "sub_weights" : sub_weights}
+
+
+def get_region_weights(grid_obj, lat_idx, sub_mask):
+  """
+  Area weights for the cells of a region mask, 0 outside the region
+  
+  Args:
+    grid_obj : xr.Dataset with "lat" and "lon" coordinates
+    lat_idx : (start, stop) index bounds of the mask on the lat coordinate
+    sub_mask : Boolean mask of the region's bounding box
+  
+  """
+  lat_weights = get_area_weights(grid_obj["lat"].values[lat_idx[0]:lat_idx[1]])
+  return np.where(sub_mask, lat_weights[:, None], 0).astype("float32")
+
+
+def load_region_mask(grid_obj, shp_obj, region_name, region_group, box_root):
+  """
+  Get a region mask from the mask cache, building and saving it on first use.
+  Masks are keyed by region group, region name, grid signature and geometry hash.
+  
+  Args:
+    grid_obj : xr.Dataset with "lat" and "lon" coordinates
+    shp_obj : shapefile polygon to use as a mask
+    region_name (str): Region name from ot.get_region_names()
+    region_group (str): Region group from ot.get_region_names()
+    box_root (str): Base location to box from either local path or docker volume
+  
+  Returns:
+    dict from ot.build_region_mask()
+  
+  """
+  mask_path = get_mask_cache_path(box_root, region_group, region_name, 
+                                  get_grid_signature(grid_obj), get_geometry_hash(shp_obj))
+  
+  # Cache hit
+  if os.path.exists(mask_path):
+    with np.load(mask_path) as cached:
+      region_mask = {"lat_idx"  : tuple(int(i) for i in cached["lat_idx"]),
+                     "lon_idx"  : tuple(int(i) for i in cached["lon_idx"]),
+                     "sub_mask" : cached["sub_mask"]}
+      if "sub_weights" in cached.files:
+        region_mask["sub_weights"] = cached["sub_weights"]
+      else:
+        region_mask["sub_weights"] = get_region_weights(grid_obj, region_mask["lat_idx"], region_mask["sub_mask"])
+      return region_mask
+  
+  # Build and save, written to a temp name first
+  region_mask = build_region_mask(grid_obj, shp_obj, region_name)
+  os.makedirs(os.path.dirname(mask_path), exist_ok = True)
+  tmp_path = f"{mask_path[:-4]}.part.npz"
+  np.savez_compressed(tmp_path, **region_mask)
+  os.replace(tmp_path, mask_path)
+  return region_mask
+
+
+def apply_region_mask(grid_obj, region_mask):
+  """
+  Cut the grid down to a region's bounding box and mask the cells outside it.
+  Only the cells in the bounding box are read from disk. Boxes across the grid's
+  longitude edge are joined from a slice at each end of the grid.
+  
+  Args:
+    grid_obj : xr.Dataset with "lat" and "lon" coordinates
+    region_mask : dict from ot.build_region_mask() or ot.load_region_mask()
+  
+  """
+  windows = [grid_obj.isel(lat = slice(*region_mask["lat_idx"]), lon = slice(*lon_run)) 
+             for lon_run in get_lon_runs(region_mask["lon_idx"], grid_obj.sizes["lon"])]
+  if len(windows) == 1:
+    window = windows[0]
+  else:
+    window = xr.concat(windows, dim = "lon", data_vars = "minimal", coords = "minimal")
+  sub_mask = xr.DataArray(region_mask["sub_mask"], 
+                          dims = ("lat", "lon"), 
+                          coords = {"lat" : window["lat"], "lon" : window["lon"]})
+  return window.where(sub_mask)
+
+
+def calc_weighted_stats(masked_da, region_mask):
+  """
+  Area-weighted mean and standard deviation over lat/lon of a masked window from 
+  ot.apply_region_mask(), from one pass of weighted sums (w, w*x, w*x^2). Cells 
+  with missing values drop out of the weights.
+  
+  Args:
+    masked_da : xr.DataArray returned by ot.apply_region_mask() for one variable
+    region_mask : dict from ot.build_region_mask() or ot.load_region_mask()
+  
+  Returns:
+    (weighted mean, weighted standard deviation) as xr.DataArrays
+  
+  """
+  weights = xr.DataArray(region_mask["sub_weights"].astype("float64"), 
+                         dims = ("lat", "lon"), 
+                         coords = {"lat" : masked_da["lat"], "lon" : masked_da["lon"]})
+  weights = weights.where(masked_da.notnull(), 0)
+  
+  # Weighted sums in one pass
+  sum_w   = weights.sum(dim = ("lat", "lon"))
+  sum_wx  = (weights * masked_da).sum(dim = ("lat", "lon"))
+  sum_wx2 = (weights * masked_da ** 2).sum(dim = ("lat", "lon"))
+  
+  weighted_mean = sum_wx / sum_w
+  weighted_sd   = np.sqrt((sum_wx2 / sum_w - weighted_mean ** 2).clip(min = 0))
+  return weighted_mean, weighted_sd
+
+
+
+#---------------------------------------------------
+#
+# Masked Timseries from xr.Dataset
+#
+#----------------------------------------------------
+def calc_ts_mask(grid_obj, shp_obj, shp_name, var_name = "sst", climatology = False, region_group = None, box_root = None, area_weighted = False):
+  """
+  Return a timeseries using data that falls within shapefile. 
+  
+  Standard deviation
+  not included so that this function can be used for any period of time.
+  
+  Args:
+    grid_obj       : xr.Dataset of the desired input data to mask
+    shp_obj        : shapefile polygon to use as a mask
+    shp_name (str) : String to use as name when making mask
+    var_name (str) : Optional string identifying the variable to use
+    climatology (bool): Whether you are masking a cliimatology, informs naming conventions and
+    whether to process standard deviation
+    region_group (str) : Optional region group of shp_name, with box_root turns on the mask cache
+    box_root (str) : Optional path to box, with region_group turns on the mask cache
+    area_weighted (bool) : True to weight cells by area (cos latitude) for the mean and standard deviation
+  """
+
+  #### 1. Make the mask on the region's window of the grid, or pull it from the mask cache
+  if region_group is not None and box_root is not None:
+    region_mask = load_region_mask(grid_obj, shp_obj, shp_name, region_group, box_root)
+  else:
+    region_mask = build_region_mask(grid_obj, shp_obj, shp_name)
+
+  
+  #### 2-3. Extract data that falls within the mask, only its bounding box is read
+  masked_ds = apply_region_mask(grid_obj, region_mask)
+
+  
+  #### 4. Calculate timeseries mean
+
+  # Get the timeseries mean of the desired variable
+  if area_weighted == True:
+    masked_ts, masked_sd = calc_weighted_stats(getattr(masked_ds, var_name), region_mask)
+    masked_ts = masked_ts.rename(var_name)
+    if climatology == True:
+      masked_ts["clim_sd"] = masked_sd
+  
+  elif climatology == False:
+    masked_ts = getattr(masked_ds, var_name).mean(dim = ("lat", "lon"))
+    
+  elif climatology == True:
+    masked_ts = getattr(masked_ds, var_name).mean(dim = ("lat", "lon"))
+    masked_ts["clim_sd"] = getattr(masked_ds, var_name).std(dim = ("lat", "lon"))
+
+  
+  #### 5. Change time index rownames to a column 
+
+  # Convert to Timeseries Dataframe
+  masked_ts_df = masked_ts.to_dataframe()
+
+  # Reset the index, rename variables
+  if climatology == False:
+    masked_ts_df = masked_ts_df.reset_index()[["time", var_name]]
+    
+  elif climatology == True:
+    clim_name = clim_name = f"{var_name}_clim"
+    masked_ts_df = masked_ts_df.reset_index()[["modified_ordinal_day", var_name, "clim_sd"]]
+    masked_ts_df = masked_ts_df.rename(columns = {f"{var_name}" : f"{clim_name}"})
+  
+  # Return the table as output
+  return masked_ts_df
+  
+
+
+#---------------------------------------------------
+#
+# Batched Timeseries for Many Regions in One Pass
+#
+#----------------------------------------------------
+def build_region_matrix(grid_obj, region_masks, area_weighted = False):
+  """
+  Stack region masks into a sparse region-by-pixel matrix over the rows and 
+  columns of the grid the regions use. Overlapping regions are fine, each
+  region is its own row. Entries are 1, or the cached cell area weights.
+  
+  Args:
+    grid_obj : xr.Dataset with "lat" and "lon" coordinates
+    region_masks : list of dicts from ot.build_region_mask() or ot.load_region_mask()
+    area_weighted (bool) : True to fill the matrix with cell area weights
+  
+  Returns:
+    (region_matrix, lat_idx, lon_cols), the scipy.sparse csr matrix with one column per 
+    cell of the window in row-major order, the (start, stop) lat bounds of the window and
+    the sorted lon indices of its columns
+  
+  """
+  # Window covering every region, only the columns some region uses
+  n_grid_lon = grid_obj.sizes["lon"]
+  non_empty  = [m for m in region_masks if m["sub_mask"].size > 0]
+  if len(non_empty) == 0:
+    return sparse.csr_matrix((len(region_masks), 0)), (0, 0), np.zeros(0, dtype = int)
+  lat_idx  = (min(m["lat_idx"][0] for m in non_empty), max(m["lat_idx"][1] for m in non_empty))
+  lon_cols = np.unique(np.concatenate([np.arange(*m["lon_idx"]) % n_grid_lon for m in non_empty]))
+  col_pos  = np.full(n_grid_lon, -1)
+  col_pos[lon_cols] = np.arange(len(lon_cols))
+  n_lon = len(lon_cols)
+  n_cells = (lat_idx[1] - lat_idx[0]) * n_lon
+  
+  # Flat window index of every cell in every region
+  rows, cols, weights = [], [], []
+  for region_num, region_mask in enumerate(region_masks):
+    lat_hits, lon_hits = np.nonzero(region_mask["sub_mask"])
+    if area_weighted == True:
+      weights.append(region_mask["sub_weights"][lat_hits, lon_hits].astype("float64"))
+    else:
+      weights.append(np.ones(len(lat_hits)))
+    lat_hits = lat_hits + region_mask["lat_idx"][0] - lat_idx[0]
+    lon_hits = col_pos[(lon_hits + region_mask["lon_idx"][0]) % n_grid_lon]
+    cols.append(lat_hits * n_lon + lon_hits)
+    rows.append(np.full(len(lat_hits), region_num))
+  rows    = np.concatenate(rows)
+  cols    = np.concatenate(cols)
+  weights = np.concatenate(weights)
+  
+  region_matrix = sparse.csr_matrix((weights, (rows, cols)), 
+                                    shape = (len(region_masks), n_cells))
+  return region_matrix, lat_idx, lon_cols
+
+
+def calc_ts_regions(grid_obj, shp_list, region_names, region_group = None, box_root = None, var_name = "sst", time_chunk = 31, area_weighted = False):
+  """
+  Return masked timeseries means and standard deviations for many regions at once, 
+  reading the grid one time chunk at a time and reducing each chunk into every region
+  with sparse matrix products. Matches calc_ts_mask() region by region, without a pass 
+  over the grid per region.
+  
+  Args:
+    grid_obj : xr.Dataset of the desired input data to mask
+    shp_list : list of shapefile polygons, one per region
+    region_names : list of region names matching shp_list
+    region_group : Optional region group (str, or list matching region_names), with box_root turns on the mask cache
+    box_root (str) : Optional path to box, with region_group turns on the mask cache. Land 
+    cells of the stored ocean mask are dropped from the window when it is given.
+    var_name (str) : Variable to make timeseries for
+    time_chunk (int) : Number of time steps to read into memory at once
+    area_weighted (bool) : True to weight cells by area (cos latitude)
+  
+  Returns:
+    Long pd.DataFrame with the time (or modified_ordinal_day) column, "region", var_name,
+    and {var_name}_sd, the spatial standard deviation within the region
+  
+  """
+  #### 1. Region masks, cached if possible
+  if isinstance(region_group, str):
+    region_group = [region_group] * len(region_names)
+  region_masks = []
+  for region_num, (shp_obj, shp_name) in enumerate(zip(shp_list, region_names)):
+    if region_group is not None and box_root is not None:
+      region_masks.append(load_region_mask(grid_obj, shp_obj, shp_name, region_group[region_num], box_root))
+    else:
+      region_masks.append(build_region_mask(grid_obj, shp_obj, shp_name))
+  
+  #### 2. Sparse region by pixel matrix over the window that covers them all
+  region_matrix, lat_idx, lon_cols = build_region_matrix(grid_obj, region_masks, area_weighted = area_weighted)
+  grid_var = grid_obj[var_name].isel(lat = slice(*lat_idx))
+  ts_dim   = [dim for dim in grid_var.dims if dim not in ("lat", "lon")][0]
+  grid_var = grid_var.transpose(ts_dim, "lat", "lon")
+  n_steps  = grid_var.sizes[ts_dim]
+  
+  # Window columns are read as runs of neighbouring columns
+  run_breaks = np.flatnonzero(np.diff(lon_cols) != 1) + 1
+  grid_runs  = [grid_var.isel(lon = slice(int(run[0]), int(run[-1]) + 1)) 
+                for run in np.split(lon_cols, run_breaks) if len(run) > 0]
+  if len(grid_runs) == 0:
+    grid_runs = [grid_var.isel(lon = slice(0, 0))]
+  
+  #### 2b. Pack the window down to its ocean cells, land is missing on every step
+  if box_root is not None:
+    ocean_cells = get_ocean_cells(box_root, grid_obj["lat"].values, grid_obj["lon"].values)
+    cell_lat, cell_lon = np.divmod(ocean_cells, grid_obj.sizes["lon"])
+    col_pos = np.full(grid_obj.sizes["lon"], -1)
+    col_pos[lon_cols] = np.arange(len(lon_cols))
+    in_window = (cell_lat >= lat_idx[0]) & (cell_lat < lat_idx[1]) & (col_pos[cell_lon] >= 0)
+    window_cells = (cell_lat[in_window] - lat_idx[0]) * len(lon_cols) + col_pos[cell_lon[in_window]]
+  else:
+    window_cells = np.arange(region_matrix.shape[1])
+  region_matrix = region_matrix[:, window_cells]
+  
+  #### 3. One pass over the grid, every region reduced per chunk
+  region_counts = np.zeros((len(region_names), n_steps))
+  region_sums   = np.zeros((len(region_names), n_steps))
+  region_sumsq  = np.zeros((len(region_names), n_steps))
+  for start in range(0, n_steps, time_chunk):
+    chunk = np.concatenate([grid_run[start : start + time_chunk].values for grid_run in grid_runs], axis = -1)
+    chunk = pack_cells(chunk.astype("float64"), window_cells).T
+    valid = np.isfinite(chunk)
+    chunk = np.where(valid, chunk, 0)
+    region_counts[:, start : start + time_chunk] = region_matrix @ valid.astype("float64")
+    region_sums[:, start : start + time_chunk]   = region_matrix @ chunk
+    region_sumsq[:, start : start + time_chunk]  = region_matrix @ (chunk ** 2)
+  
+  with np.errstate(invalid = "ignore", divide = "ignore"):
+    region_means = region_sums / region_counts
+    region_sds   = np.sqrt(np.maximum(region_sumsq / region_counts - region_means ** 2, 0))
+  
+  #### 4. Long table of time x region
+  ts_values = grid_var[ts_dim].values
+  masked_ts_df = pd.DataFrame({
+    ts_dim   : np.tile(ts_values, len(region_names)),
+    "region" : np.repeat(region_names, n_steps),
+    var_name : region_means.ravel(),
+    f"{var_name}_sd" : region_sds.ravel()})
+  return masked_ts_df
+  
+  
+  
+#-----------------------------------------------------
+#
 # Append Timeseries Updates to Existing Masked Timeseries w/ Climatology
 #
 #-----------------------------------------------------
-def append_sst_ts(old_ts, update_ts):
-   """
-   Append update period to OISST masked timeseries to create complete timeline
-   
-   Args:
-     old_ts    : Timeseries of existing data, needs time and sst column, rest are dropped
-     update_ts : Timeseries of update period
-   
-   """
-   # Remove dates from old timeseries overlap from the update timeseries
-   old_sst = old_ts[["time", "sst"]]
-   not_overlapped = ~old_sst.time.isin(update_ts.time)
-   old_sst  = old_sst[not_overlapped]
+def append_sst_ts(old_ts, update_ts):
+   """
+   Append update period to OISST masked timeseries to create complete timeline
+   
+   Args:
+     old_ts    : Timeseries of existing data, needs time and sst column, rest are dropped
+     update_ts : Timeseries of update period
+   
+   """
+   # Remove dates from old timeseries overlap from the update timeseries
+   old_sst = old_ts[["time", "sst"]]
+   not_overlapped = ~old_sst.time.isin(update_ts.time)
+   old_sst  = old_sst[not_overlapped]
+
+
+   # Concatenate onto the original
+   appended_ts = pd.concat([ old_sst, update_ts ])
+   
+   # Format time as datetime
+   appended_ts["time"] = appended_ts["time"].astype("datetime64")
+    
+   # Add modified ordinal day
+   
+   # Pull climatology info
+   
+   # Get anomalies
+    
+   return appended_ts
+
+
+#-----------------------------------------------------
+#
+# Add Modified Ordinal Day to pd.DataFrame that has time column
+#
+#-----------------------------------------------------
+def add_mod_to_ts(new_ts):
+    """
+    Add modified ordinaly day column to pd.DataFrame from time column
+    
+    Args:
+        new_ts : timeseries dataframe that contains "time" datetime64 column.
+    
+    """
+    # Add modified ordinal day, for day-to-day calculation and leapyear adjustment
+    not_leap_year  = ~new_ts.time.dt.is_leap_year
+    march_or_later =  new_ts.time.dt.month >= 3
+    ordinal_day    =  new_ts.time.dt.dayofyear
+    mod            =  ordinal_day + (not_leap_year & march_or_later)
+    new_ts["modified_ordinal_day"] = mod
+    return new_ts
+
+#-----------------------------------------------------
+#
+# Rejoin Regional Climatology, re-calculate regional anomalies
+#
+#-----------------------------------------------------
+def rejoin_climatology(old_ts, new_ts, clim_lookup = None):
+    """
+    Add Climatology and climate standard deviation from one dataframe 
+    to a second by modified ordinal day, the units of the climatology.
+    The climatology is laid out as a 366 row lookup and indexed by MOD
+    directly, see ot.build_clim_lookup().
+    
+    Args:
+        old_ts : Dataframe with "modified_ordinal_day", "sst_clim", "clim_sd" used to build climatology key for merge
+        new_ts : Second dataframe that only has time and sst, but matches the region mask used to prepare old_ts
+        clim_lookup : Optional lookup from ot.build_clim_lookup() or ot.load_clim_lookups(), 
+          used instead of old_ts
+    
+    
+    """
+    # Climatology by MOD from the existing timeline
+    if clim_lookup is None:
+        clim_lookup = build_clim_lookup(old_ts)
+    
+    # Add MOD, climatology and anomalies to new timeseries
+    new_ts = new_ts.copy()
+    new_ts["time"] = pd.to_datetime(new_ts["time"])
+    new_ts = add_mod_to_ts(new_ts)
+    anom_timeline = calc_anomaly_columns(new_ts, clim_lookup)
+
+    return anom_timeline
+
+
+
+#-----------------------------------------------------
+#
+# Regional Climatology Lookups, 366 rows by MOD
+#
+#-----------------------------------------------------
+def build_clim_lookup(clim_ts, var_name = "sst"):
+    """
+    Dense climatology lookup for one region: row MOD - 1 holds the climatology 
+    mean and standard deviation for that modified ordinal day, NaN for days the
+    timeseries does not cover.
+    
+    Args:
+        clim_ts : Dataframe with "modified_ordinal_day", "{var_name}_clim", "clim_sd"
+        var_name (str): Variable the climatology is for
+    
+    Returns:
+        np.ndarray of shape (366, 2), columns are climatology mean and standard deviation
+    
+    """
+    clim_lookup = np.full((366, 2), np.nan)
+    mod_idx = clim_ts["modified_ordinal_day"].values.astype("int64") - 1
+    clim_lookup[mod_idx, 0] = clim_ts[f"{var_name}_clim"].values
+    clim_lookup[mod_idx, 1] = clim_ts["clim_sd"].values
+    return clim_lookup
+
+
+def calc_anomaly_columns(new_ts, clim_lookup, var_name = "sst", add_stats = False):
+    """
+    Add climatology, anomaly columns to a timeseries by indexing the 
+    climatology lookup with each day's MOD, whole columns at a time.
+    
+    Args:
+        new_ts : Dataframe with time and var_name columns
+        clim_lookup : Lookup from ot.build_clim_lookup() or ot.load_clim_lookups()
+        var_name (str): Column of values
+        add_stats (bool): True to also add the z-score ({var_name}_zscore) and log-likelihood (log_lik)
+    
+    """
+    mod_idx = get_mod_values(pd.DatetimeIndex(new_ts["time"])) - 1
+    clim_mu = clim_lookup[mod_idx, 0]
+    clim_sd = clim_lookup[mod_idx, 1]
+    values  = new_ts[var_name].values
+    
+    anom_timeline = new_ts.copy()
+    anom_timeline[f"{var_name}_clim"] = clim_mu
+    anom_timeline["clim_sd"] = clim_sd
+    anom_timeline[f"{var_name}_anom"] = values - clim_mu
+    if add_stats == True:
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            anom_timeline[f"{var_name}_zscore"] = (values - clim_mu) / clim_sd
+            anom_timeline["log_lik"] = np.log(2 * np.pi * clim_sd ** 2) / 2 + (values - clim_mu) ** 2 / (2 * clim_sd ** 2)
+    return anom_timeline
+
+
+def get_clim_lookup_path(box_root, region_group):
+    """
+    Path to the stored climatology lookups of a region group
+    
+    Args:
+        box_root (str): Base location to box from either local path or docker volume
+        region_group (str): Region group from ot.get_region_names()
+    
+    """
+    return f"{box_root}RES_Data/OISST/oisst_mainstays/regional_timeseries/climatology_lookups/{region_group}_clim_lookups.npz"
+
+
+def build_clim_lookups(box_root, region_group, verbose = True):
+    """
+    Build and save the climatology lookup of every region in a group from their 
+    timeseries CSVs, reading only the climatology columns.
+    
+    Args:
+        box_root (str): Base location to box from either local path or docker volume
+        region_group (str): Region group from ot.get_region_names()
+        verbose : True or False to print progress
+    
+    """
+    region_names = get_region_names(region_group)
+    region_paths = get_timeseries_paths(box_root, region_names, region_group, polygons = False)
+    clim_lookups = {}
+    for region_name, ts_path in zip(region_names, region_paths):
+        if os.path.exists(ts_path):
+            clim_ts = pd.read_csv(ts_path, usecols = ["modified_ordinal_day", "sst_clim", "clim_sd"])
+            clim_lookups[region_name] = build_clim_lookup(clim_ts)
+    
+    lookup_path = get_clim_lookup_path(box_root, region_group)
+    os.makedirs(os.path.dirname(lookup_path), exist_ok = True)
+    np.savez(lookup_path, **clim_lookups)
+    if verbose == True:
+        print(f"Climatology lookups saved for {len(clim_lookups)} {region_group} regions")
+    return clim_lookups
+
+
+def load_clim_lookups(box_root, region_group):
+    """
+    Load the climatology lookups of a region group as a dictionary of region name to lookup
+    
+    Args:
+        box_root (str): Base location to box from either local path or docker volume
+        region_group (str): Region group from ot.get_region_names()
+    
+    """
+    with np.load(get_clim_lookup_path(box_root, region_group)) as clim_lookups:
+        return {region_name : clim_lookups[region_name] for region_name in clim_lookups.files}
+
+
+
+
+#-----------------------------------------------------
+#
+# Timeseries Region Catalog
+#
+#-----------------------------------------------------
+def get_region_names(region_group):
+  """
+  Return a consistent list of region names to use when iterating through
+  region groups for masked timeseries evaluation and updates.
+  
+  names are presented in the save-name form, without spaces or underscores.
+  
+  This function will be the access points to file path conventions, with changes here impacting 
+  loading and saving text.
+  
+  Args:
+    region_group (str): Choice of "gmri_sst_focal_areas", "lme", "nmfs_trawl_regions", "nelme_regions",
+      "gom_physio_regions"
+  
+  """
+  
+  # GROUP 1: GMRI sst focal areas
+  gmri_focal_areas = ["apershing_gulf_of_maine", "cpr_gulf_of_maine", 
+                      "aak_northwest_atlantic", "long_island_sound"]
+  
+  
+  # GROUP 2: NMFS Regions
+  nmfs_regions = ["georges_bank",         "gulf_of_maine", 
+                  "southern_new_england", "mid_atlantic_bight",
+                  "inuse_strata",         "regions_collection"]
+                  
+                  
+  # GROUP 3: NELME Regions
+  nelme_regions = ["GoM", "NELME", "SNEandMAB"]
+         
+                  
+  # GROUP 4: Large Marine Ecosystems
+  lme_regions =  ["agulhas_current",                        "aleutian_islands",                      
+                  "antarctica",                             "arabian_sea",                           
+                  "baltic_sea",                             "barents_sea",                           
+                  "bay_of_bengal",                          "beaufort_sea",                          
+                  "benguela_current",                       "black_sea",                             
+                  "california_current",                     "canadian_eastern_arctic_west_greenland",
+                  "canadian_high_arctic_north_greenland",   "canary_current",                        
+                  "caribbean_sea",                          "celtic_biscay_shelf",                   
+                  "central_arctic",                         "east_bering_sea",                       
+                  "east_brazil_shelf",                      "east_central_australian_shelf",         
+                  "east_china_sea",                         "east_siberian_sea",                     
+                  "faroe_plateau",                          "greenland_sea",                         
+                  "guinea_current",                         "gulf_of_alaska",                        
+                  "gulf_of_california",                     "gulf_of_mexico",                        
+                  "gulf_of_thailand",                       "hudson_bay_complex",                    
+                  "humboldt_current",                       "iberian_coastal",                       
+                  "iceland_shelf_and_sea",                  "indonesian_sea",                        
+                  "insular_pacific_hawaiian",               "kara_sea",                              
+                  "kuroshio_current",                       "labrador_newfoundland",                 
+                  "laptev_sea",                             "mediterranean_sea",                     
+                  "new_zealand_shelf",                      "north_australian_shelf",                
+                  "north_brazil_shelf",                     "north_sea",                             
+                  "northeast_australian_shelf",             "northeast_us_continental_shelf",        
+                  "northern_bering_chukchi_seas",           "northwest_australian_shelf",            
+                  "norwegian_sea",                          "oyashio_current",                       
+                  "pacific_central_american_coastal",       "patagonian_shelf",                      
+                  "red_sea",                                "scotian_shelf",                         
+                  "sea_of_japan",                           "sea_of_okhotsk",                        
+                  "somali_coastal_current",                 "south_brazil_shelf",                    
+                  "south_china_sea",                        "south_west_australian_shelf",           
+                  "southeast_australian_shelf",             "southeast_us_continental_shelf",        
+                  "sulu_celebes_sea",                       "west_bering_sea",                       
+                  "west_central_australian_shelf",          "yellow_sea"]     
+   
+                  
+  # GROUP 5: Gulf of Maine Physio Regions
+  gom_physio_regions = [
+     "bay_of_fundy",           "bear_seamount",          "browns_bank",            "central_gulf_of_maine", 
+     "continental_slope",      "eastern_coastal_shelf",  "georges_bank",           "georges_basin",         
+     "jordan_basin",           "kelvin_seamount",        "manning_seamount",       "northern_coastal_shelf",
+     "scotian_coastal_shelf",  "scotian_shelf",          "southern_coastal_shelf", "wikinson_basin"   
+  ]
+
+
+  # Dictionary Lookup
+  region_catalog = {"gmri_sst_focal_areas" : gmri_focal_areas, 
+                    "lme"                  : lme_regions, 
+                    "nmfs_trawl_regions"   : nmfs_regions,
+                    "nelme_regions"        : nelme_regions,
+                    "gom_physio_regions"   : gom_physio_regions}
+                    
+  # Return Selected List
+  region_selections = region_catalog[region_group]
+  return region_selections
+
+
+
+#-----------------------------------------------------
+#
+# Timeseries Path Directory
+#
+#-----------------------------------------------------
+def get_timeseries_paths(box_root, region_list, region_group, polygons = False):
+  """
+  Get the Full Path for either masked timeseries or the polygons used to 
+  create them by the group name and the base path to box.
+  
+  Also Helpful for maintaining consistency on save paths for updating
+  
+  Args:
+    box_root (str)     : String path to box for whichever user is accessing things
+    region_list        : List of region names returned from ot.get_region_names
+    region_group (str) : String indicating group of regions to look up. 
+                         Options are gmri_sst_focal_areas, lme, nmfs_trawl_regions, nelme_regions
+    polygons (bool)    : Indication of whether to look up paths
+  
+  """
+  
+  # 1. Set file structure for shapefile lookup
+  poly_root = "RES_Data/Shapefiles/"
+  
+  # How the start of the file names go 
+  if region_group == "nmfs_trawl_regions":
+    poly_start = "nmfs_trawl_"
+  else:
+    poly_start = ""
+  
+  # How the file endings go
+  poly_end = {"gmri_sst_focal_areas" : ".geojson",
+              "lme"                  : "_exterior.geojson",
+              "nmfs_trawl_regions"   : ".geojson",
+              "nelme_regions"        : "_sf.shp",
+              "gom_physio_regions"   : ".geojson"}
+  
+  # Path to different groups
+  poly_extensions = {"gmri_sst_focal_areas" : f"{box_root}{poly_root}gmri_sst_focal_areas/{poly_start}",
+                     "lme"                  : f"{box_root}{poly_root}large_marine_ecosystems/{poly_start}",
+                     "nmfs_trawl_regions"   : f"{box_root}{poly_root}nmfs_trawl_regions/{poly_start}",
+                     "nelme_regions"        : f"{box_root}{poly_root}NELME_regions/{poly_start}",
+                     "gom_physio_regions"   : f"{box_root}{poly_root}GulfOfMainePhysioRegions/single_regions/{poly_start}"}
+                     
+  
+  
+  
+  
+  # 2. Set file structure for timeseries lookup   
+  
+  # Root to the regional timeseries folder
+  ts_root = "RES_Data/OISST/oisst_mainstays/regional_timeseries/"
+  
+  # How all masked timeseries file names start
+  ts_start = "OISSTv2_anom_"
+  
+  # How they all end
+  ts_ending = ".csv"
+  
+  # Path to different groups
+  timeseries_extensions = {"gmri_sst_focal_areas" : f"{box_root}{ts_root}gmri_sst_focal_areas/{ts_start}",
+                           "lme"                  : f"{box_root}{ts_root}large_marine_ecosystems/{ts_start}",
+                           "nmfs_trawl_regions"   : f"{box_root}{ts_root}nmfs_trawl_regions/{ts_start}",
+                           "nelme_regions"        : f"{box_root}{ts_root}NELME_regions/{ts_start}",
+                           "gom_physio_regions"   : f"{box_root}{ts_root}GulfOfMainePhysioRegions/{ts_start}"}
+
+
+
+  # 3. Toggle File Start and Endings for Shapefiles or for timeseries
+  
+  # here is where specific file starts/endings get applied to different groups
+  if polygons == True:
+    leading_path = poly_extensions[region_group]
+    file_ending  = poly_end[region_group]
+  elif polygons == False:
+    leading_path = timeseries_extensions[region_group]
+    file_ending  = ts_ending
+    
+
+  # Build full paths using region_list
+  region_paths = []
+  for region_name in region_list:
+    full_region_path = f"{leading_path}{region_name}{file_ending}"
+    region_paths.append(full_region_path)
+    
+    
+  # Return all the file paths
+  return region_paths
+
+
+
+########################################################
+#########  Begin Marine Heatwave Section  ##############
+########################################################
+
+
+
+#-----------------------------------------------------
+#
+# Find Threshold Exceedance Events with Run-Lengths
+#
+#-----------------------------------------------------
+def find_events(exceed, min_duration = 5, max_gap = 2):
+  """
+  Find events in a (cells, days) boolean array of threshold exceedances, following
+  Hobday et al. (2016): runs of at least min_duration days count as events, and 
+  events separated by max_gap days or fewer are joined into one. Vectorized over 
+  all cells with run-length edges, no loop over cells.
+  
+  Args:
+    exceed : np.ndarray of bool, shape (cells, days)
+    min_duration (int): Minimum number of days over threshold for an event
+    max_gap (int): Longest gap between events that gets joined
+  
+  Returns:
+    (cell, start, end) arrays, one entry per event sorted by cell then start, end exclusive
+  
+  """
+  n_cells, n_days = exceed.shape
+  
+  # Run edges, +1 on the first day over threshold and -1 the day after the last
+  padded = np.zeros((n_cells, n_days + 2), dtype = "int8")
+  padded[:, 1:-1] = exceed
+  edges = np.diff(padded, axis = 1)
+  cell, start = np.nonzero(edges == 1)
+  end = np.nonzero(edges == -1)[1]
+  
+  # Drop short runs
+  keep = (end - start) >= min_duration
+  cell, start, end = cell[keep], start[keep], end[keep]
+  if len(cell) == 0:
+    return cell, start, end
+  
+  # Join events in the same cell separated by short gaps
+  join = (cell[1:] == cell[:-1]) & ((start[1:] - end[:-1]) <= max_gap)
+  first = np.flatnonzero(np.concatenate([[True], ~join]))
+  last  = np.concatenate([first[1:], [len(cell)]]) - 1
+  return cell[first], start[first], end[last]
+
+
+#-----------------------------------------------------
+#
+# Heatwave / Cold-Spell Events for a Block of Cells
+#
+#-----------------------------------------------------
+def detect_events(anoms, thresholds, min_duration = 5, max_gap = 2, cold_spells = False):
+  """
+  Detect marine heatwaves (or cold spells) in every cell of a (cells, days) block of 
+  anomalies, and measure each event. Intensities are anomalies from the climatological
+  mean, so thresholds should be the percentile threshold minus the climatology.
+  
+  Category follows Hobday et al. (2018): peak intensity as a multiple of the 
+  threshold anomaly on the peak day, 1 moderate, 2 strong, 3 severe, 4 extreme.
+  
+  Args:
+    anoms : np.ndarray of anomalies, shape (cells, days)
+    thresholds : np.ndarray of threshold anomalies for the same cells and days
+    min_duration (int): Minimum number of days over threshold for an event
+    max_gap (int): Longest gap between events that gets joined
+    cold_spells (bool): True to detect cold spells, anomalies below the threshold
+  
+  Returns:
+    dict of event arrays "cell", "start", "end", "max_intensity", "category", and 
+    "in_event", a (cells, days) boolean array of days inside events
+  
+  """
+  n_cells, n_days = anoms.shape
+  
+  # Days past threshold, NaN never counts
+  with np.errstate(invalid = "ignore"):
+    if cold_spells == True:
+      exceed = anoms < thresholds
+    else:
+      exceed = anoms > thresholds
+  cell, start, end = find_events(exceed, min_duration = min_duration, max_gap = max_gap)
+  
+  # Days inside events, and a running event number for each of them
+  marks = np.zeros((n_cells, n_days + 1), dtype = "int32")
+  marks[cell, start] = 1
+  marks[cell, end]   = -1
+  in_event = np.cumsum(marks, axis = 1)[:, :n_days] > 0
+  event_num = np.cumsum(marks[:, :n_days] == 1).reshape(n_cells, n_days) - 1
+  
+  events = {"cell" : cell, "start" : start, "end" : end, "in_event" : in_event}
+  if len(cell) == 0:
+    events["max_intensity"] = np.zeros(0)
+    events["category"]      = np.zeros(0, dtype = "int8")
+    return events
+  
+  # Event days in event order, each event is one contiguous group
+  event_ids  = event_num[in_event]
+  event_anom = anoms[in_event]
+  with np.errstate(invalid = "ignore", divide = "ignore"):
+    event_ratio = event_anom / thresholds[in_event]
+  group_start = np.flatnonzero(np.diff(event_ids, prepend = -1))
+  
+  # Peak intensity, and threshold multiple on the peak day
+  if cold_spells == True:
+    max_intensity = np.minimum.reduceat(event_anom, group_start)
+  else:
+    max_intensity = np.maximum.reduceat(event_anom, group_start)
+  is_peak    = event_anom == max_intensity[event_ids]
+  peak_ratio = np.maximum.reduceat(np.where(is_peak, event_ratio, -np.inf), group_start)
+  category   = np.clip(np.floor(np.nan_to_num(peak_ratio, nan = 1)), 1, 4).astype("int8")
+  
+  events["max_intensity"] = max_intensity
+  events["category"]      = category
+  return events
+
+
+#-----------------------------------------------------
+#
+# Yearly Heatwave Summary Grids from Anomaly Cubes
+#
+#-----------------------------------------------------
+def summarize_events_by_year(events, day_years, years, cold_spells = False):
+  """
+  Collapse the events of a block of cells to yearly grids. Events count towards the 
+  year they start in, days in events count towards the year they fall in.
+  
+  Args:
+    events : dict from ot.detect_events()
+    day_years : np.ndarray with the year of every day in the block
+    years : Sorted array of the years to summarize
+    cold_spells (bool): True if the events are cold spells, peak intensity is then the lowest anomaly
+  
+  Returns:
+    dict of (years, cells) arrays "events", "days", "max_intensity", "max_category"
+  
+  """
+  n_cells = events["in_event"].shape[0]
+  n_years = len(years)
+  
+  # Events by start year
+  event_yr = np.searchsorted(years, day_years[events["start"]])
+  event_idx = (event_yr, events["cell"])
+  n_events = np.zeros((n_years, n_cells), dtype = "int16")
+  np.add.at(n_events, event_idx, 1)
+  
+  # Strongest event of the year
+  sign = -1 if cold_spells == True else 1
+  peak = np.full((n_years, n_cells), -np.inf)
+  np.maximum.at(peak, event_idx, sign * events["max_intensity"])
+  max_intensity = np.where(np.isfinite(peak), sign * peak, np.nan)
+  max_category = np.zeros((n_years, n_cells), dtype = "int8")
+  np.maximum.at(max_category, event_idx, events["category"])
+  
+  # Days in events by calendar year
+  year_start = np.searchsorted(day_years, years)
+  event_days = np.add.reduceat(events["in_event"].astype("int16"), year_start, axis = 1).T
+  
+  return {"events" : n_events, "days" : event_days, 
+          "max_intensity" : max_intensity, "max_category" : max_category}
+
+
+def calc_gridded_heatwaves(box_root, start_yr, end_yr, thresholds, reference_period = "1982-2011", 
+                           cold_spells = False, min_duration = 5, max_gap = 2, lat_chunk = 10, 
+                           save = True, verbose = True):
+  """
+  Run heatwave (or cold-spell) detection on every ocean cell of the annual anomaly files,
+  one band of latitudes at a time, and return yearly grids of event counts, days in
+  events, peak intensity and peak category. Each band holds the full period, so 
+  events running across the new year are not split.
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    start_yr (int): First year to process
+    end_yr (int): Last year to process
+    thresholds : xr.DataArray of threshold anomalies (percentile threshold minus climatology)
+      by modified_ordinal_day, lat, lon, e.g. ot.load_oisst_thresholds(anomalies = True)["sst_p90"]
+    reference_period (str): Climatology the anomalies use, e.g. "1982-2011"
+    cold_spells (bool): True to detect cold spells instead of heatwaves
+    min_duration (int): Minimum number of days over threshold for an event
+    max_gap (int): Longest gap between events that gets joined
+    lat_chunk (int): Number of latitude rows to hold in memory at once
+    save (bool): Whether to save the summary NetCDF
+    verbose : True or False to print progress
+  
+  """
+  # Anomalies for the reference period, lazily
+  oisst_location = f"{box_root}RES_Data/OISST/oisst_mainstays/annual_anomalies/{reference_period.replace('-', 'to')}_climatology/"
+  fpaths = [f"{oisst_location}daily_anoms_{yr}.nc" for yr in range(int(start_yr), int(end_yr) + 1)]
+  anom_grid = xr.open_mfdataset(fpaths, combine = "by_coords")["sst"].transpose("time", "lat", "lon")
+  
+  # Threshold for every day, by MOD
+  day_mods  = get_mod_values(anom_grid.indexes["time"])
+  day_years = np.asarray(anom_grid.indexes["time"].year)
+  years     = np.arange(int(start_yr), int(end_yr) + 1)
+  thresholds = thresholds.transpose("modified_ordinal_day", "lat", "lon")
+  
+  n_lat, n_lon = anom_grid.sizes["lat"], anom_grid.sizes["lon"]
+  ocean_cells = get_ocean_cells(box_root, anom_grid["lat"].values, anom_grid["lon"].values)
+  summary = {stat : np.full((len(years), n_lat * n_lon), fill, dtype = dtype) for stat, dtype, fill in 
+             [("events", "int16", 0), ("days", "int16", 0), ("max_intensity", "float32", np.nan), ("max_category", "int8", 0)]}
+  
+  for lat_start in range(0, n_lat, lat_chunk):
+    lat_rows = slice(lat_start, min(lat_start + lat_chunk, n_lat))
+    band_cells = ocean_cells[(ocean_cells >= lat_rows.start * n_lon) & (ocean_cells < lat_rows.stop * n_lon)]
+    
+    # Ocean cells of the band as (cells, days)
+    band_anoms  = anom_grid.isel(lat = lat_rows).values
+    band_thresh = thresholds.isel(lat = lat_rows).sel(modified_ordinal_day = day_mods).values
+    band_anoms  = pack_cells(band_anoms, band_cells - lat_rows.start * n_lon).T
+    band_thresh = pack_cells(band_thresh, band_cells - lat_rows.start * n_lon).T
+    
+    # Detect and summarize
+    events = detect_events(band_anoms, band_thresh, min_duration = min_duration, 
+                           max_gap = max_gap, cold_spells = cold_spells)
+    band_summary = summarize_events_by_year(events, day_years, years, cold_spells = cold_spells)
+    for stat in summary:
+      summary[stat][:, band_cells] = band_summary[stat]
+    
+    if verbose == True:
+      print(f"Events detected for latitude rows {lat_rows.start} - {lat_rows.stop}")
+  
+  # Gridded summary
+  prefix = "mcs" if cold_spells == True else "mhw"
+  coords = {"year" : years, "lat" : anom_grid["lat"].values, "lon" : anom_grid["lon"].values}
+  dims = ("year", "lat", "lon")
+  event_grids = xr.Dataset({f"{prefix}_{stat}" : (dims, values.reshape(len(years), n_lat, n_lon)) for stat, values in summary.items()}, 
+                           coords = coords)
+  event_name = "Cold spell" if cold_spells == True else "Marine heatwave"
+  event_grids.attrs = {
+    "title"         : f"{event_name} summaries by year from NOAA OISSTv2 SST anomalies using {reference_period} Climatology",
+    "institution"   : "Gulf of Maine Research Institute",
+    "source"        : "NOAA/NCDC  ftp://eclipse.ncdc.noaa.gov/pub/OI-daily-v2/",
+    "comment"       : f"Events of at least {min_duration} days past threshold, gaps of {max_gap} days or less joined (Hobday et al. 2016)",
+    "references"    : "https://www.esrl.noaa.gov/psd/data/gridded/data.noaa.oisst.v2.highres.html",
+    "dataset_title" : f"{event_name} Summaries - OISSTv2"}
+  
+  if save == True:
+    out_folder = f"{box_root}RES_Data/OISST/oisst_mainstays/gridded_heatwaves/{reference_period.replace('-', 'to')}_climatology/"
+    os.makedirs(out_folder, exist_ok = True)
+    out_path = f"{out_folder}{prefix}_summary_{start_yr}to{end_yr}.nc"
+    event_grids.to_netcdf(out_path)
+    if verbose == True:
+      print(f"File Saved to {out_path}")
+  
+  anom_grid.close()
+  return event_grids
+
+
+
+#-----------------------------------------------------
+#
+# Percentiles that Skip Missing Values
+#
+#-----------------------------------------------------
+def calc_nan_percentiles(values, percentiles):
+  """
+  Percentiles along the first axis ignoring NaN, with the same linear interpolation
+  as np.nanpercentile() but computed for every column at once with one sort. 
+  Columns with no valid values are NaN.
+  
+  Args:
+    values : np.ndarray, samples along axis 0
+    percentiles : list of percentiles between 0 and 100
+  
+  Returns:
+    np.ndarray of shape (len(percentiles), *values.shape[1:])
+  
+  """
+  # NaN sorts to the end, so the valid values lead each column
+  sorted_vals = np.sort(values, axis = 0)
+  n_valid = np.isfinite(values).sum(axis = 0)
+  
+  results = []
+  for q in percentiles:
+    position = (n_valid - 1) * (q / 100)
+    lower = np.floor(position).astype("int64").clip(min = 0)
+    upper = np.minimum(lower + 1, np.maximum(n_valid - 1, 0))
+    frac  = position - lower
+    low_vals  = np.take_along_axis(sorted_vals, lower[None, ...], axis = 0)[0]
+    high_vals = np.take_along_axis(sorted_vals, upper[None, ...], axis = 0)[0]
+    q_vals = low_vals + (high_vals - low_vals) * frac
+    results.append(np.where(n_valid > 0, q_vals, np.nan))
+  return np.stack(results)
+
+
+
+#-----------------------------------------------------
+#
+# Percentile Threshold Climatology
+#
+#-----------------------------------------------------
+def build_oisst_thresholds(box_root, start_yr, end_yr, percentiles = [90, 10], window_half_width = 5, 
+                           lat_chunk = 10, var_name = "sst", save = True, verbose = True):
+  """
+  Build percentile thresholds by modified ordinal day for heatwave and cold-spell
+  detection, pooling every day within window_half_width days of each MOD over the 
+  reference period (Hobday et al. 2016). Quantiles are exact: the annual files are 
+  read one band of latitudes at a time, so only lat_chunk rows of the whole period 
+  are in memory at once, and only the ocean cells of each band are kept. Saved to daily_climatologies/daily_thresholds_{start_yr}to{end_yr}.nc
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    start_yr (int): First year of the reference period
+    end_yr (int): Last year of the reference period
+    percentiles : Percentiles to compute, one variable each, e.g. sst_p90
+    window_half_width (int): Days on either side of each MOD to pool
+    lat_chunk (int): Number of latitude rows to hold in memory at once
+    var_name (str): Variable to build thresholds for
+    save (bool): Whether to save the thresholds NetCDF
+    verbose : True or False to print progress
+  
+  """
+  obs_root = f"{box_root}RES_Data/OISST/oisst_mainstays/annual_observations/"
+  years = range(int(start_yr), int(end_yr) + 1)
+  obs_files = [xr.open_dataset(f"{obs_root}sst.day.mean.{yr}.v2.nc") for yr in years]
+  lat = obs_files[0]["lat"].values
+  lon = obs_files[0]["lon"].values
+  ocean_cells = get_ocean_cells(box_root, lat, lon)
+  
+  # Pool of MODs around each MOD, wrapping around the end of the year
+  mods = np.arange(1, 367)
+  window = np.arange(-window_half_width, window_half_width + 1)
+  window_idx = (mods[:, None] - 1 + window[None, :]) % 366
+  
+  thresholds = np.full((len(percentiles), len(mods), len(lat) * len(lon)), np.nan, dtype = "float32")
+  try:
+    for lat_start in range(0, len(lat), lat_chunk):
+      lat_rows = slice(lat_start, min(lat_start + lat_chunk, len(lat)))
+      
+      # Ocean cells of the band, flat and relative to the band
+      band_cells = ocean_cells[(ocean_cells >= lat_rows.start * len(lon)) & (ocean_cells < lat_rows.stop * len(lon))]
+      
+      # Every year of the band, laid out by MOD (MOD 60 stays NaN in non-leap years)
+      band = np.full((len(obs_files), len(mods), len(band_cells)), np.nan, dtype = "float32")
+      for yr_num, year_obs in enumerate(obs_files):
+        mod_idx = get_mod_values(year_obs.indexes["time"]) - 1
+        year_band = year_obs[var_name].isel(lat = lat_rows).transpose("time", "lat", "lon").values
+        band[yr_num, mod_idx, :] = pack_cells(year_band, band_cells - lat_rows.start * len(lon))
+      
+      # Exact percentiles of the pooled window, one MOD at a time
+      for mod_num in range(len(mods)):
+        pooled = band[:, window_idx[mod_num], :].reshape(-1, band.shape[2])
+        thresholds[:, mod_num, band_cells] = calc_nan_percentiles(pooled, percentiles)
+      
+      if verbose == True:
+        print(f"Thresholds calculated for latitude rows {lat_rows.start} - {lat_rows.stop}")
+  finally:
+    for year_obs in obs_files:
+      year_obs.close()
+  
+  # Threshold dataset
+  dims = ("modified_ordinal_day", "lat", "lon")
+  daily_thresholds = xr.Dataset(
+    {f"{var_name}_p{q}" : (dims, thresholds[q_num].reshape(len(mods), len(lat), len(lon))) for q_num, q in enumerate(percentiles)},
+    coords = {"modified_ordinal_day" : mods, "lat" : lat, "lon" : lon})
+  daily_thresholds.attrs = {
+    "title"         : "Percentile sea surface temperature thresholds from NOAA OISSTv2 SST Data",
+    "institution"   : "Gulf of Maine Research Institute",
+    "source"        : "NOAA/NCDC  ftp://eclipse.ncdc.noaa.gov/pub/OI-daily-v2/",
+    "comment"       : f"Percentiles of SST within {window_half_width} days of each modified ordinal day for the years {start_yr}-{end_yr}",
+    "history"       : f"Thresholds calculated {datetime.date.today().strftime('%m/%d/%Y')}",
+    "references"    : "https://www.esrl.noaa.gov/psd/data/gridded/data.noaa.oisst.v2.highres.html",
+    "dataset_title" : "GMRI Percentile Thresholds - OISST"}
+  
+  if save == True:
+    clim_root = f"{box_root}RES_Data/OISST/oisst_mainstays/daily_climatologies/"
+    os.makedirs(clim_root, exist_ok = True)
+    out_path = f"{clim_root}daily_thresholds_{start_yr}to{end_yr}.nc"
+    daily_thresholds.to_netcdf(out_path)
+    if verbose == True:
+      print(f"Saving {start_yr}-{end_yr} Thresholds")
+  
+  return daily_thresholds
+
+
+def load_oisst_thresholds(box_root, reference_period = "1982-2011", anomalies = False):
+  """
+  Load percentile thresholds built by ot.build_oisst_thresholds()
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    reference_period (str): start and end year of the thresholds linked by "-", e.g. "1982-2011"
+    anomalies (bool): True to return thresholds as anomalies from the climatology of the same
+      period, the form ot.calc_gridded_heatwaves() takes
+  
+  """
+  clim_root = f"{box_root}RES_Data/OISST/oisst_mainstays/daily_climatologies/"
+  climate_period = reference_period.replace("-", "to")
+  daily_thresholds = xr.open_dataset(f"{clim_root}daily_thresholds_{climate_period}.nc")
+  
+  if anomalies == True:
+    daily_clims = load_oisst_climatology(box_root, reference_period = reference_period)
+    daily_thresholds = daily_thresholds - daily_clims["sst"]
+  
+  return daily_thresholds
+
+
+
+########################################################
+#########  Begin Warming Trends Section  ###############
+########################################################
+
+
+
+#-----------------------------------------------------
+#
+# Annual Mean Grid for One Year
+#
+#-----------------------------------------------------
+def get_annual_path(box_root, yr, anomalies = False, reference_period = "1982-2011"):
+  """
+  Path to the annual observation or anomaly file for a year
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    yr (int): Year of the file
+    anomalies (bool): True for the anomaly file instead of observations
+    reference_period (str): Climatology the anomalies use, e.g. "1982-2011"
+  
+  """
+  if anomalies == True:
+    climate_period = reference_period.replace("-", "to")
+    return f"{box_root}RES_Data/OISST/oisst_mainstays/annual_anomalies/{climate_period}_climatology/daily_anoms_{yr}.nc"
+  return f"{box_root}RES_Data/OISST/oisst_mainstays/annual_observations/sst.day.mean.{yr}.v2.nc"
+
+
+def calc_annual_mean(box_root, yr, anomalies = False, reference_period = "1982-2011", var_name = "sst", time_chunk = 31):
+  """
+  Mean of one year of daily data for every cell, read in time chunks.
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    yr (int): Year to average
+    anomalies (bool): True to average the anomaly file instead of observations
+    reference_period (str): Climatology the anomalies use, e.g. "1982-2011"
+    var_name (str): Variable to average
+    time_chunk (int): Number of days to read into memory at once
+  
+  Returns:
+    xr.DataArray of the annual mean on lat, lon
+  
+  """
+  annual_path = get_annual_path(box_root, yr, anomalies = anomalies, reference_period = reference_period)
+  with xr.open_dataset(annual_path, chunks = {"time" : time_chunk}) as year_ds:
+    return year_ds[var_name].mean(dim = "time").load()
+
+
+
+#-----------------------------------------------------
+#
+# Percentile Rank of Grid Values
+#
+#-----------------------------------------------------
+def calc_percentile_rank(grid_values):
+  """
+  Rank every non-NaN value of a grid from low to high and scale the ranks to 0-1, 
+  the same ranking as the warming rate percentiles of 03_BASE_Warming_Trends.
+  
+  Args:
+    grid_values : np.ndarray, NaN cells stay NaN
+  
+  """
+  rank_out = np.full(grid_values.shape, np.nan)
+  valid = ~np.isnan(grid_values)
+  if valid.sum() > 1:
+    rank = grid_values[valid].argsort().argsort()
+    rank_out[valid] = rank / rank.max()
+  return rank_out
+
+
+
+#-----------------------------------------------------
+#
+# Streaming OLS Warming Trends
+#
+#-----------------------------------------------------
+def get_trends_path(box_root, start_yr, end_yr, anomalies = False):
+  """
+  Path to the warming rates NetCDF of a period in warming_rates/
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    start_yr (int): First year of the trend
+    end_yr (int): Last year of the trend
+    anomalies (bool): True for the rates of the anomalies
+  
+  """
+  out_folder = f"{box_root}RES_Data/OISST/oisst_mainstays/warming_rates/"
+  file_start = "annual_anom_warming_rates" if anomalies == True else "annual_warming_rates"
+  return f"{out_folder}{file_start}{start_yr}to{end_yr}.nc"
+
+
+def calc_warming_trends(box_root, start_yr, end_yr, anomalies = False, reference_period = "1982-2011", 
+                        var_name = "sst", min_years = 3, save = True, use_cache = False, verbose = True):
+  """
+  Per-pixel linear warming trends of annual mean SST, from closed-form least squares
+  sums accumulated one year at a time. Only the running sums (a few grids of ocean 
+  cells) are kept in memory, and each pixel is fit with the years it has data for, so cells with 
+  missing years (sea ice) still get a trend.
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    start_yr (int): First year of the trend
+    end_yr (int): Last year of the trend
+    anomalies (bool): True to fit annual mean anomalies instead of observations
+    reference_period (str): Climatology the anomalies use, e.g. "1982-2011"
+    var_name (str): Variable to fit
+    min_years (int): Fewest years a pixel needs for a trend
+    save (bool): Whether to save the trends NetCDF to warming_rates/
+    use_cache (bool): True to go through ot.cached_product(), refitting only when the
+    annual files or this function change
+    verbose : True or False to print progress
+  
+  Returns:
+    xr.Dataset with annual_warming_rate (slope, per year), intercept (at year 0, as np.polyfit),
+    slope_se, p_value, n_years, and rate_percentile
+  
+  """
+  if use_cache == True:
+    trend_kwargs = {"box_root" : box_root, "start_yr" : int(start_yr), "end_yr" : int(end_yr), "anomalies" : anomalies, 
+                    "reference_period" : reference_period, "var_name" : var_name, "min_years" : min_years, 
+                    "save" : save, "verbose" : verbose}
+    annual_paths = get_annual_paths(box_root, start_yr, end_yr, anomalies = anomalies, reference_period = reference_period)
+    return cached_product(box_root, calc_warming_trends, trend_kwargs, 
+                          input_paths = annual_paths + [get_ocean_mask_path(box_root)],
+                          output_paths = [get_trends_path(box_root, start_yr, end_yr, anomalies)] if save == True else [], 
+                          verbose = verbose)
+  
+  sums = None
+  for yr in range(int(start_yr), int(end_yr) + 1):
+    annual_mean = calc_annual_mean(box_root, yr, anomalies = anomalies, 
+                                   reference_period = reference_period, var_name = var_name)
+    if sums is None:
+      lat, lon = annual_mean["lat"].values, annual_mean["lon"].values
+      ocean_cells = get_ocean_cells(box_root, lat, lon)
+      sums = {stat : np.zeros(len(ocean_cells)) for stat in ["n", "x", "y", "xx", "xy", "yy"]}
+    
+    # x is centered on the first year to keep the sums small
+    y = pack_cells(annual_mean.transpose("lat", "lon").values, ocean_cells).astype("float64")
+    valid = np.isfinite(y)
+    y = np.where(valid, y, 0)
+    x = yr - int(start_yr)
+    sums["n"]  += valid
+    sums["x"]  += valid * x
+    sums["y"]  += y
+    sums["xx"] += valid * x ** 2
+    sums["xy"] += y * x
+    sums["yy"] += y ** 2
+    if verbose == True:
+      print(f"Trend sums accumulated for {yr}")
+  
+  # Closed form least squares for every pixel
+  n = sums["n"]
+  with np.errstate(invalid = "ignore", divide = "ignore"):
+    sxx = sums["xx"] - sums["x"] ** 2 / n
+    sxy = sums["xy"] - sums["x"] * sums["y"] / n
+    syy = sums["yy"] - sums["y"] ** 2 / n
+    slope = sxy / sxx
+    intercept = (sums["y"] - slope * sums["x"]) / n - slope * int(start_yr)
+    sse = np.maximum(syy - slope * sxy, 0)
+    slope_se = np.sqrt(sse / (n - 2) / sxx)
+    t_stat = slope / slope_se
+  p_value = 2 * stats.t.sf(np.abs(t_stat), np.maximum(n - 2, 1))
+  
+  # Not enough years
+  too_few = n < max(min_years, 3)
+  for grid in [slope, intercept, slope_se, p_value]:
+    grid[too_few] = np.nan
+  
+  # Back onto the grid
+  slope, intercept, slope_se, p_value = [unpack_cells(grid, ocean_cells, len(lat), len(lon)) 
+                                         for grid in [slope, intercept, slope_se, p_value]]
+  n = unpack_cells(n, ocean_cells, len(lat), len(lon), fill_value = 0)
+  
+  # Trend dataset
+  dims = ("lat", "lon")
+  trends_ds = xr.Dataset({"annual_warming_rate" : (dims, slope.astype("float32")),
+                          "intercept"           : (dims, intercept.astype("float32")),
+                          "slope_se"            : (dims, slope_se.astype("float32")),
+                          "p_value"             : (dims, p_value.astype("float32")),
+                          "n_years"             : (dims, n.astype("int16")),
+                          "rate_percentile"     : (dims, calc_percentile_rank(slope).astype("float32"))},
+                         coords = {"lat" : lat, "lon" : lon})
+  observation_type = "anomalies" if anomalies == True else "observed"
+  trends_ds.attrs = {
+    "title"            : "Annual sea surface temperature warming rates from NOAA OISSTv2 SST Data",
+    "institution"      : "Gulf of Maine Research Institute",
+    "source"           : "NOAA/NCDC  ftp://eclipse.ncdc.noaa.gov/pub/OI-daily-v2/",
+    "comment"          : f"{observation_type} sea surface temperature averaged by year prior to use in linear regression for warming rates. Warming rates processed at level of individual pixels using the years with data. Warming rate percentile is the ranking of low-high warming rate of an individual cell divided by total number of cells ranked to range 0-1.",
+    "history"          : f"Warming rates calculated {datetime.date.today().strftime('%m/%d/%Y')}",
+    "references"       : "https://www.esrl.noaa.gov/psd/data/gridded/data.noaa.oisst.v2.highres.html",
+    "dataset_title"    : "GMRI Sea Surface Warming Rates and Rankings - OISST",
+    "reference_period" : f"Rates and ranks calculated using years {start_yr} to {end_yr}"}
+  
+  if save == True:
+    out_path = get_trends_path(box_root, start_yr, end_yr, anomalies)
+    os.makedirs(os.path.dirname(out_path), exist_ok = True)
+    trends_ds.to_netcdf(out_path)
+    if verbose == True:
+      print(f"Warming rates of {observation_type} sst saved for reference period: {start_yr} to {end_yr}")
+  
+  return trends_ds
+
+
+
+#-----------------------------------------------------
+#
+# Theil-Sen Slope and Mann-Kendall Test for a Tile
+#
+#-----------------------------------------------------
+def calc_sen_mk_tile(values, years):
+  """
+  Theil-Sen slope and Mann-Kendall trend test for a tile of pixels, from every 
+  pairwise difference between years at once. Pairs with a missing year are skipped.
+  
+  The Mann-Kendall variance is n(n-1)(2n+5)/18 less the usual correction for tied 
+  groups, sum t(t-1)(2t+5)/18 over groups of t equal values.
+  
+  Args:
+    values : np.ndarray of annual means, shape (cells, years)
+    years : np.ndarray of the years, one per column
+  
+  Returns:
+    dict of per-cell arrays "sen_slope", "mk_s", "mk_z", "mk_p_value", "n_years"
+  
+  """
+  values = values.astype("float64")
+  years  = np.asarray(years, dtype = "float64")
+  first, second = np.triu_indices(len(years), k = 1)
+  
+  # Every pairwise difference, NaN where either year is missing
+  pair_diffs  = values[:, second] - values[:, first]
+  pair_slopes = pair_diffs / (years[second] - years[first])
+  
+  # Theil-Sen slope, median of the pairwise slopes
+  sen_slope = calc_nan_percentiles(pair_slopes.T, [50])[0]
+  
+  # Tied group size of every value, 1 + the pairs it ties in
+  pair_years = np.zeros((len(first), len(years)))
+  pair_years[np.arange(len(first)), first]  = 1
+  pair_years[np.arange(len(first)), second] = 1
+  tie_size = 1 + (pair_diffs == 0).astype("float64") @ pair_years
+  tie_term = np.sum((tie_size - 1) * (2 * tie_size + 5), axis = 1)
+  
+  # Mann-Kendall S, its variance and the normal approximation
+  n = np.isfinite(values).sum(axis = 1).astype("float64")
+  mk_s = np.nansum(np.sign(pair_diffs), axis = 1)
+  mk_var = (n * (n - 1) * (2 * n + 5) - tie_term) / 18
+  with np.errstate(invalid = "ignore", divide = "ignore"):
+    mk_z = np.where(mk_s > 0, mk_s - 1, np.where(mk_s < 0, mk_s + 1, 0)) / np.sqrt(mk_var)
+  mk_p_value = 2 * stats.norm.sf(np.abs(mk_z))
+  
+  return {"sen_slope" : sen_slope, "mk_s" : mk_s, "mk_z" : mk_z, 
+          "mk_p_value" : mk_p_value, "n_years" : n}
+
+
+def calc_robust_trends(box_root, start_yr, end_yr, anomalies = False, reference_period = "1982-2011", 
+                       var_name = "sst", tile_size = 20000, n_workers = 1, min_years = 4, 
+                       save = True, verbose = True):
+  """
+  Per-pixel Theil-Sen warming rates and Mann-Kendall significance of annual mean SST.
+  Only ocean cells with enough years are kept, and they are processed in tiles of tile_size pixels
+  with ot.calc_sen_mk_tile(), optionally spread over n_workers processes.
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    start_yr (int): First year of the trend
+    end_yr (int): Last year of the trend
+    anomalies (bool): True to use annual mean anomalies instead of observations
+    reference_period (str): Climatology the anomalies use, e.g. "1982-2011"
+    var_name (str): Variable to fit
+    tile_size (int): Number of pixels per tile, memory per tile is about tile_size * years^2 * 8 bytes
+    n_workers (int): Number of processes to spread tiles over, 1 runs in this process
+    min_years (int): Fewest years a pixel needs for a trend
+    save (bool): Whether to save the trends NetCDF to warming_rates/
+    verbose : True or False to print progress
+  
+  """
+  # Annual mean cube, years x lat x lon
+  years = np.arange(int(start_yr), int(end_yr) + 1)
+  annual_means = [calc_annual_mean(box_root, yr, anomalies = anomalies, 
+                                   reference_period = reference_period, var_name = var_name) for yr in years]
+  lat, lon = annual_means[0]["lat"].values, annual_means[0]["lon"].values
+  ocean_cells = get_ocean_cells(box_root, lat, lon)
+  annual_cube = np.stack([pack_cells(annual_mean.transpose("lat", "lon").values, ocean_cells) 
+                          for annual_mean in annual_means]).T
+  
+  # Cells with enough years, as positions in the packed cube
+  cells = np.flatnonzero(np.isfinite(annual_cube).sum(axis = 1) >= min_years)
+  tiles = [annual_cube[cells[i : i + tile_size]] for i in range(0, len(cells), tile_size)]
+  
+  # Run the tiles
+  if n_workers > 1:
+    with ProcessPoolExecutor(max_workers = n_workers) as pool:
+      tile_results = list(pool.map(calc_sen_mk_tile, tiles, [years] * len(tiles)))
+  else:
+    tile_results = [calc_sen_mk_tile(tile, years) for tile in tiles]
+  if verbose == True:
+    print(f"Theil-Sen slopes calculated for {len(cells)} cells in {len(tiles)} tiles")
+  
+  # Back onto the grid
+  dims = ("lat", "lon")
+  trend_grids = {}
+  for stat in ["sen_slope", "mk_s", "mk_z", "mk_p_value", "n_years"]:
+    grid = np.full(len(lat) * len(lon), np.nan)
+    if len(tile_results) > 0:
+      grid[ocean_cells[cells]] = np.concatenate([tile_result[stat] for tile_result in tile_results])
+    trend_grids[stat] = (dims, grid.reshape(len(lat), len(lon)).astype("float32"))
+  trends_ds = xr.Dataset(trend_grids, coords = {"lat" : lat, "lon" : lon})
+  trends_ds["rate_percentile"] = (dims, calc_percentile_rank(trends_ds["sen_slope"].values).astype("float32"))
+  
+  observation_type = "anomalies" if anomalies == True else "observed"
+  trends_ds.attrs = {
+    "title"            : "Annual sea surface temperature Theil-Sen warming rates from NOAA OISSTv2 SST Data",
+    "institution"      : "Gulf of Maine Research Institute",
+    "source"           : "NOAA/NCDC  ftp://eclipse.ncdc.noaa.gov/pub/OI-daily-v2/",
+    "comment"          : f"{observation_type} sea surface temperature averaged by year. Warming rates are the Theil-Sen median of pairwise slopes, significance from the Mann-Kendall test (normal approximation, tie corrected variance), by pixel.",
+    "history"          : f"Warming rates calculated {datetime.date.today().strftime('%m/%d/%Y')}",
+    "references"       : "https://www.esrl.noaa.gov/psd/data/gridded/data.noaa.oisst.v2.highres.html",
+    "dataset_title"    : "GMRI Sea Surface Robust Warming Rates - OISST",
+    "reference_period" : f"Rates and ranks calculated using years {start_yr} to {end_yr}"}
+  
+  if save == True:
+    out_folder = f"{box_root}RES_Data/OISST/oisst_mainstays/warming_rates/"
+    os.makedirs(out_folder, exist_ok = True)
+    file_start = "annual_anom_sen_slopes" if anomalies == True else "annual_sen_slopes"
+    out_path = f"{out_folder}{file_start}{start_yr}to{end_yr}.nc"
+    trends_ds.to_netcdf(out_path)
+    if verbose == True:
+      print(f"Theil-Sen warming rates of {observation_type} sst saved for reference period: {start_yr} to {end_yr}")
+  
+  return trends_ds
+
+
+
+########################################################
+#########  Begin Derived Means Section  ################
+########################################################
+
+
+
+#-----------------------------------------------------
+#
+# Monthly / Annual Mean Product Paths
+#
+#-----------------------------------------------------
+def get_means_path(box_root, product = "annual", anomalies = False, reference_period = "1982-2011"):
+  """
+  Path to the monthly or annual mean product
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    product (str): "monthly" or "annual"
+    anomalies (bool): True for means of the anomalies instead of observations
+    reference_period (str): Climatology the anomalies use, e.g. "1982-2011"
+  
+  """
+  means_root = f"{box_root}RES_Data/OISST/oisst_mainstays/derived_means/"
+  if anomalies == True:
+    means_root = f"{means_root}{reference_period.replace('-', 'to')}_climatology/"
+  return f"{means_root}{product}_means.nc"
+
+
+def load_mean_product(box_root, product = "annual", anomalies = False, reference_period = "1982-2011"):
+  """
+  Open the monthly or annual mean cube maintained by ot.update_mean_products(), with
+  the mean and n_days, the number of valid days behind each mean.
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    product (str): "monthly" or "annual"
+    anomalies (bool): True for means of the anomalies instead of observations
+    reference_period (str): Climatology the anomalies use, e.g. "1982-2011"
+  
+  """
+  return xr.open_dataset(get_means_path(box_root, product, anomalies, reference_period))
+
+
+
+#-----------------------------------------------------
+#
+# Write One Time Slot of a Mean Product
+#
+#-----------------------------------------------------
+def open_means_file(means_path, lat, lon, var_name = "sst"):
+  """
+  Open a mean product for writing with netCDF4, creating it if needed. Time is 
+  unlimited so new months and years are added without rewriting the file.
+  
+  Args:
+    means_path (str): Path from ot.get_means_path()
+    lat : Latitude values of the grid
+    lon : Longitude values of the grid
+    var_name (str): Variable the means are for
+  
+  """
+  if os.path.exists(means_path):
+    return netCDF4.Dataset(means_path, mode = "a")
+  
+  os.makedirs(os.path.dirname(means_path), exist_ok = True)
+  means_nc = netCDF4.Dataset(means_path, mode = "w")
+  means_nc.createDimension("time", None)
+  means_nc.createDimension("lat", len(lat))
+  means_nc.createDimension("lon", len(lon))
+  time_var = means_nc.createVariable("time", "f8", ("time",))
+  time_var.units    = "days since 1800-01-01"
+  time_var.calendar = "standard"
+  lat_var = means_nc.createVariable("lat", "f4", ("lat",))
+  lat_var.units = "degrees_north"
+  lat_var[:] = lat
+  lon_var = means_nc.createVariable("lon", "f4", ("lon",))
+  lon_var.units = "degrees_east"
+  lon_var[:] = lon
+  grid_dims = ("time", "lat", "lon")
+  means_nc.createVariable(var_name, "f4", grid_dims, zlib = True, chunksizes = (1, len(lat), len(lon)), fill_value = np.float32(np.nan))
+  means_nc.createVariable("n_days", "i2", grid_dims, zlib = True, chunksizes = (1, len(lat), len(lon)), fill_value = np.int16(-1))
+  means_nc.institution = "Gulf of Maine Research Institute"
+  means_nc.source = "NOAA/NCDC  ftp://eclipse.ncdc.noaa.gov/pub/OI-daily-v2/"
+  return means_nc
+
+
+def write_means_slot(means_nc, slot, slot_times, mean_grid, n_grid, var_name = "sst"):
+  """
+  Write one month or year into a mean product, filling in the time axis up to it so
+  the axis stays regular and sorted. Slots never written stay missing.
+  
+  Args:
+    means_nc : netCDF4.Dataset from ot.open_means_file()
+    slot (int): Time index to write
+    slot_times : Function returning the datetime of a time index
+    mean_grid : np.ndarray of means on lat, lon
+    n_grid : np.ndarray of valid-day counts on lat, lon
+    var_name (str): Variable the means are for
+  
+  """
+  time_var = means_nc.variables["time"]
+  for time_idx in range(len(time_var), slot + 1):
+    time_var[time_idx] = netCDF4.date2num(slot_times(time_idx), time_var.units, time_var.calendar)
+  means_nc.variables[var_name][slot, :, :] = np.ma.masked_invalid(mean_grid.astype("float32"))
+  means_nc.variables["n_days"][slot, :, :] = n_grid.astype("int16")
+
+
+
+#-----------------------------------------------------
+#
+# Update Monthly and Annual Means Incrementally
+#
+#-----------------------------------------------------
+def update_mean_products(box_root, update_yr, months = None, anomalies = False, reference_period = "1982-2011", 
+                         var_name = "sst", origin_yr = 1981, verbose = True):
+  """
+  Recompute the monthly means for the given months of a year from its annual file, 
+  reading only those months, then roll the year's monthly means into its annual mean.
+  Months and years are stored at fixed time slots counted from origin_yr, so updates 
+  overwrite their own slots only.
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    update_yr (int): Year that was updated
+    months : List of months (1-12) that changed, None for every month in the annual file
+    anomalies (bool): True to update means of the anomalies instead of observations
+    reference_period (str): Climatology the anomalies use, e.g. "1982-2011"
+    var_name (str): Variable to average
+    origin_yr (int): Year of the first time slot
+    verbose : True or False to print progress
+  
+  """
+  update_yr = int(update_yr)
+  monthly_times = lambda idx: datetime.datetime(origin_yr + idx // 12, idx % 12 + 1, 1)
+  annual_times  = lambda idx: datetime.datetime(origin_yr + idx, 1, 1)
+  annual_path = get_annual_path(box_root, update_yr, anomalies = anomalies, reference_period = reference_period)
+  
+  with xr.open_dataset(annual_path) as year_ds:
+    lat, lon = year_ds["lat"].values, year_ds["lon"].values
+    day_months = year_ds.indexes["time"].month
+    if months is None:
+      months = sorted(set(day_months))
+    
+    # Monthly means, reading one month of days at a time
+    monthly_nc = open_means_file(get_means_path(box_root, "monthly", anomalies, reference_period), lat, lon, var_name)
+    try:
+      for month in [int(m) for m in months]:
+        month_days = np.flatnonzero(day_months == month)
+        if len(month_days) == 0:
+          continue
+        month_vals = year_ds[var_name].isel(time = slice(month_days[0], month_days[-1] + 1)).values
+        n_grid = np.isfinite(month_vals).sum(axis = 0)
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+          mean_grid = np.nansum(month_vals, axis = 0) / n_grid
+        slot = (update_yr - origin_yr) * 12 + month - 1
+        write_means_slot(monthly_nc, slot, monthly_times, mean_grid, n_grid, var_name)
+        if verbose == True:
+          print(f"Monthly mean updated for {update_yr}-{str(month).rjust(2, '0')}")
+      
+      # The year's monthly means, weighted by their valid days
+      year_slots = slice((update_yr - origin_yr) * 12, min((update_yr - origin_yr + 1) * 12, len(monthly_nc.variables["time"])))
+      month_means = np.ma.filled(monthly_nc.variables[var_name][year_slots].astype("float64"), np.nan)
+      month_counts = np.ma.filled(monthly_nc.variables["n_days"][year_slots], 0).astype("float64")
+    finally:
+      monthly_nc.close()
+  
+  # Annual mean from the monthly sums
+  n_grid = month_counts.sum(axis = 0)
+  with np.errstate(invalid = "ignore", divide = "ignore"):
+    mean_grid = np.nansum(month_means * month_counts, axis = 0) / n_grid
+  annual_nc = open_means_file(get_means_path(box_root, "annual", anomalies, reference_period), lat, lon, var_name)
+  try:
+    write_means_slot(annual_nc, update_yr - origin_yr, annual_times, mean_grid, n_grid, var_name)
+  finally:
+    annual_nc.close()
+  if verbose == True:
+    print(f"Annual mean updated for {update_yr}")
+
+
+def build_mean_products(box_root, start_yr, end_yr, anomalies = False, reference_period = "1982-2011", 
+                        var_name = "sst", verbose = True):
+  """
+  Backfill the monthly and annual mean products for a range of years
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    start_yr (int): First year to add
+    end_yr (int): Last year to add
+    anomalies (bool): True for means of the anomalies instead of observations
+    reference_period (str): Climatology the anomalies use, e.g. "1982-2011"
+    var_name (str): Variable to average
+    verbose : True or False to print progress
+  
+  """
+  for yr in range(int(start_yr), int(end_yr) + 1):
+    update_mean_products(box_root, yr, months = None, anomalies = anomalies, 
+                         reference_period = reference_period, var_name = var_name, verbose = verbose)
+
+
+
+########################################################
+#########  Begin Zarr Store Section  ###################
+########################################################
+
+
+
+#-----------------------------------------------------
+#
+# Zarr Store Paths and Chunking
+#
+#-----------------------------------------------------
+def get_zarr_store_path(box_root, layout = "map", anomalies = False, reference_period = "1982-2011"):
+  """
+  Path to a consolidated Zarr store of the full daily record
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    layout (str): "map" for stores chunked by day, "timeseries" for stores chunked by location
+    anomalies (bool): True for the anomaly store instead of observations
+    reference_period (str): Climatology the anomalies use, e.g. "1982-2011"
+  
+  """
+  store_root = f"{box_root}RES_Data/OISST/oisst_mainstays/zarr_stores/"
+  if anomalies == True:
+    return f"{store_root}daily_anoms_{reference_period.replace('-', 'to')}_climatology_{layout}.zarr"
+  return f"{store_root}sst_daily_{layout}.zarr"
+
+
+def get_zarr_chunks(layout, n_lat, n_lon):
+  """
+  Chunk sizes for each store layout. Map stores hold a month of full grids per chunk
+  so a map reads few chunks, timeseries stores hold four years of a 20x20 cell block 
+  so a pixel's full record reads one chunk per four years.
+  
+  Args:
+    layout (str): "map" or "timeseries"
+    n_lat (int): Number of latitudes in the grid
+    n_lon (int): Number of longitudes in the grid
+  
+  """
+  if layout == "map":
+    return {"time" : 31, "lat" : n_lat, "lon" : n_lon}
+  elif layout == "timeseries":
+    return {"time" : 1461, "lat" : min(20, n_lat), "lon" : min(20, n_lon)}
+  raise ValueError(f"Unknown zarr layout: {layout}, use 'map' or 'timeseries'")
+
+
+
+#-----------------------------------------------------
+#
+# Day Checksums and Chunk-Aligned Writes
+#
+#-----------------------------------------------------
+def get_day_checksum(day_values):
+  """
+  md5 checksum of one day's grid as float32, used to tell which days of a year 
+  changed since they were written to a Zarr store
+  
+  Args:
+    day_values : Array of one day, lat x lon
+  
+  """
+  return hashlib.md5(np.ascontiguousarray(day_values, dtype = "float32").tobytes()).hexdigest()
+
+
+def get_zarr_checksum_path(store_path):
+  """
+  Path of the day checksums for a Zarr store, a json file next to the store folder 
+  rather than inside it so zarr does not read it as part of the hierarchy
+  
+  Args:
+    store_path (str): Path to the store from ot.get_zarr_store_path()
+  
+  """
+  return f"{os.path.splitext(store_path.rstrip('/'))[0]}_day_checksums.json"
+
+
+def load_zarr_checksums(store_path):
+  """
+  Day checksums of a Zarr store. Stores written before the checksums moved next to
+  the store still have them in day_checksums.json inside the store folder, that copy
+  is read when there is no file next to the store.
+  
+  Args:
+    store_path (str): Path to the store from ot.get_zarr_store_path()
+  
+  """
+  for checksum_path in [get_zarr_checksum_path(store_path), f"{store_path}/day_checksums.json"]:
+    if os.path.exists(checksum_path):
+      with open(checksum_path, "r") as f:
+        return json.load(f)
+  return {}
+
+
+def save_zarr_checksums(store_path, day_sums):
+  """
+  Write the day checksums of a Zarr store, replacing the old copy in one step
+  
+  Args:
+    store_path (str): Path to the store from ot.get_zarr_store_path()
+    day_sums (dict): Checksums keyed by "YYYYMMDD"
+  
+  """
+  checksum_path = get_zarr_checksum_path(store_path)
+  tmp_file = f"{checksum_path}.part"
+  with open(tmp_file, "w") as f:
+    json.dump(day_sums, f, sort_keys = True)
+  os.replace(tmp_file, checksum_path)
+  
+  # Drop the copy older stores kept inside the store folder
+  old_path = f"{store_path}/day_checksums.json"
+  if os.path.exists(old_path):
+    os.remove(old_path)
+
+
+def get_write_blocks(store_idx, time_chunk):
+  """
+  Split store time positions into contiguous runs that do not cross a chunk 
+  boundary along time, so each write covers whole chunks or part of one chunk.
+  
+  Args:
+    store_idx : Sorted time positions in the store to write
+    time_chunk (int): Chunk length along time
+  
+  Returns:
+    List of (start, stop) positions
+  
+  """
+  blocks = []
+  for idx in store_idx:
+    if len(blocks) > 0 and blocks[-1][1] == idx and idx % time_chunk != 0:
+      blocks[-1][1] = idx + 1
+    else:
+      blocks.append([idx, idx + 1])
+  return [tuple(block) for block in blocks]
+
+
+
+#-----------------------------------------------------
+#
+# Write a Year Into the Zarr Stores
+#
+#-----------------------------------------------------
+def update_zarr_store(box_root, update_yr, anomalies = False, reference_period = "1982-2011", 
+                      var_name = "sst", date_ids = None, verbose = True):
+  """
+  Sync one year of the annual files into the map Zarr store. The first year written 
+  creates the store, after that only days that are new or whose values changed are 
+  written: new days are appended along time and changed days are overwritten in place.
+  The store keeps an md5 checksum per day in a json file next to it (see 
+  ot.get_zarr_checksum_path()) to compare against. Years need to be added in order, a 
+  year that would land before the end of the store raises a ValueError.
+  
+  Only the map layout is synced. Its chunks are a month of days, so a weekly sync 
+  rewrites one or two chunks per variable. A timeseries chunk holds four years, so 
+  that layout is made from the map store with ot.rechunk_zarr_store() when it needs 
+  refreshing rather than on every sync.
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    update_yr (int): Year to write
+    anomalies (bool): True to write the anomaly store instead of observations
+    reference_period (str): Climatology the anomalies use, e.g. "1982-2011"
+    var_name (str): Variable to store
+    date_ids : "YYYYMMDD" days known to have changed (e.g. from the cache manifest), only 
+      these and days not yet in the store are checked. None checks every day of the year.
+    verbose : True or False to print progress
+  
+  Returns:
+    Path of the map store
+  
+  """
+  annual_path = get_annual_path(box_root, update_yr, anomalies = anomalies, reference_period = reference_period)
+  
+  with xr.open_dataset(annual_path) as year_ds:
+    year_ds  = year_ds[[var_name]].reset_coords(drop = True)
+    n_lat, n_lon = year_ds.sizes["lat"], year_ds.sizes["lon"]
+    year_days = [pd.Timestamp(t).to_pydatetime() for t in year_ds["time"].values]
+    day_ids   = [f"{d.year:04d}{d.month:02d}{d.day:02d}" for d in year_days]
+    day_sums  = {}
+    
+    store_path = get_zarr_store_path(box_root, "map", anomalies, reference_period)
+    chunks     = get_zarr_chunks("map", n_lat, n_lon)
+    
+    ####  New store, written from the year with xarray
+    if not os.path.exists(store_path):
+      os.makedirs(os.path.dirname(store_path), exist_ok = True)
+      new_ds = year_ds.copy()
+      for var in new_ds.variables:
+        new_ds[var].encoding = {}
+      encoding = {var_name : {"chunks" : tuple(chunks[d] for d in new_ds[var_name].dims), "dtype" : "float32"},
+                  "time"   : {"units" : "days since 1800-01-01", "calendar" : "standard", "dtype" : "float64"}}
+      new_ds.chunk(chunks).to_zarr(store_path, mode = "w", encoding = encoding, consolidated = True)
+      
+      # Checksums of every day for the next sync
+      for block_start in range(0, len(day_ids), chunks["time"]):
+        block_vals = year_ds[var_name].isel(time = slice(block_start, block_start + chunks["time"])).values
+        for day_num, day_vals in enumerate(block_vals):
+          day_sums[day_ids[block_start + day_num]] = get_day_checksum(day_vals)
+      save_zarr_checksums(store_path, {day_id : day_sums[day_id] for day_id in day_ids})
+      if verbose == True:
+        print(f"Zarr map store created from {update_yr} at {store_path}")
+      return store_path
+    
+    ####  Existing store, overwrite and append in place
+    zarr_store = zarr.open_group(store_path, mode = "a")
+    time_arr   = zarr_store["time"]
+    time_units = time_arr.attrs["units"]
+    calendar   = time_arr.attrs.get("calendar", "standard")
+    stored     = netCDF4.num2date(time_arr[:], time_units, calendar)
+    stored     = {(d.year, d.month, d.day) : i for i, d in enumerate(stored)}
+    n_stored   = len(stored)
+    
+    # The year has to line up with the days already stored, or start at the end
+    first_day = year_days[0]
+    start_idx = stored.get((first_day.year, first_day.month, first_day.day), n_stored)
+    if start_idx == n_stored and n_stored > 0 and (first_day.year, first_day.month, first_day.day) < max(stored):
+      raise ValueError(f"{update_yr} is before the end of {store_path}, rebuild it with ot.build_zarr_store()")
+    for day_num, day in enumerate(year_days):
+      day_idx = stored.get((day.year, day.month, day.day))
+      if (day_idx is None and start_idx + day_num < n_stored) or (day_idx is not None and day_idx != start_idx + day_num):
+        raise ValueError(f"{update_yr} does not line up with {store_path}, rebuild it with ot.build_zarr_store()")
+    
+    # Days to check: the ones flagged as changed plus any not stored yet
+    store_sums = load_zarr_checksums(store_path)
+    check_days = [day_num for day_num, day_id in enumerate(day_ids) 
+                  if date_ids is None or day_id in date_ids or start_idx + day_num >= n_stored]
+    
+    # Checksums of those days, read a time chunk at a time
+    for block_start, block_end in get_write_blocks(check_days, chunks["time"]):
+      missing = [day_num for day_num in range(block_start, block_end) if day_ids[day_num] not in day_sums]
+      if len(missing) > 0:
+        block_vals = year_ds[var_name].isel(time = slice(block_start, block_end)).values
+        for day_num in missing:
+          day_sums[day_ids[day_num]] = get_day_checksum(block_vals[day_num - block_start])
+    write_days = [day_num for day_num in check_days 
+                  if start_idx + day_num >= n_stored or store_sums.get(day_ids[day_num]) != day_sums[day_ids[day_num]]]
+    
+    if len(write_days) == 0:
+      if verbose == True:
+        print(f"Zarr map store already up to date for {update_yr}")
+      return store_path
+    
+    # Grow along time
+    var_arr = zarr_store[var_name]
+    new_len = max(n_stored, start_idx + len(year_days))
+    if new_len > n_stored:
+      time_arr.resize((new_len,))
+      var_arr.resize((new_len,) + var_arr.shape[1:])
+      time_arr[n_stored : new_len] = netCDF4.date2num(year_days[n_stored - start_idx :], time_units, calendar)
+    
+    # Write chunk-aligned blocks
+    store_idx = [start_idx + day_num for day_num in write_days]
+    for store_start, store_stop in get_write_blocks(store_idx, chunks["time"]):
+      year_slice = slice(store_start - start_idx, store_stop - start_idx)
+      block_vals = year_ds[var_name].isel(time = year_slice).values.astype("float32")
+      var_arr[store_start : store_stop, :, :] = block_vals
+    
+    zarr.consolidate_metadata(store_path)
+    for day_num in write_days:
+      store_sums[day_ids[day_num]] = day_sums[day_ids[day_num]]
+    save_zarr_checksums(store_path, store_sums)
+    
+    if verbose == True:
+      print(f"Zarr map store updated with {len(write_days)} days of {update_yr}, {new_len - n_stored} new")
+  
+  return store_path
+
+
+
+#-----------------------------------------------------
+#
+# Build the Zarr Stores
+#
+#-----------------------------------------------------
+def rechunk_zarr_store(box_root, anomalies = False, reference_period = "1982-2011", var_name = "sst", 
+                       band_rows = 120, verbose = True):
+  """
+  Build the timeseries store from the map store. Days are copied in slabs of one 
+  timeseries chunk along time by band_rows latitudes, so every timeseries chunk is 
+  written once. A slab of 120 rows is about 1GB on the 720 x 1440 grid. An existing 
+  timeseries store is replaced. ot.update_zarr_store() only keeps the map store in 
+  sync, run this after the map store is updated to refresh the timeseries store.
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    anomalies (bool): True for the anomaly stores instead of observations
+    reference_period (str): Climatology the anomalies use, e.g. "1982-2011"
+    var_name (str): Variable to store
+    band_rows (int): Latitudes copied at a time, rounded to whole timeseries chunks
+    verbose : True or False to print progress
+  
+  """
+  map_path = get_zarr_store_path(box_root, "map", anomalies, reference_period)
+  ts_path  = get_zarr_store_path(box_root, "timeseries", anomalies, reference_period)
+  if os.path.exists(ts_path):
+    shutil.rmtree(ts_path)
+  
+  with xr.open_zarr(map_path, consolidated = True) as map_ds:
+    map_ds = map_ds[[var_name]]
+    n_time, n_lat, n_lon = map_ds.sizes["time"], map_ds.sizes["lat"], map_ds.sizes["lon"]
+    chunks = get_zarr_chunks("timeseries", n_lat, n_lon)
+    
+    # Empty store with the coordinates, the data is copied below
+    new_ds = map_ds.copy()
+    for var in new_ds.variables:
+      new_ds[var].encoding = {}
+    encoding = {var_name : {"chunks" : tuple(chunks[d] for d in new_ds[var_name].dims), "dtype" : "float32"},
+                "time"   : {"units" : "days since 1800-01-01", "calendar" : "standard", "dtype" : "float64"}}
+    new_ds.chunk(chunks).to_zarr(ts_path, mode = "w", encoding = encoding, compute = False, consolidated = True)
+    
+    # Copy slabs of whole chunks
+    ts_store  = zarr.open_group(ts_path, mode = "a")
+    ts_arr    = ts_store[var_name]
+    lat_rows  = max(1, band_rows // chunks["lat"]) * chunks["lat"]
+    for time_start in range(0, n_time, chunks["time"]):
+      time_slice = slice(time_start, min(time_start + chunks["time"], n_time))
+      for lat_start in range(0, n_lat, lat_rows):
+        lat_slice = slice(lat_start, min(lat_start + lat_rows, n_lat))
+        ts_arr[time_slice, lat_slice, :] = map_ds[var_name].isel(time = time_slice, lat = lat_slice).values.astype("float32")
+      if verbose == True:
+        print(f"Timeseries store filled through day {time_slice.stop} of {n_time}")
+    
+    zarr.consolidate_metadata(ts_path)
+    save_zarr_checksums(ts_path, load_zarr_checksums(map_path))
+
+
+def build_zarr_store(box_root, start_yr, end_yr, anomalies = False, reference_period = "1982-2011", 
+                     layouts = ["map", "timeseries"], var_name = "sst", verbose = True):
+  """
+  Build the Zarr stores from the annual files, one year at a time in order. Existing 
+  stores and their checksums are removed first. Years are always written to the map 
+  store, the timeseries store is then rechunked from it with ot.rechunk_zarr_store() 
+  when it is one of the layouts asked for.
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    start_yr (int): First year of the store
+    end_yr (int): Last year of the store
+    anomalies (bool): True to build the anomaly store instead of observations
+    reference_period (str): Climatology the anomalies use, e.g. "1982-2011"
+    layouts (list): Store layouts to build, see ot.get_zarr_chunks()
+    var_name (str): Variable to store
+    verbose : True or False to print progress
+  
+  """
+  for layout in ["map", "timeseries"]:
+    store_path = get_zarr_store_path(box_root, layout, anomalies, reference_period)
+    if os.path.exists(store_path):
+      shutil.rmtree(store_path)
+    if os.path.exists(get_zarr_checksum_path(store_path)):
+      os.remove(get_zarr_checksum_path(store_path))
+  
+  for yr in range(int(start_yr), int(end_yr) + 1):
+    update_zarr_store(box_root, yr, anomalies = anomalies, reference_period = reference_period, 
+                      var_name = var_name, verbose = verbose)
+  
+  if "timeseries" in layouts:
+    rechunk_zarr_store(box_root, anomalies = anomalies, reference_period = reference_period, 
+                       var_name = var_name, verbose = verbose)
+
+
+
+########################################################
+#########  Begin Point Extraction Section  #############
+########################################################
+
+
+
+#-----------------------------------------------------
+#
+# Time-Major Point Store
+#
+#-----------------------------------------------------
+def get_point_store_paths(box_root, anomalies = False, reference_period = "1982-2011"):
+  """
+  Paths to the point store index (grid, ocean cells, time axis) and its 
+  [cell, time] array.
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    anomalies (bool): True for the anomaly store instead of observations
+    reference_period (str): Climatology the anomalies use, e.g. "1982-2011"
+  
+  """
+  store_root = f"{box_root}RES_Data/OISST/oisst_mainstays/point_store/"
+  if anomalies == True:
+    store_name = f"daily_anoms_{reference_period.replace('-', 'to')}_climatology"
+  else:
+    store_name = "sst_daily"
+  return f"{store_root}{store_name}_index.npz", f"{store_root}{store_name}_cells.npy"
+
+
+def load_point_index(box_root, anomalies = False, reference_period = "1982-2011"):
+  """
+  Load the point store index as a dictionary of lat, lon, cells (flat lat/lon 
+  indices of the ocean cells, sorted) and start_date (first day of the time axis).
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    anomalies (bool): True for the anomaly store instead of observations
+    reference_period (str): Climatology the anomalies use, e.g. "1982-2011"
+  
+  """
+  index_path, _ = get_point_store_paths(box_root, anomalies, reference_period)
+  with np.load(index_path) as point_index:
+    point_index = {key : point_index[key] for key in point_index.files}
+  point_index["start_date"] = pd.Timestamp(str(point_index["start_date"]))
+  return point_index
+
+
+def update_point_store(box_root, update_yr, anomalies = False, reference_period = "1982-2011", 
+                       var_name = "sst", block_days = 31, verbose = True):
+  """
+  Copy one year of the annual files into the point store, overwriting that 
+  year's columns. The year has to fall inside the time axis the store was 
+  built with, see ot.build_point_store().
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    update_yr (int): Year to write
+    anomalies (bool): True for the anomaly store instead of observations
+    reference_period (str): Climatology the anomalies use, e.g. "1982-2011"
+    var_name (str): Variable in the annual files
+    block_days (int): Days read at a time
+    verbose : True or False to print progress
+  
+  """
+  _, cells_path = get_point_store_paths(box_root, anomalies, reference_period)
+  point_index = load_point_index(box_root, anomalies, reference_period)
+  cells = point_index["cells"]
+  cell_values = np.load(cells_path, mmap_mode = "r+")
+  
+  annual_path = get_annual_path(box_root, update_yr, anomalies = anomalies, reference_period = reference_period)
+  with xr.open_dataset(annual_path) as year_ds:
+    day_cols = (year_ds.indexes["time"].normalize() - point_index["start_date"]).days.values
+    if day_cols.min() < 0 or day_cols.max() >= cell_values.shape[1]:
+      raise ValueError(f"{update_yr} is outside the point store time axis, rebuild it with ot.build_point_store()")
+    
+    for block_start in range(0, len(day_cols), block_days):
+      block_end  = min(block_start + block_days, len(day_cols))
+      block_vals = year_ds[var_name].isel(time = slice(block_start, block_end)).values
+      block_vals = block_vals.reshape(block_end - block_start, -1)[:, cells]
+      cell_values[:, day_cols[block_start:block_end]] = block_vals.T
+  
+  cell_values.flush()
+  del cell_values
+  if verbose == True:
+    print(f"Point store updated with {update_yr}")
+
+
+def build_point_store(box_root, start_yr, end_yr, anomalies = False, reference_period = "1982-2011", 
+                      var_name = "sst", block_days = 31, verbose = True):
+  """
+  Build a time-major copy of the daily record for fast point extraction: a 
+  float32 [cell, time] array holding every day from Jan 1 of start_yr through 
+  Dec 31 of end_yr for the ocean cells only, so a cell's full record is one 
+  contiguous read. Days not written yet are NaN, the current year is filled in
+  with ot.update_point_store() as it updates.
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    start_yr (int): First year of the store
+    end_yr (int): Last year of the store
+    anomalies (bool): True for the anomaly store instead of observations
+    reference_period (str): Climatology the anomalies use, e.g. "1982-2011"
+    var_name (str): Variable in the annual files
+    block_days (int): Days read at a time
+    verbose : True or False to print progress
+  
+  """
+  index_path, cells_path = get_point_store_paths(box_root, anomalies, reference_period)
+  os.makedirs(os.path.dirname(index_path), exist_ok = True)
+  
+  # Ocean cells from the stored mask, or the ones with data in the first year
+  first_path = get_annual_path(box_root, int(start_yr), anomalies = anomalies, reference_period = reference_period)
+  with xr.open_dataset(first_path) as year_ds:
+    lat, lon = year_ds["lat"].values, year_ds["lon"].values
+    if os.path.exists(get_ocean_mask_path(box_root)):
+      cells = get_ocean_cells(box_root, lat, lon)
+    else:
+      has_data = np.zeros(len(lat) * len(lon), dtype = bool)
+      for block_start in range(0, year_ds.sizes["time"], block_days):
+        block_vals = year_ds[var_name].isel(time = slice(block_start, block_start + block_days)).values
+        has_data  |= np.isfinite(block_vals).any(axis = 0).ravel()
+      cells = np.flatnonzero(has_data)
+  
+  # Every calendar day in the range
+  start_date = pd.Timestamp(f"{int(start_yr)}-01-01")
+  n_days = (pd.Timestamp(f"{int(end_yr)}-12-31") - start_date).days + 1
+  np.savez(index_path, lat = lat, lon = lon, cells = cells, start_date = str(start_date.date()))
+  cell_values = np.lib.format.open_memmap(cells_path, mode = "w+", dtype = "float32", shape = (len(cells), n_days))
+  cell_values[:] = np.nan
+  cell_values.flush()
+  del cell_values
+  if verbose == True:
+    print(f"Point store allocated for {len(cells)} ocean cells and {n_days} days")
+  
+  for yr in range(int(start_yr), int(end_yr) + 1):
+    if os.path.exists(get_annual_path(box_root, yr, anomalies = anomalies, reference_period = reference_period)):
+      update_point_store(box_root, yr, anomalies, reference_period, var_name, block_days, verbose)
+
+
+
+#-----------------------------------------------------
+#
+# Extract Points
+#
+#-----------------------------------------------------
+def snap_points_to_grid(point_lat, point_lon, grid_lat, grid_lon):
+  """
+  Nearest grid cell for each point, handling -180 to 180 longitudes on 
+  a 0 to 360 grid.
+  
+  Args:
+    point_lat : Array of point latitudes
+    point_lon : Array of point longitudes
+    grid_lat : Array of grid latitudes
+    grid_lon : Array of grid longitudes
+  
+  Returns:
+    lat_idx, lon_idx : Grid indices of the nearest cell for each point
+  
+  """
+  point_lat = np.asarray(point_lat, dtype = "float64")
+  point_lon = np.asarray(point_lon, dtype = "float64") % 360
+  lat_idx = np.abs(point_lat[:, None] - grid_lat[None, :]).argmin(axis = 1)
+  lon_dist = np.abs(point_lon[:, None] - (np.asarray(grid_lon) % 360)[None, :])
+  lon_idx = np.minimum(lon_dist, 360 - lon_dist).argmin(axis = 1)
+  return lat_idx, lon_idx
+
+
+def extract_points(box_root, points, dates = None, lat_col = "lat", lon_col = "lon", date_col = None, 
+                   include_anomalies = False, reference_period = "1982-2011"):
+  """
+  Daily OISST at a set of points from the point store. Points are snapped to their
+  nearest grid cell, points sharing a cell are read once, and each cell's days come
+  from one contiguous read of the [cell, time] array.
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    points (pd.DataFrame): One row per point, any other columns are carried through
+    dates : Days to extract for every point, None for the full record
+    lat_col (str): Column of point latitudes
+    lon_col (str): Column of point longitudes
+    date_col (str): Optional column with one date per point, e.g. survey dates, 
+      overrides dates
+    include_anomalies (bool): True to add sst_anom from the anomaly point store
+    reference_period (str): Climatology the anomalies use, e.g. "1982-2011"
+  
+  Returns:
+    point_ts (pd.DataFrame): The point columns with grid_lat, grid_lon, time, sst
+      and optionally sst_anom, one row per point and date. Points on land are NaN.
+  
+  """
+  points = points.reset_index(drop = True)
+  point_index = load_point_index(box_root)
+  lat, lon = point_index["lat"], point_index["lon"]
+  lat_idx, lon_idx = snap_points_to_grid(points[lat_col].values, points[lon_col].values, lat, lon)
+  
+  flat_idx = lat_idx * len(lon) + lon_idx
+  
+  # One output row per point and date
+  if date_col is not None:
+    row_points = np.arange(len(points))
+    row_dates  = pd.DatetimeIndex(pd.to_datetime(points[date_col])).normalize()
+  else:
+    if dates is None:
+      n_days = np.load(get_point_store_paths(box_root)[1], mmap_mode = "r").shape[1]
+      dates = pd.date_range(point_index["start_date"], periods = n_days, freq = "D")
+    dates = pd.DatetimeIndex(pd.to_datetime(dates)).normalize()
+    row_points = np.repeat(np.arange(len(points)), len(dates))
+    row_dates  = dates[np.tile(np.arange(len(dates)), len(points))]
+  
+  point_ts = points.iloc[row_points].reset_index(drop = True)
+  point_ts["grid_lat"] = lat[lat_idx[row_points]]
+  point_ts["grid_lon"] = lon[lon_idx[row_points]]
+  point_ts["time"] = row_dates
+  
+  # Read each distinct cell once
+  store_vars = [("sst", False)]
+  if include_anomalies == True:
+    store_vars.append(("sst_anom", True))
+  for col_name, anomalies in store_vars:
+    store_index = point_index if anomalies == False else load_point_index(box_root, True, reference_period)
+    store_cells = store_index["cells"]
+    cell_values = np.load(get_point_store_paths(box_root, anomalies, reference_period)[1], mmap_mode = "r")
+    day_cols = np.asarray((row_dates - store_index["start_date"]).days)
+    in_range = (day_cols >= 0) & (day_cols < cell_values.shape[1])
+    
+    # Rows of the point store, land cells get -1
+    cell_rows = np.searchsorted(store_cells, flat_idx).clip(0, max(len(store_cells) - 1, 0))
+    cell_rows[store_cells[cell_rows] != flat_idx] = -1
+    point_rows = cell_rows[row_points]
+    unique_rows, row_pos = np.unique(point_rows, return_inverse = True)
+    cell_block = np.full((len(unique_rows), cell_values.shape[1]), np.nan, dtype = "float32")
+    ocean = unique_rows >= 0
+    cell_block[ocean] = cell_values[unique_rows[ocean]]
+    
+    values = np.full(len(point_ts), np.nan, dtype = "float32")
+    values[in_range] = cell_block[row_pos[in_range], day_cols[in_range]]
+    point_ts[col_name] = values
+    del cell_values
+  
+  return point_ts
+
+
+
+########################################################
+#########  Begin Ocean Cells Section  ##################
+########################################################
+
+
+
+#-----------------------------------------------------
+#
+# Stored Land Mask
+#
+#-----------------------------------------------------
+def get_ocean_mask_path(box_root):
+  """
+  Path to the stored ocean mask of the OISST grid
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+  
+  """
+  return f"{box_root}RES_Data/OISST/oisst_mainstays/ocean_mask/ocean_mask.nc"
+
+
+def build_ocean_mask(box_root, mask_yr, var_name = "sst", block_days = 31, save = True, verbose = True):
+  """
+  Build the ocean mask from one year of observations: cells with at least one valid
+  day are ocean, cells that are missing all year are land. OISST uses a fixed land 
+  mask and sea ice cells still have values, so one year is enough.
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    mask_yr (int): Year of observations to build the mask from
+    var_name (str): Variable in the annual files
+    block_days (int): Days read at a time
+    save (bool): Whether to save the mask for ot.get_ocean_cells()
+    verbose : True or False to print progress
+  
+  """
+  with xr.open_dataset(get_annual_path(box_root, mask_yr)) as year_ds:
+    has_data = np.zeros((year_ds.sizes["lat"], year_ds.sizes["lon"]), dtype = bool)
+    for block_start in range(0, year_ds.sizes["time"], block_days):
+      block_vals = year_ds[var_name].isel(time = slice(block_start, block_start + block_days))
+      has_data  |= np.isfinite(block_vals.transpose("time", "lat", "lon").values).any(axis = 0)
+    ocean_mask = xr.DataArray(has_data.astype("int8"), dims = ("lat", "lon"), name = "ocean",
+                              coords = {"lat" : year_ds["lat"].values, "lon" : year_ds["lon"].values})
+  ocean_mask.attrs = {"long_name" : "Ocean cells of the OISST grid, 1 = ocean, 0 = land",
+                      "comment"   : f"Cells with data in {mask_yr}"}
+  
+  if save == True:
+    mask_path = get_ocean_mask_path(box_root)
+    os.makedirs(os.path.dirname(mask_path), exist_ok = True)
+    ocean_mask.to_netcdf(mask_path)
+    if verbose == True:
+      print(f"Ocean mask saved with {int(has_data.sum())} of {has_data.size} cells")
+  return ocean_mask
+
+
+def get_ocean_cells(box_root, lat, lon):
+  """
+  Flat indices (lat * n_lon + lon) of the ocean cells of a grid, from the stored
+  ocean mask. If no mask has been built with ot.build_ocean_mask(), or it is for a 
+  different grid, a warning is printed and every cell is returned.
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    lat : Latitude values of the grid
+    lon : Longitude values of the grid
+  
+  """
+  mask_path = get_ocean_mask_path(box_root)
+  if os.path.exists(mask_path):
+    with xr.open_dataarray(mask_path) as ocean_mask:
+      if np.array_equal(ocean_mask["lat"].values, lat) and np.array_equal(ocean_mask["lon"].values, lon):
+        return np.flatnonzero(ocean_mask.values.ravel() == 1)
+    print(f"Warning: ocean mask at {mask_path} is for a different grid, using every cell")
+  else:
+    print(f"Warning: no ocean mask at {mask_path}, using every cell. Build one with ot.build_ocean_mask()")
+  return np.arange(len(lat) * len(lon))
+
+
+
+#-----------------------------------------------------
+#
+# Pack / Unpack Ocean Cells
+#
+#-----------------------------------------------------
+def pack_cells(grid_values, cells):
+  """
+  Gather the ocean cells from gridded values, (..., lat, lon) to (..., cells)
+  
+  Args:
+    grid_values : np.ndarray with lat and lon as the last two axes
+    cells : Flat cell indices from ot.get_ocean_cells()
+  
+  """
+  grid_values = np.asarray(grid_values)
+  n_grid = grid_values.shape[-2] * grid_values.shape[-1]
+  return grid_values.reshape(grid_values.shape[:-2] + (n_grid,))[..., cells]
 
 
-   # Concatenate onto the original
-   appended_ts = pd.concat([ old_sst, update_ts ])
-   
-   # Format time as datetime
-   appended_ts["time"] = appended_ts["time"].astype("datetime64")
+def unpack_cells(cell_values, cells, n_lat, n_lon, fill_value = np.nan):
+  """
+  Scatter packed cell values back onto the grid, (..., cells) to (..., lat, lon),
+  with fill_value on land
+  
+  Args:
+    cell_values : np.ndarray with cells as the last axis
+    cells : Flat cell indices from ot.get_ocean_cells()
+    n_lat (int): Number of latitudes in the grid
+    n_lon (int): Number of longitudes in the grid
+    fill_value : Value for cells that are not packed
+  
+  """
+  cell_values = np.asarray(cell_values)
+  grid_values = np.full(cell_values.shape[:-1] + (n_lat * n_lon,), fill_value, dtype = cell_values.dtype)
+  grid_values[..., cells] = cell_values
+  return grid_values.reshape(cell_values.shape[:-1] + (n_lat, n_lon))
+
+
+
+########################################################
+#########  Begin Regional Timeseries Store Section  ####
+########################################################
+
+
+
+#-----------------------------------------------------
+#
+# Parquet Store Paths
+#
+#-----------------------------------------------------
+def get_parquet_store_root(box_root):
+  """
+  Root of the partitioned Parquet store of regional timeseries. Partitions are 
+  hive-style folders, region_group=*/region=*/year=*/, so the store can be read 
+  as one dataset from Python (pandas/pyarrow) or R (arrow::open_dataset).
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+  
+  """
+  return f"{box_root}RES_Data/OISST/oisst_mainstays/regional_timeseries/parquet_store/"
+
+
+def get_parquet_partition_path(box_root, region_group, region_name, yr):
+  """
+  Path to the Parquet file holding one year of one region
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    region_group (str): Region group from ot.get_region_names()
+    region_name (str): Region name from ot.get_region_names()
+    yr (int): Year of the partition
+  
+  """
+  store_root = get_parquet_store_root(box_root)
+  return f"{store_root}region_group={region_group}/region={region_name}/year={int(yr)}/part-0.parquet"
+
+
+
+#-----------------------------------------------------
+#
+# Write Regional Timeseries Partitions
+#
+#-----------------------------------------------------
+def write_regional_partitions(box_root, region_group, region_name, region_ts):
+  """
+  Write a regional timeseries into the Parquet store. Only the years in region_ts 
+  are touched: new years are written as new partitions, years that already exist 
+  are rewritten with the days in region_ts replacing the ones stored.
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    region_group (str): Region group from ot.get_region_names()
+    region_name (str): Region name from ot.get_region_names()
+    region_ts (pd.DataFrame): Timeseries with time, sst, sst_clim, clim_sd and sst_anom columns
+  
+  Returns:
+    List of the partition paths written
+  
+  """
+  ts_columns = ["time", "sst", "sst_clim", "clim_sd", "sst_anom"]
+  region_ts = region_ts[ts_columns].copy()
+  region_ts["time"] = pd.to_datetime(region_ts["time"])
+  
+  written = []
+  for yr, year_ts in region_ts.groupby(region_ts["time"].dt.year):
+    part_path = get_parquet_partition_path(box_root, region_group, region_name, yr)
     
-   # Add modified ordinal day
-   
-   # Pull climatology info
-   
-   # Get anomalies
+    # Keep the stored days that are not in the update. Only the value columns are
+    # read, newer pyarrow adds the partition keys from the folder names otherwise
+    if os.path.exists(part_path):
+      stored_ts = pd.read_parquet(part_path, columns = ts_columns)
+      stored_ts = stored_ts[~stored_ts["time"].isin(year_ts["time"])]
+      year_ts = pd.concat([stored_ts, year_ts])
+    year_ts = year_ts.sort_values("time").reset_index(drop = True)
     
-   return appended_ts
+    # Write to a temp name first
+    os.makedirs(os.path.dirname(part_path), exist_ok = True)
+    tmp_path = f"{part_path}.part"
+    year_ts.to_parquet(tmp_path, index = False)
+    os.replace(tmp_path, part_path)
+    written.append(part_path)
+  
+  return written
+
+
+def convert_timeseries_csvs(box_root, region_group, verbose = True):
+  """
+  Load the regional timeseries CSVs of a region group into the Parquet store
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    region_group (str): Region group from ot.get_region_names()
+    verbose : True or False to print progress
+  
+  """
+  region_names = get_region_names(region_group)
+  region_paths = get_timeseries_paths(box_root, region_names, region_group, polygons = False)
+  for region_name, ts_path in zip(region_names, region_paths):
+    if not os.path.exists(ts_path):
+      if verbose == True:
+        print(f"No timeseries for {region_name}, skipping")
+      continue
+    region_ts = pd.read_csv(ts_path, parse_dates = ["time"])
+    written = write_regional_partitions(box_root, region_group, region_name, region_ts)
+    if verbose == True:
+      print(f"{region_name} written to {len(written)} partitions")
+
+
+
+#-----------------------------------------------------
+#
+# Read Regional Timeseries Store
+#
+#-----------------------------------------------------
+def load_regional_store(box_root, region_groups = None, regions = None, start_date = None, end_date = None, columns = None):
+  """
+  Read any subset of the Parquet store. Region groups, regions and years outside 
+  the request are skipped without being opened.
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    region_groups : Optional list of region groups
+    regions : Optional list of region names
+    start_date : Optional first day to return
+    end_date : Optional last day to return
+    columns : Optional list of value columns, e.g. ["sst_anom"]
+  
+  Returns:
+    pd.DataFrame with region_group, region, time and the value columns
+  
+  """
+  # "in" filters take sets, pyarrow 0.17 drops every partition when given a list
+  filters = []
+  if region_groups is not None:
+    filters.append(("region_group", "in", set(region_groups)))
+  if regions is not None:
+    filters.append(("region", "in", set(regions)))
+  if start_date is not None:
+    start_date = pd.Timestamp(start_date)
+    filters.append(("year", ">=", start_date.year))
+  if end_date is not None:
+    end_date = pd.Timestamp(end_date)
+    filters.append(("year", "<=", end_date.year))
+  
+  read_columns = None
+  if columns is not None:
+    read_columns = ["region_group", "region", "time"] + [col for col in columns if col != "time"]
+  region_ts = pd.read_parquet(get_parquet_store_root(box_root), columns = read_columns, 
+                              filters = filters if len(filters) > 0 else None)
+  
+  # Days within the dates, partition keys back to plain columns
+  if start_date is not None:
+    region_ts = region_ts[region_ts["time"] >= start_date]
+  if end_date is not None:
+    region_ts = region_ts[region_ts["time"] <= end_date]
+  region_ts = region_ts.drop(columns = ["year"], errors = "ignore")
+  region_ts["region_group"] = region_ts["region_group"].astype(str)
+  region_ts["region"] = region_ts["region"].astype(str)
+  
+  lead_columns = ["region_group", "region", "time"]
+  region_ts = region_ts[lead_columns + [col for col in region_ts.columns if col not in lead_columns]]
+  return region_ts.sort_values(lead_columns).reset_index(drop = True)
+
+
+
+########################################################
+#########  Begin Update Pipeline Section  ##############
+########################################################
+
+
+
+#-----------------------------------------------------
+#
+# Update Anomaly File In Place
+#
+#-----------------------------------------------------
+def update_anomaly_file(box_root, update_yr, date_ids, reference_period = "1982-2011", verbose = True):
+  """
+  Recalculate the anomalies of only the given days in daily_anoms_YYYY.nc, 
+  overwriting days already in the file and appending new ones along time. 
+  Falls back to recalculating the year with ot.export_annual_anomalies() if the 
+  file does not exist, has a fixed-length time dimension, or a new day would land
+  before the end of the file.
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    update_yr (int): Year of the anomaly file
+    date_ids : Days to update as YYYYMMDD strings, they need to be in the annual observations
+    reference_period (str): Climatology to use, e.g. "1982-2011"
+    verbose : True or False to print progress
+  
+  """
+  anom_path = get_annual_path(box_root, update_yr, anomalies = True, reference_period = reference_period)
+  
+  # Decide whether the file can be updated in place
+  rebuild = not os.path.exists(anom_path)
+  if not rebuild:
+    with netCDF4.Dataset(anom_path, mode = "r") as anom_nc:
+      time_var   = anom_nc.variables["time"]
+      time_units = time_var.units.replace("'", "")
+      calendar   = getattr(time_var, "calendar", "standard")
+      written = netCDF4.num2date(time_var[:], time_units, calendar)
+      written = {f"{d.year:04d}{d.month:02d}{d.day:02d}" : i for i, d in enumerate(written)}
+      last_written = max(written) if len(written) > 0 else ""
+      new_dates = [date_id for date_id in date_ids if date_id not in written]
+      if not anom_nc.dimensions["time"].isunlimited() or any(d < last_written for d in new_dates):
+        rebuild = True
+  
+  if rebuild:
+    if verbose == True:
+      print(f"Recalculating anomalies for all of {update_yr}.")
+    export_annual_anomalies(box_root, update_yr, update_yr, reference_period = reference_period, verbose = verbose)
+    return anom_path
+  
+  # Anomalies of just those days, for the ocean cells only
+  with load_oisst_climatology(box_root, reference_period = reference_period) as daily_clims:
+    with xr.open_dataset(get_annual_path(box_root, update_yr)) as sst_obs:
+      obs_days  = sst_obs.indexes["time"].strftime("%Y%m%d")
+      sst_obs   = sst_obs.isel(time = np.flatnonzero(obs_days.isin(date_ids)))
+      day_times = sst_obs.indexes["time"]
+      day_mods  = get_mod_values(day_times)
+      lat, lon  = sst_obs["lat"].values, sst_obs["lon"].values
+      ocean_cells = get_ocean_cells(box_root, lat, lon)
+      obs_cells   = pack_cells(sst_obs["sst"].transpose("time", "lat", "lon").values, ocean_cells)
+      clim_cells  = pack_cells(daily_clims["sst"].sel(modified_ordinal_day = day_mods).transpose("modified_ordinal_day", "lat", "lon").values, ocean_cells)
+      anom_cells  = obs_cells - clim_cells
+  
+  # Written in place, the handle is closed even if a write fails
+  with netCDF4.Dataset(anom_path, mode = "a") as anom_nc:
+    time_var = anom_nc.variables["time"]
+    for day_num, day_time in enumerate(day_times):
+      date_id = day_time.strftime("%Y%m%d")
+      if date_id in written:
+        time_idx = written[date_id]
+      else:
+        time_idx = len(time_var)
+        time_var[time_idx] = netCDF4.date2num(day_time.to_pydatetime(), time_units, calendar)
+        written[date_id] = time_idx
+      day_anoms = unpack_cells(anom_cells[day_num], ocean_cells, len(lat), len(lon))
+      anom_nc.variables["sst"][time_idx, :, :] = np.ma.masked_array(np.nan_to_num(day_anoms), mask = np.isnan(day_anoms))
+      if "MOD" in anom_nc.variables:
+        anom_nc.variables["MOD"][time_idx] = int(day_mods[day_num])
+  
+  if verbose == True:
+    print(f"Anomalies updated for {len(day_times)} days of {update_yr}")
+  return anom_path
+
+
+
+#-----------------------------------------------------
+#
+# Update Regional Timeseries CSVs
+#
+#-----------------------------------------------------
+def update_timeseries_csv(ts_path, update_ts):
+  """
+  Replace the days of update_ts in a regional timeseries CSV and append the new 
+  ones, keeping the CSV's columns and time order. These are the timelines the
+  R reports read. Written to a temp name first.
+  
+  Args:
+    ts_path (str): CSV path from ot.get_timeseries_paths()
+    update_ts : Timeseries of the updated days, with the CSV's columns
+  
+  """
+  if os.path.exists(ts_path):
+    old_ts = pd.read_csv(ts_path, parse_dates = ["time"])
+    old_ts = old_ts[~old_ts["time"].isin(update_ts["time"])]
+    region_ts = pd.concat([old_ts, update_ts], ignore_index = True, sort = False)
+  else:
+    region_ts = update_ts
+  region_ts = region_ts.sort_values("time")
+  
+  os.makedirs(os.path.dirname(ts_path), exist_ok = True)
+  tmp_path = f"{ts_path}.part"
+  region_ts.to_csv(tmp_path, index = False)
+  os.replace(tmp_path, ts_path)
+  return ts_path
+
+
+
+#-----------------------------------------------------
+#
+# Update Regional Timeseries Store for Changed Days
+#
+#-----------------------------------------------------
+def update_regional_store(box_root, region_group, date_ids, verbose = True):
+  """
+  Recalculate the regional timeseries of a region group for only the given days 
+  and write them into the Parquet store and the timeseries CSVs, with climatology 
+  and anomalies from the group's climatology lookups (built from the timeseries 
+  CSVs if missing).
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    region_group (str): Region group from ot.get_region_names()
+    date_ids : Days to update as YYYYMMDD strings
+    verbose : True or False to print progress
+  
+  """
+  region_names = get_region_names(region_group)
+  poly_paths = get_timeseries_paths(box_root, region_names, region_group, polygons = True)
+  ts_paths   = dict(zip(region_names, get_timeseries_paths(box_root, region_names, region_group, polygons = False)))
+  shp_list = [gpd.read_file(poly_path) for poly_path in poly_paths]
+  if os.path.exists(get_clim_lookup_path(box_root, region_group)):
+    clim_lookups = load_clim_lookups(box_root, region_group)
+  else:
+    clim_lookups = build_clim_lookups(box_root, region_group, verbose = verbose)
+  
+  for yr in sorted(set(date_id[0:4] for date_id in date_ids)):
+    with xr.open_dataset(get_annual_path(box_root, int(yr))) as year_ds:
+      obs_days = year_ds.indexes["time"].strftime("%Y%m%d")
+      day_ds   = year_ds.isel(time = np.flatnonzero(obs_days.isin(date_ids)))
+      region_ts = calc_ts_regions(day_ds, shp_list, region_names, region_group = region_group, box_root = box_root)
+    
+    for region_name, ts in region_ts.groupby("region", sort = False):
+      if region_name not in clim_lookups:
+        if verbose == True:
+          print(f"No climatology for {region_name}, skipping")
+        continue
+      ts = calc_anomaly_columns(ts[["time", "sst"]], clim_lookups[region_name])
+      write_regional_partitions(box_root, region_group, region_name, ts)
+      
+      # Same columns as the CSVs from ot.rejoin_climatology()
+      csv_ts = add_mod_to_ts(ts)[["time", "sst", "modified_ordinal_day", "sst_clim", "clim_sd", "sst_anom"]]
+      update_timeseries_csv(ts_paths[region_name], csv_ts)
+    
+    if verbose == True:
+      print(f"{region_group} timeseries updated for {day_ds.sizes['time']} days of {yr}")
+
+
+
+#-----------------------------------------------------
+#
+# Plan and Run Incremental Updates
+#
+#-----------------------------------------------------
+def get_stage_key(stage, reference_period = "1982-2011"):
+  """
+  Cache manifest field marking the raw file checksum a stage last processed a day with.
+  Stages are "annual", "anomaly", "means", or a region group name.
+  
+  Args:
+    stage (str): Pipeline stage
+    reference_period (str): Climatology the anomalies use, e.g. "1982-2011"
+  
+  """
+  climate_period = reference_period.replace("-", "to")
+  if stage == "annual":
+    return "annual_checksum"
+  elif stage in ["anomaly", "means"]:
+    return f"{stage}_{climate_period}_checksum"
+  return f"{stage}_checksum"
+
+
+def plan_oisst_update(cache_root, products = ["anomaly", "means", "regions"], region_groups = [], 
+                      reference_period = "1982-2011", since = None, manifest = None):
+  """
+  Work out which days each stage of the update needs to process: every day in the
+  cache manifest whose raw file changed since the stage last processed it. Stages
+  run in order, so a day new to the annual file shows up for every stage after it.
+  
+  Args:
+    cache_root (str): Location of the oisst_mainstays folder
+    products : Stages after the annual file to plan, from "anomaly", "means", "regions"
+    region_groups : Region groups to update when "regions" is in products
+    reference_period (str): Climatology the anomalies use, e.g. "1982-2011"
+    since : Optional "YYYYMMDD", days before it are left out
+    manifest : Optional cache manifest, loaded from cache_root if None
+  
+  Returns:
+    dict of stage name to sorted list of YYYYMMDD days, region stages are "regions:<group>"
+  
+  """
+  if manifest is None:
+    manifest = load_cache_manifest(cache_root)
+  stages = ["annual"] + [stage for stage in ["anomaly", "means"] if stage in products]
+  if "regions" in products:
+    stages += [f"regions:{region_group}" for region_group in region_groups]
+  
+  update_plan = {}
+  for stage in stages:
+    stage_key = get_stage_key(stage.replace("regions:", ""), reference_period)
+    update_plan[stage] = [date_id for date_id in sorted(manifest) 
+                          if manifest[date_id].get(stage_key) != manifest[date_id]["checksum"]
+                          and (since is None or date_id >= since)]
+  return update_plan
+
+
+def run_oisst_update(workspace = "local", products = ["anomaly", "means", "regions"], region_groups = [], 
+                     reference_period = "1982-2011", since = None, download = True, dry_run = False, verbose = True):
+  """
+  Run the OISST update end to end without Prefect: cache the current and previous
+  month, then bring each stage up to date for only the days that changed, in order
+  annual file -> anomaly file -> monthly/annual means -> regional timeseries store.
+  Progress is kept in the cache manifest, one checksum field per stage, so an 
+  interrupted run picks up where it stopped.
+  
+  Args:
+    workspace (str): String indicating whether to build local paths or docker paths
+    products : Stages after the annual file to run, from "anomaly", "means", "regions"
+    region_groups : Region groups to update when "regions" is in products
+    reference_period (str): Climatology the anomalies use, e.g. "1982-2011"
+    since : Optional "YYYYMMDD", days before it are left alone
+    download (bool): False to skip caching new files and only process what is cached
+    dry_run (bool): True to print and return the plan without downloading or writing anything
+    verbose : True or False to print progress
+  
+  Returns:
+    dict of stage name to the days processed (or planned, for a dry run)
+  
+  """
+  box_root   = set_workspace(workspace)
+  cache_root = set_cache_root(box_root)
+  this_month, last_month = get_update_month(True), get_update_month(False)
+  this_yr, last_month_yr = check_update_yr(True), check_update_yr(False)
+  
+  ####  1. Raw cache
+  if dry_run == True:
+    if download == True:
+      print(f"Would cache {last_month_yr}-{last_month} and {this_yr}-{this_month}, days changed by the download are not in the plan")
+  elif download == True:
+    cache_oisst(last_month, last_month_yr, workspace = workspace, verbose = verbose)
+    cache_oisst(this_month, this_yr, workspace = workspace, verbose = verbose)
+  
+  update_plan = plan_oisst_update(cache_root, products, region_groups, reference_period, since)
+  if dry_run == True:
+    for stage, date_ids in update_plan.items():
+      day_range = f": {date_ids[0]} - {date_ids[-1]}" if len(date_ids) > 0 else ""
+      print(f"{stage} : {len(date_ids)} days{day_range}")
+    return update_plan
+  
+  def stage_years(date_ids):
+    years = {}
+    for date_id in date_ids:
+      years.setdefault(int(date_id[0:4]), []).append(date_id)
+    return years
+  
+  def mark_done(stage, date_ids):
+    manifest = load_cache_manifest(cache_root)
+    stage_key = get_stage_key(stage, reference_period)
+    for date_id in date_ids:
+      manifest[date_id][stage_key] = manifest[date_id]["checksum"]
+    save_cache_manifest(cache_root, manifest)
+  
+  ####  2. Annual files, marks its own days in the manifest
+  for yr in stage_years(update_plan["annual"]):
+    if yr == this_yr:
+      update_annual_file(last_month, this_month, yr, workspace = workspace, verbose = verbose)
+    else:
+      update_annual_file("11", "12", yr, workspace = workspace, verbose = verbose)
+  
+  ####  3. Anomaly files
+  for yr, date_ids in stage_years(update_plan.get("anomaly", [])).items():
+    update_anomaly_file(box_root, yr, date_ids, reference_period = reference_period, verbose = verbose)
+    mark_done("anomaly", date_ids)
+  
+  ####  4. Monthly and annual means of the months touched
+  for yr, date_ids in stage_years(update_plan.get("means", [])).items():
+    months = sorted(set(int(date_id[4:6]) for date_id in date_ids))
+    update_mean_products(box_root, yr, months, verbose = verbose)
+    if "anomaly" in products:
+      update_mean_products(box_root, yr, months, anomalies = True, reference_period = reference_period, verbose = verbose)
+    mark_done("means", date_ids)
+  
+  ####  5. Regional timeseries
+  for region_group in region_groups:
+    date_ids = update_plan.get(f"regions:{region_group}", [])
+    if len(date_ids) > 0:
+      update_regional_store(box_root, region_group, date_ids, verbose = verbose)
+      mark_done(region_group, date_ids)
+  
+  return update_plan
+
+
+
+########################################################
+#########  Begin Result Cache Section  #################
+########################################################
+
+
+
+#-----------------------------------------------------
+#
+# Result Cache Keys
+#
+#-----------------------------------------------------
+def get_result_cache_root(box_root):
+  """
+  Folder of the content-addressed result cache
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+  
+  """
+  return f"{box_root}RES_Data/OISST/oisst_mainstays/result_cache/"
+
+
+def get_code_helpers(func, helpers = None):
+  """
+  Every function from func's own module that func calls, directly or through 
+  the helpers it calls, by name. Names are read from the compiled code of func 
+  and any functions nested in it.
+  
+  Args:
+    func : Function to start from
+    helpers (dict): Helpers found so far, filled in place
+  
+  """
+  if helpers is None:
+    helpers = {}
+  module_globals = getattr(func, "__globals__", {})
+  codes = [func.__code__] if hasattr(func, "__code__") else []
+  while len(codes) > 0:
+    code = codes.pop()
+    codes += [const for const in code.co_consts if inspect.iscode(const)]
+    for name in code.co_names:
+      helper = module_globals.get(name)
+      if inspect.isfunction(helper) and helper.__module__ == func.__module__ and name not in helpers:
+        helpers[name] = helper
+        get_code_helpers(helper, helpers)
+  return helpers
+
+
+def get_code_version(func):
+  """
+  Short hash of the code behind a product: the source of func and of every oisstools
+  helper it calls, so results are recomputed after func or anything it is built 
+  from (readers, anomalies, masks) changes. Edits to functions the product never 
+  reaches leave cached results alone.
+  
+  Args:
+    func : Function that makes the product
+  
+  """
+  code_hash = hashlib.md5()
+  helpers = get_code_helpers(func)
+  for code_func in [func] + [helpers[name] for name in sorted(helpers)]:
+    try:
+      code_hash.update(inspect.getsource(code_func).encode())
+    except (OSError, TypeError):
+      code_hash.update(getattr(code_func, "__qualname__", repr(code_func)).encode())
+  return code_hash.hexdigest()[0:12]
+
+
+def get_param_token(value):
+  """
+  JSON-friendly stand-in for a parameter value in a cache key. Polygons are 
+  reduced to their geometry hash and arrays to a hash of their bytes. Gridded
+  xarray objects are too big to hash, pass the files they come from as inputs
+  and leave them out of the key instead.
+  
+  Args:
+    value : Parameter value
+  
+  """
+  if hasattr(value, "geometry") and hasattr(value, "total_bounds"):
+    return f"geometry:{get_geometry_hash(value)}"
+  if isinstance(value, (xr.Dataset, xr.DataArray)):
+    raise ValueError("xarray parameters can't be hashed, list their files in input_paths and add the parameter to key_exclude")
+  if isinstance(value, np.ndarray):
+    return f"array:{hashlib.md5(np.ascontiguousarray(value).tobytes()).hexdigest()}"
+  if isinstance(value, dict):
+    return {str(key) : get_param_token(val) for key, val in value.items()}
+  if isinstance(value, (list, tuple, range)):
+    return [get_param_token(val) for val in value]
+  if isinstance(value, (np.integer, np.floating)):
+    return value.item()
+  if value is None or isinstance(value, (bool, int, float, str)):
+    return value
+  return repr(value)
+
+
+def get_input_fingerprint(box_root, input_paths, hash_inputs = False):
+  """
+  Fingerprint of the input files of a product: path relative to box_root, size 
+  and modification time, or the md5 of the contents with hash_inputs. Missing 
+  files are part of the fingerprint too.
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    input_paths : List of input file paths
+    hash_inputs (bool): True to hash the file contents instead of using size and mtime
+  
+  """
+  fingerprint = []
+  for input_path in sorted(input_paths):
+    rel_path = input_path.replace(box_root, "", 1)
+    if not os.path.exists(input_path):
+      fingerprint.append([rel_path, None])
+    elif hash_inputs == True:
+      fingerprint.append([rel_path, file_checksum(input_path)])
+    else:
+      file_stat = os.stat(input_path)
+      fingerprint.append([rel_path, file_stat.st_size, file_stat.st_mtime_ns])
+  return fingerprint
+
+
+def get_result_key(box_root, func, func_kwargs, input_paths = [], key_exclude = [], hash_inputs = False):
+  """
+  Cache key of a product: md5 of the function name, its parameters, the input 
+  file fingerprints and the code version.
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    func : Function that makes the product
+    func_kwargs (dict): Keyword arguments for func
+    input_paths : Files the product is made from
+    key_exclude : Parameter names left out of the key
+    hash_inputs (bool): True to hash the input file contents
+  
+  """
+  key_params = {name : get_param_token(value) for name, value in func_kwargs.items() if name not in key_exclude}
+  key_parts = {"func"         : f"{func.__module__}.{func.__qualname__}",
+               "params"       : key_params,
+               "inputs"       : get_input_fingerprint(box_root, input_paths, hash_inputs),
+               "code_version" : get_code_version(func)}
+  return hashlib.md5(json.dumps(key_parts, sort_keys = True).encode()).hexdigest()
 
 
-#-----------------------------------------------------
-#
-# Add Modified Ordinal Day to pd.DataFrame that has time column
-#
-#-----------------------------------------------------
-def add_mod_to_ts(new_ts):
-    """
-    Add modified ordinaly day column to pd.DataFrame from time column
-    
-    Args:
-        new_ts : timeseries dataframe that contains "time" datetime64 column.
-    
-    """
-    # Add modified ordinal day, for day-to-day calculation and leapyear adjustment
-    not_leap_year  = ~new_ts.time.dt.is_leap_year
-    march_or_later =  new_ts.time.dt.month >= 3
-    ordinal_day    =  new_ts.time.dt.dayofyear
-    mod            =  ordinal_day + (not_leap_year & march_or_later)
-    new_ts["modified_ordinal_day"] = mod
-    return new_ts
 
 #-----------------------------------------------------
 #
-# Rejoin Regional Climatology, re-calculate regional anomalies
+# Cached Products
 #
 #-----------------------------------------------------
-def rejoin_climatology(old_ts, new_ts):
-    """
-    Merge Climatology and climate standard deviation from one dataframe 
-    into a second by merging on modified ordinal days, the units of the climatology.
-    
-    Args:
-        old_ts : Dataframe with "modified_ordinal_day", "sst_clim", "clim_sd" used to build climatology key for merge
-        new_ts : Second dataframe that only has time and sst, but matches the region mask used to prepare old_ts
-    
-    
-    """
-    # pull unique climatology values from existing timeline
-    clim = old_ts[["modified_ordinal_day", "sst_clim", "clim_sd"]]
-    clim = clim.drop_duplicates()
-    
-    # Add MOD to new timeseries
-    new_ts = add_mod_to_ts(new_ts)
-   
-    # Merge to new timeline using Modified day of year
-    anom_timeline = new_ts.merge(clim, how = "left", on = "modified_ordinal_day")
+def save_cached_result(result_path, result):
+  """
+  Write a result to the cache in a format that fits it: NetCDF for xarray, Parquet
+  for DataFrames, JSON for file paths, pickle for anything else.
+  
+  Args:
+    result_path (str): Path without extension
+    result : Output of the product function
+  
+  Returns:
+    Path written
+  
+  """
+  if isinstance(result, xr.DataArray):
+    result = result.to_dataset(name = result.name if result.name is not None else "__values__")
+  if isinstance(result, xr.Dataset):
+    out_path, write = f"{result_path}.nc", lambda path: result.to_netcdf(path)
+  elif isinstance(result, pd.DataFrame):
+    out_path, write = f"{result_path}.parquet", lambda path: result.to_parquet(path)
+  elif isinstance(result, str) or (isinstance(result, list) and all(isinstance(r, str) for r in result)):
+    out_path = f"{result_path}.json"
+    def write(path):
+      with open(path, "w") as json_file:
+        json.dump(result, json_file)
+  else:
+    out_path = f"{result_path}.pkl"
+    def write(path):
+      with open(path, "wb") as pkl_file:
+        pickle.dump(result, pkl_file)
+  
+  # Written to a temp name first, keeping the extension for the writers
+  tmp_path = f"{result_path}.part{os.path.splitext(out_path)[1]}"
+  write(tmp_path)
+  os.replace(tmp_path, out_path)
+  return out_path
+
+
+def load_cached_result(out_path):
+  """
+  Read a result written by ot.save_cached_result(). Results that are file paths
+  only count as hits if the files are still there, None is returned otherwise.
+  
+  Args:
+    out_path (str): Path of the cached result
+  
+  """
+  if out_path.endswith(".nc"):
+    with xr.open_dataset(out_path) as result:
+      result = result.load()
+    if list(result.data_vars) == ["__values__"]:
+      result = result["__values__"].rename(None)
+    return result
+  elif out_path.endswith(".parquet"):
+    return pd.read_parquet(out_path)
+  elif out_path.endswith(".json"):
+    with open(out_path) as json_file:
+      result = json.load(json_file)
+    result_paths = [result] if isinstance(result, str) else result
+    return result if all(os.path.exists(path) for path in result_paths) else None
+  with open(out_path, "rb") as pkl_file:
+    return pickle.load(pkl_file)
 
 
-    # Subtract climate mean to get anomalies
-    anom_timeline["sst_anom"] = anom_timeline["sst"] - anom_timeline["sst_clim"]
+def cached_product(box_root, func, func_kwargs, input_paths = [], output_paths = [], 
+                   key_exclude = ["box_root", "verbose", "save", "use_cache"], hash_inputs = False, verbose = True):
+  """
+  Run func(**func_kwargs) through the result cache. The result is stored under a 
+  key made from the function, its parameters (polygons by geometry hash), the
+  input files and the code version, and returned from the cache while none of 
+  those change. The climatology, anomaly, regional timeseries and trend builders 
+  go through it with use_cache = True, e.g.
+  
+    ot.calc_warming_trends(box_root, 1982, 2020, use_cache = True)
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    func : Function that makes the product
+    func_kwargs (dict): Keyword arguments for func
+    input_paths : Files the product is made from
+    output_paths : Files func writes, a cached result only counts as a hit while they exist
+    key_exclude : Parameter names left out of the key, e.g. gridded inputs covered by input_paths
+    hash_inputs (bool): True to hash input file contents instead of using size and mtime
+    verbose : True or False to print cache hits and misses
+  
+  """
+  cache_root = get_result_cache_root(box_root)
+  result_key = get_result_key(box_root, func, func_kwargs, input_paths, key_exclude, hash_inputs)
+  meta_path  = f"{cache_root}{result_key}.meta.json"
+  
+  # Cache hit
+  if os.path.exists(meta_path) and all(os.path.exists(path) for path in output_paths):
+    with open(meta_path) as meta_file:
+      result_meta = json.load(meta_file)
+    out_path = f"{cache_root}{result_meta['file']}"
+    result = load_cached_result(out_path) if os.path.exists(out_path) else None
+    if result is not None:
+      result_meta["last_used"] = datetime.datetime.now().timestamp()
+      with open(meta_path, "w") as meta_file:
+        json.dump(result_meta, meta_file)
+      if verbose == True:
+        print(f"Result cache hit for {func.__name__}: {result_key}")
+      return result
+  
+  # Cache miss, run and store
+  if verbose == True:
+    print(f"Result cache miss for {func.__name__}, running it")
+  result = func(**func_kwargs)
+  os.makedirs(cache_root, exist_ok = True)
+  out_path = save_cached_result(f"{cache_root}{result_key}", result)
+  now = datetime.datetime.now().timestamp()
+  result_meta = {"func"      : func.__name__, 
+                 "file"      : os.path.basename(out_path), 
+                 "size"      : os.path.getsize(out_path), 
+                 "created"   : now, 
+                 "last_used" : now}
+  with open(meta_path, "w") as meta_file:
+    json.dump(result_meta, meta_file)
+  return result
 
-    return anom_timeline
 
+def get_annual_paths(box_root, start_yr, end_yr, anomalies = False, reference_period = "1982-2011"):
+  """
+  Annual observation or anomaly files for a range of years, e.g. the input_paths of 
+  ot.cached_product()
+  
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    start_yr (int): First year
+    end_yr (int): Last year
+    anomalies (bool): True for the anomaly files
+    reference_period (str): Climatology the anomalies use, e.g. "1982-2011"
+  
+  """
+  return [get_annual_path(box_root, yr, anomalies = anomalies, reference_period = reference_period) 
+          for yr in range(int(start_yr), int(end_yr) + 1)]
 
 
 
 #-----------------------------------------------------
 #
-# Timeseries Region Catalog
+# Result Cache Eviction
 #
 #-----------------------------------------------------
-def get_region_names(region_group):
+def evict_result_cache(box_root, max_bytes = None, max_age_days = None, verbose = True):
   """
-  Return a consistent list of region names to use when iterating through
-  region groups for masked timeseries evaluation and updates.
-  
-  names are presented in the save-name form, without spaces or underscores.
-  
-  This function will be the access points to file path conventions, with changes here impacting 
-  loading and saving text.
+  Remove cached results that have not been used in max_age_days, then the least 
+  recently used ones until the cache is under max_bytes.
   
   Args:
-    region_group (str): Choice of "gmri_sst_focal_areas", "lme", "nmfs_trawl_regions", "nelme_regions",
-      "gom_physio_regions"
+    box_root (str): Base location to box from either local path or docker volume
+    max_bytes (int): Optional size limit of the cache
+    max_age_days (float): Optional age limit, since a result was last used
+    verbose : True or False to print what was removed
+  
+  Returns:
+    List of the keys removed
   
   """
+  cache_root = get_result_cache_root(box_root)
+  if not os.path.exists(cache_root):
+    return []
   
-  # GROUP 1: GMRI sst focal areas
-  gmri_focal_areas = ["apershing_gulf_of_maine", "cpr_gulf_of_maine", 
-                      "aak_northwest_atlantic", "long_island_sound"]
+  # Cached results, least recently used first
+  cached = []
+  for meta_name in os.listdir(cache_root):
+    if meta_name.endswith(".meta.json"):
+      with open(f"{cache_root}{meta_name}") as meta_file:
+        result_meta = json.load(meta_file)
+      cached.append((result_meta["last_used"], meta_name[:-len(".meta.json")], result_meta))
+  cached.sort()
   
+  now = datetime.datetime.now().timestamp()
+  total_bytes = sum(result_meta["size"] for _, _, result_meta in cached)
+  removed = []
+  for last_used, result_key, result_meta in cached:
+    too_old = max_age_days is not None and (now - last_used) > max_age_days * 86400
+    too_big = max_bytes is not None and total_bytes > max_bytes
+    if not (too_old or too_big):
+      continue
+    for cache_file in [result_meta["file"], f"{result_key}.meta.json"]:
+      if os.path.exists(f"{cache_root}{cache_file}"):
+        os.remove(f"{cache_root}{cache_file}")
+    total_bytes -= result_meta["size"]
+    removed.append(result_key)
   
-  # GROUP 2: NMFS Regions
-  nmfs_regions = ["georges_bank",         "gulf_of_maine", 
-                  "southern_new_england", "mid_atlantic_bight",
-                  "inuse_strata",         "regions_collection"]
-                  
-                  
-  # GROUP 3: NELME Regions
-  nelme_regions = ["GoM", "NELME", "SNEandMAB"]
-         
-                  
-  # GROUP 4: Large Marine Ecosystems
-  lme_regions =  ["agulhas_current",                        "aleutian_islands",                      
-                  "antarctica",                             "arabian_sea",                           
-                  "baltic_sea",                             "barents_sea",                           
-                  "bay_of_bengal",                          "beaufort_sea",                          
-                  "benguela_current",                       "black_sea",                             
-                  "california_current",                     "canadian_eastern_arctic_west_greenland",
-                  "canadian_high_arctic_north_greenland",   "canary_current",                        
-                  "caribbean_sea",                          "celtic_biscay_shelf",                   
-                  "central_arctic",                         "east_bering_sea",                       
-                  "east_brazil_shelf",                      "east_central_australian_shelf",         
-                  "east_china_sea",                         "east_siberian_sea",                     
-                  "faroe_plateau",                          "greenland_sea",                         
-                  "guinea_current",                         "gulf_of_alaska",                        
-                  "gulf_of_california",                     "gulf_of_mexico",                        
-                  "gulf_of_thailand",                       "hudson_bay_complex",                    
-                  "humboldt_current",                       "iberian_coastal",                       
-                  "iceland_shelf_and_sea",                  "indonesian_sea",                        
-                  "insular_pacific_hawaiian",               "kara_sea",                              
-                  "kuroshio_current",                       "labrador_newfoundland",                 
-                  "laptev_sea",                             "mediterranean_sea",                     
-                  "new_zealand_shelf",                      "north_australian_shelf",                
-                  "north_brazil_shelf",                     "north_sea",                             
-                  "northeast_australian_shelf",             "northeast_us_continental_shelf",        
-                  "northern_bering_chukchi_seas",           "northwest_australian_shelf",            
-                  "norwegian_sea",                          "oyashio_current",                       
-                  "pacific_central_american_coastal",       "patagonian_shelf",                      
-                  "red_sea",                                "scotian_shelf",                         
-                  "sea_of_japan",                           "sea_of_okhotsk",                        
-                  "somali_coastal_current",                 "south_brazil_shelf",                    
-                  "south_china_sea",                        "south_west_australian_shelf",           
-                  "southeast_australian_shelf",             "southeast_us_continental_shelf",        
-                  "sulu_celebes_sea",                       "west_bering_sea",                       
-                  "west_central_australian_shelf",          "yellow_sea"]     
-   
-                  
-  # GROUP 5: Gulf of Maine Physio Regions
-  gom_physio_regions = [
-     "bay_of_fundy",           "bear_seamount",          "browns_bank",            "central_gulf_of_maine", 
-     "continental_slope",      "eastern_coastal_shelf",  "georges_bank",           "georges_basin",         
-     "jordan_basin",           "kelvin_seamount",        "manning_seamount",       "northern_coastal_shelf",
-     "scotian_coastal_shelf",  "scotian_shelf",          "southern_coastal_shelf", "wikinson_basin"   
-  ]
+  if verbose == True:
+    print(f"Removed {len(removed)} cached results, {total_bytes} bytes left")
+  return removed
 
 
-  # Dictionary Lookup
-  region_catalog = {"gmri_sst_focal_areas" : gmri_focal_areas, 
-                    "lme"                  : lme_regions, 
-                    "nmfs_trawl_regions"   : nmfs_regions,
-                    "nelme_regions"        : nelme_regions,
-                    "gom_physio_regions"   : gom_physio_regions}
-                    
-  # Return Selected List
-  region_selections = region_catalog[region_group]
-  return region_selections
+
+########################################################
+#########  Begin Parallel Years Section  ###############
+########################################################
 
 
 
 #-----------------------------------------------------
 #
-# Timeseries Path Directory
+# Worker Memory Limits
 #
 #-----------------------------------------------------
-def get_timeseries_paths(box_root, region_list, region_group, polygons = False):
+def parse_memory_limit(memory_limit):
   """
-  Get the Full Path for either masked timeseries or the polygons used to 
-  create them by the group name and the base path to box.
-  
-  Also Helpful for maintaining consistency on save paths for updating
+  Memory limit in bytes from an int or a string like "4GB" or "500MB"
   
   Args:
-    box_root (str)     : String path to box for whichever user is accessing things
-    region_list        : List of region names returned from ot.get_region_names
-    region_group (str) : String indicating group of regions to look up. 
-                         Options are gmri_sst_focal_areas, lme, nmfs_trawl_regions, nelme_regions
-    polygons (bool)    : Indication of whether to look up paths
+    memory_limit : int bytes or str with a KB, MB, GB or TB suffix
   
   """
+  if memory_limit is None or isinstance(memory_limit, (int, np.integer)):
+    return memory_limit
+  units = {"TB" : 1024 ** 4, "GB" : 1024 ** 3, "MB" : 1024 ** 2, "KB" : 1024, "B" : 1}
+  limit_str = str(memory_limit).strip().upper()
+  for suffix, scale in units.items():
+    if limit_str.endswith(suffix):
+      return int(float(limit_str[:-len(suffix)]) * scale)
+  return int(float(limit_str))
+
+
+def set_worker_memory_limit(memory_limit):
+  """
+  Cap the address space of a worker process, so a year that needs too much memory
+  fails with a MemoryError in its worker instead of taking down the machine. Only 
+  on systems with the resource module (Linux, macOS).
   
-  # 1. Set file structure for shapefile lookup
-  poly_root = "RES_Data/Shapefiles/"
+  RLIMIT_AS caps virtual memory, not resident memory. Shared libraries, thread stacks,
+  memory-mapped files and allocator arenas all count against it, so a worker can hit 
+  the limit while using much less RAM than it. Set it well above the expected peak of
+  a year (two to three times is a safe start) or leave it off, the default.
   
-  # How the start of the file names go 
-  if region_group == "nmfs_trawl_regions":
-    poly_start = "nmfs_trawl_"
-  else:
-    poly_start = ""
+  Args:
+    memory_limit (int): Limit in bytes, None for no limit
   
-  # How the file endings go
-  poly_end = {"gmri_sst_focal_areas" : ".geojson",
-              "lme"                  : "_exterior.geojson",
-              "nmfs_trawl_regions"   : ".geojson",
-              "nelme_regions"        : "_sf.shp",
-              "gom_physio_regions"   : ".geojson"}
+  """
+  if memory_limit is None:
+    return
+  try:
+    import resource
+  except ImportError:
+    return
+  resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+
+
+#-----------------------------------------------------
+#
+# Run Per-Year Work in a Process Pool
+#
+#-----------------------------------------------------
+def merge_year_results(years, results):
+  """
+  Combine per-year results in year order: DataFrames are stacked, xarray objects
+  are concatenated along a new year dimension unless they already have time, and 
+  lists are joined. Anything else comes back as a dictionary by year.
   
-  # Path to different groups
-  poly_extensions = {"gmri_sst_focal_areas" : f"{box_root}{poly_root}gmri_sst_focal_areas/{poly_start}",
-                     "lme"                  : f"{box_root}{poly_root}large_marine_ecosystems/{poly_start}",
-                     "nmfs_trawl_regions"   : f"{box_root}{poly_root}nmfs_trawl_regions/{poly_start}",
-                     "nelme_regions"        : f"{box_root}{poly_root}NELME_regions/{poly_start}",
-                     "gom_physio_regions"   : f"{box_root}{poly_root}GulfOfMainePhysioRegions/single_regions/{poly_start}"}
-                     
+  Args:
+    years : Years in order
+    results : Results in the same order
   
+  """
+  if len(results) == 0:
+    return results
+  if all(isinstance(result, pd.DataFrame) for result in results):
+    return pd.concat(results, ignore_index = True)
+  if all(isinstance(result, (xr.Dataset, xr.DataArray)) for result in results):
+    if all("time" in result.dims for result in results):
+      return xr.concat(results, dim = "time")
+    return xr.concat(results, dim = pd.Index(years, name = "year"))
+  if all(isinstance(result, list) for result in results):
+    return [item for result in results for item in result]
+  return dict(zip(years, results))
+
+
+def run_by_year(func, years, func_kwargs = {}, year_arg = "yr", n_workers = 1, memory_limit = None, 
+                merge = True, verbose = True):
+  """
+  Run func once per year across a pool of n_workers processes, each capped at 
+  memory_limit. Results are put back in year order whatever order the workers 
+  finish in, so the merged output is the same as a serial run. Workers are spawned,
+  so scripts calling this need an if __name__ == "__main__": guard.
   
+  Args:
+    func : Function to run, it needs to be importable (e.g. from oisstools) for the workers
+    years : Years to run
+    func_kwargs (dict): Keyword arguments passed every year
+    year_arg : Name of the year argument of func, or a list of names that all get the year
+      e.g. ["start_yr", "end_yr"] for ot.export_annual_anomalies()
+    n_workers (int): Number of processes, 1 runs in this process without a memory limit
+    memory_limit : Optional virtual memory limit per worker as bytes or a string like "8GB", 
+      off by default, see ot.set_worker_memory_limit() for how it differs from RAM use
+    merge (bool): True to merge the results with ot.merge_year_results(), False for a dict by year
+    verbose : True or False to print progress
   
+  """
+  years = [int(yr) for yr in years]
+  year_args = [year_arg] if isinstance(year_arg, str) else list(year_arg)
+  year_kwargs = [dict(func_kwargs, **{arg : yr for arg in year_args}) for yr in years]
   
-  # 2. Set file structure for timeseries lookup   
+  if n_workers > 1:
+    # Spawned rather than forked workers, a fork after netCDF files have been read
+    # in this process can inherit a held HDF5 lock and hang
+    with ProcessPoolExecutor(max_workers = n_workers, mp_context = multiprocessing.get_context("spawn"), 
+                             initializer = set_worker_memory_limit, 
+                             initargs = (parse_memory_limit(memory_limit),)) as pool:
+      futures = [pool.submit(func, **kwargs) for kwargs in year_kwargs]
+      results = []
+      for yr, future in zip(years, futures):
+        results.append(future.result())
+        if verbose == True:
+          print(f"{func.__name__} finished for {yr}")
+  else:
+    results = []
+    for yr, kwargs in zip(years, year_kwargs):
+      results.append(func(**kwargs))
+      if verbose == True:
+        print(f"{func.__name__} finished for {yr}")
   
-  # Root to the regional timeseries folder
-  ts_root = "RES_Data/OISST/oisst_mainstays/regional_timeseries/"
+  if merge == True:
+    return merge_year_results(years, results)
+  return dict(zip(years, results))
+
+
+
+#-----------------------------------------------------
+#
+# Per-Year Regional Timeseries and BASE Rebuilds
+#
+#-----------------------------------------------------
+def calc_regional_year(box_root, yr, region_group, anomalies = False, reference_period = "1982-2011", 
+                       var_name = "sst", area_weighted = False, use_cache = False):
+  """
+  Timeseries of every region in a group for one year of the annual files, with 
+  ot.calc_ts_regions(). Masks come from the mask cache.
   
-  # How all masked timeseries file names start
-  ts_start = "OISSTv2_anom_"
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    yr (int): Year to process
+    region_group (str): Region group from ot.get_region_names()
+    anomalies (bool): True to use the anomaly files instead of observations
+    reference_period (str): Climatology the anomalies use, e.g. "1982-2011"
+    var_name (str): Variable to make timeseries for
+    area_weighted (bool): True to weight cells by area (cos latitude)
+    use_cache (bool): True to go through ot.cached_product(), recalculating only when 
+    the annual file, the polygons or this function change
   
-  # How they all end
-  ts_ending = ".csv"
+  """
+  region_names = get_region_names(region_group)
+  poly_paths = get_timeseries_paths(box_root, region_names, region_group, polygons = True)
+  year_path  = get_annual_path(box_root, yr, anomalies = anomalies, reference_period = reference_period)
+  if use_cache == True:
+    region_kwargs = {"box_root" : box_root, "yr" : int(yr), "region_group" : region_group, "anomalies" : anomalies, 
+                     "reference_period" : reference_period, "var_name" : var_name, "area_weighted" : area_weighted}
+    return cached_product(box_root, calc_regional_year, region_kwargs, 
+                          input_paths = [year_path, get_ocean_mask_path(box_root)] + poly_paths, verbose = False)
   
-  # Path to different groups
-  timeseries_extensions = {"gmri_sst_focal_areas" : f"{box_root}{ts_root}gmri_sst_focal_areas/{ts_start}",
-                           "lme"                  : f"{box_root}{ts_root}large_marine_ecosystems/{ts_start}",
-                           "nmfs_trawl_regions"   : f"{box_root}{ts_root}nmfs_trawl_regions/{ts_start}",
-                           "nelme_regions"        : f"{box_root}{ts_root}NELME_regions/{ts_start}",
-                           "gom_physio_regions"   : f"{box_root}{ts_root}GulfOfMainePhysioRegions/{ts_start}"}
+  shp_list = [gpd.read_file(poly_path) for poly_path in poly_paths]
+  with xr.open_dataset(year_path) as year_ds:
+    region_ts = calc_ts_regions(year_ds, shp_list, region_names, region_group = region_group, 
+                                box_root = box_root, var_name = var_name, area_weighted = area_weighted)
+  region_ts.insert(1, "region_group", region_group)
+  return region_ts
 
 
-
-  # 3. Toggle File Start and Endings for Shapefiles or for timeseries
+def rebuild_anomalies_and_regions(box_root, start_yr, end_yr, region_groups, reference_period = "1982-2011", 
+                                  n_workers = 1, memory_limit = None, use_cache = False, verbose = True):
+  """
+  Rebuild the annual anomaly files and the regional observation timeseries for a 
+  range of years, spreading years over n_workers processes. Anomalies are written 
+  to annual_anomalies/ as they finish, the regional timeseries are returned by 
+  region group in time order.
   
-  # here is where specific file starts/endings get applied to different groups
-  if polygons == True:
-    leading_path = poly_extensions[region_group]
-    file_ending  = poly_end[region_group]
-  elif polygons == False:
-    leading_path = timeseries_extensions[region_group]
-    file_ending  = ts_ending
-    
-
-  # Build full paths using region_list
-  region_paths = []
-  for region_name in region_list:
-    full_region_path = f"{leading_path}{region_name}{file_ending}"
-    region_paths.append(full_region_path)
-    
-    
-  # Return all the file paths
-  return region_paths
-    
-    
+  Args:
+    box_root (str): Base location to box from either local path or docker volume
+    start_yr (int): First year
+    end_yr (int): Last year
+    region_groups : Region groups to make timeseries for
+    reference_period (str): Climatology the anomalies use, e.g. "1982-2011"
+    n_workers (int): Number of processes
+    memory_limit : Optional virtual memory limit per worker, see ot.run_by_year()
+    use_cache (bool): True to skip years whose anomalies and timeseries are in the result cache
+    verbose : True or False to print progress
+  
+  """
+  years = range(int(start_yr), int(end_yr) + 1)
+  anom_kwargs = {"box_root" : box_root, "reference_period" : reference_period, "use_cache" : use_cache, "verbose" : False}
+  run_by_year(export_annual_anomalies, years, anom_kwargs, 
+              year_arg = ["start_yr", "end_yr"], n_workers = n_workers, memory_limit = memory_limit, verbose = verbose)
+  
+  # Build the masks once so workers only read them from the mask cache
+  region_ts = {}
+  for region_group in region_groups:
+    region_names = get_region_names(region_group)
+    poly_paths = get_timeseries_paths(box_root, region_names, region_group, polygons = True)
+    with xr.open_dataset(get_annual_path(box_root, int(start_yr))) as grid_ds:
+      for region_name, poly_path in zip(region_names, poly_paths):
+        load_region_mask(grid_ds, gpd.read_file(poly_path), region_name, region_group, box_root)
+    region_kwargs = {"box_root" : box_root, "region_group" : region_group, "use_cache" : use_cache}
+    region_ts[region_group] = run_by_year(calc_regional_year, years, region_kwargs, 
+                                          n_workers = n_workers, memory_limit = memory_limit, verbose = verbose)
+  return region_ts
@@ -0,0 +1,76 @@
+# Shared pytest setup for the oisstools checks
+# Tests import the module the same way the notebooks do: import oisstools as ot
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "notebooks"))
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+import oisstools as ot
+
+
+# Coarse stand-in for the quarter degree grid, one cell every 10 degrees
+GRID_LAT = np.arange(-89.875, 90, 0.25)[::40]
+GRID_LON = np.arange(0.125, 360, 0.25)[::40]
+
+
+@pytest.fixture
+def box_root(tmp_path, monkeypatch):
+  """
+  Empty Box folder for the test, ot.set_workspace() points every workspace at it
+  """
+  root = f"{tmp_path}/"
+  os.makedirs(f"{root}RES_Data/OISST/oisst_mainstays/update_caches", exist_ok = True)
+  monkeypatch.setattr(ot, "set_workspace", lambda workspace: root)
+  return root
+
+
+def write_daily_file(box_root, date, value, preliminary = False):
+  """
+  Write a daily NCEI style file (time, zlev, lat, lon) into its month cache 
+  folder, filled with value and one land cell
+  """
+  day = pd.Timestamp(date)
+  sst = np.full((1, 1, len(GRID_LAT), len(GRID_LON)), value, dtype = "float32")
+  sst[0, 0, 0, 0] = np.nan
+  daily_ds = xr.Dataset({"sst" : (("time", "zlev", "lat", "lon"), sst)}, 
+                        coords = {"time" : [day], "zlev" : [0.0], "lat" : GRID_LAT, "lon" : GRID_LON})
+  daily_ds["sst"].encoding = {"dtype" : "int16", "scale_factor" : 0.01, "_FillValue" : -999}
+  suffix = "_preliminary" if preliminary else ""
+  month_cache = f"{box_root}RES_Data/OISST/oisst_mainstays/update_caches/{day:%m}/"
+  os.makedirs(month_cache, exist_ok = True)
+  file_path = f"{month_cache}oisst-avhrr-v02r01.{day:%Y%m%d}{suffix}.nc"
+  daily_ds.to_netcdf(file_path)
+  return file_path
+
+
+def write_annual_file(box_root, yr, sst, lat = GRID_LAT, lon = GRID_LON):
+  """
+  Write an annual observation file with sst shaped (days, lat, lon)
+  """
+  times = pd.date_range(f"{yr}-01-01", periods = sst.shape[0])
+  annual_ds = xr.Dataset({"sst" : (("time", "lat", "lon"), sst.astype("float32"))}, 
+                         coords = {"time" : times, "lat" : lat, "lon" : lon})
+  out_folder = f"{box_root}RES_Data/OISST/oisst_mainstays/annual_observations/"
+  os.makedirs(out_folder, exist_ok = True)
+  annual_ds.to_netcdf(f"{out_folder}sst.day.mean.{yr}.v2.nc")
+  return annual_ds
+
+
+def write_climatology(box_root, reference_period, seed = 0):
+  """
+  Write a random daily climatology (modified_ordinal_day, lat, lon) for reference_period
+  """
+  rng = np.random.default_rng(seed)
+  clim = xr.Dataset({"sst" : (("modified_ordinal_day", "lat", "lon"), rng.normal(10, 2, (366, len(GRID_LAT), len(GRID_LON))))}, 
+                    coords = {"modified_ordinal_day" : np.arange(1, 367), "lat" : GRID_LAT, "lon" : GRID_LON})
+  clim_folder = f"{box_root}RES_Data/OISST/oisst_mainstays/daily_climatologies/"
+  os.makedirs(clim_folder, exist_ok = True)
+  clim_path = f"{clim_folder}daily_clims_{reference_period.replace('-', 'to')}.nc"
+  clim.to_netcdf(clim_path)
+  return clim_path
@@ -0,0 +1,58 @@
+# Incremental updates of the annual observation files from the month caches
+
+import os
+
+import numpy as np
+import xarray as xr
+
+import oisstools as ot
+from conftest import write_daily_file
+
+
+def read_annual(box_root, yr):
+  with xr.open_dataset(f"{box_root}RES_Data/OISST/oisst_mainstays/annual_observations/sst.day.mean.{yr}.v2.nc") as annual_ds:
+    return annual_ds.load()
+
+
+def test_update_annual_file_appends_and_overwrites(box_root):
+  cache_root = ot.set_cache_root(box_root)
+  write_daily_file(box_root, "2020-01-03", 9.0)
+  for day, value in [("2021-01-01", 1.0), ("2021-01-02", 2.0), ("2021-01-03", 3.0)]:
+    write_daily_file(box_root, day, value, preliminary = day == "2021-01-02")
+  
+  # No file yet, built from the caches for 2021 only
+  out_path = ot.update_annual_file("12", "01", 2021, workspace = "docker", verbose = False)
+  annual = read_annual(box_root, 2021)
+  assert len(annual.time) == 3
+  np.testing.assert_allclose(annual.sst.values[:, 1, 1], [1.0, 2.0, 3.0])
+  
+  # Two new days and a finalized day
+  manifest = ot.load_cache_manifest(cache_root)
+  for day, value in [("2021-01-04", 4.0), ("2021-01-05", 5.0), ("2021-01-02", 2.5)]:
+    ot.record_cache_file(manifest, cache_root, write_daily_file(box_root, day, value), verbose = False)
+  ot.save_cache_manifest(cache_root, manifest)
+  ot.update_annual_file("12", "01", 2021, workspace = "docker", verbose = False)
+  
+  annual = read_annual(box_root, 2021)
+  np.testing.assert_allclose(annual.sst.values[:, 1, 1], [1.0, 2.5, 3.0, 4.0, 5.0])
+  assert np.isnan(annual.sst.values[:, 0, 0]).all()
+  
+  # Same result as assembling the whole year again
+  rebuilt = ot.build_annual_from_cache("12", "01", workspace = "docker", verbose = False, update_yr = 2021)
+  np.testing.assert_allclose(annual.sst.values, rebuilt.sst.values)
+  np.testing.assert_array_equal(annual.time.values, rebuilt.time.values)
+  
+  # Nothing left to write
+  mtime = os.path.getmtime(out_path)
+  ot.update_annual_file("12", "01", 2021, workspace = "docker", verbose = False)
+  assert os.path.getmtime(out_path) == mtime
+
+
+def test_update_annual_file_rebuilds_past_year_alone(box_root):
+  write_daily_file(box_root, "2020-12-30", 1.0)
+  write_daily_file(box_root, "2020-12-31", 2.0)
+  write_daily_file(box_root, "2021-12-01", 7.0)
+  
+  ot.update_annual_file("11", "12", 2020, workspace = "docker", verbose = False)
+  annual = read_annual(box_root, 2020)
+  assert [str(day)[0:10] for day in annual.time.values] == ["2020-12-30", "2020-12-31"]
@@ -0,0 +1,42 @@
+# Vectorized daily anomalies against the original per-day calc_anom()
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+import oisstools as ot
+from conftest import GRID_LAT, GRID_LON, write_annual_file, write_climatology
+
+
+def test_calc_daily_anoms_matches_calc_anom(box_root):
+  rng   = np.random.default_rng(1)
+  times = pd.date_range("2020-01-01", "2020-12-31")
+  obs   = xr.Dataset({"sst" : (("time", "lat", "lon"), rng.normal(10, 3, (len(times), len(GRID_LAT), len(GRID_LON))))}, 
+                     coords = {"time" : times, "lat" : GRID_LAT, "lon" : GRID_LON})
+  with xr.open_dataset(write_climatology(box_root, "1982-2011")) as daily_clims:
+    per_day = ot.add_mod(obs, "time").groupby("time").map(lambda day: ot.calc_anom(day, daily_clims["sst"]))
+    
+    eager = ot.calc_daily_anoms(obs, daily_clims)
+    np.testing.assert_allclose(eager["sst"].values, per_day["sst"].values)
+    
+    # Observations opened in chunks stay lazy, no climatology cube is built into the graph
+    obs.to_netcdf(f"{box_root}obs.nc")
+    with xr.open_dataset(f"{box_root}obs.nc", chunks = {"time" : 31}) as chunked_obs:
+      lazy = ot.calc_daily_anoms(chunked_obs, daily_clims)
+      assert lazy["sst"].chunks[0][0] == 31
+      graph_arrays = [value for value in dict(lazy["sst"].data.__dask_graph__()).values() if isinstance(value, np.ndarray)]
+      one_day = len(GRID_LAT) * len(GRID_LON) * 8
+      assert all(value.nbytes < one_day for value in graph_arrays)
+      np.testing.assert_allclose(lazy["sst"].values, per_day["sst"].values)
+
+
+def test_export_annual_anomalies_uses_reference_period(box_root):
+  rng = np.random.default_rng(2)
+  write_annual_file(box_root, 2001, rng.normal(10, 3, (365, len(GRID_LAT), len(GRID_LON))))
+  write_climatology(box_root, "1991-2020")
+  out_paths = ot.export_annual_anomalies(box_root, 2001, 2001, reference_period = "1991-2020", verbose = False)
+  assert out_paths[0].endswith("1991to2020_climatology/daily_anoms_2001.nc")
+  with xr.open_dataset(out_paths[0]) as anoms:
+    assert "1991-2020" in anoms.attrs["comment"]
+    assert "1991-2020" in anoms.attrs["history"]
+    assert "1982-2011" not in anoms.attrs["comment"]
@@ -0,0 +1,49 @@
+# Cache manifest and annual assembly from the month caches
+
+import os
+
+import numpy as np
+
+import oisstools as ot
+from conftest import write_daily_file
+
+
+def test_manifest_keeps_final_over_preliminary(box_root):
+  cache_root = ot.set_cache_root(box_root)
+  prelim = write_daily_file(box_root, "2021-03-01", 1.0, preliminary = True)
+  manifest = ot.load_cache_manifest(cache_root)
+  assert manifest["20210301"]["status"] == "preliminary"
+  
+  final = write_daily_file(box_root, "2021-03-01", 2.0)
+  removed = ot.record_cache_file(manifest, cache_root, final, verbose = False)
+  assert removed.endswith(os.path.basename(prelim))
+  assert manifest["20210301"]["status"] == "final"
+  assert not os.path.exists(prelim)
+
+
+def test_manifest_prunes_deleted_files_on_request(box_root):
+  cache_root = ot.set_cache_root(box_root)
+  write_daily_file(box_root, "2021-03-01", 1.0)
+  gone = write_daily_file(box_root, "2021-03-02", 1.0)
+  ot.save_cache_manifest(cache_root, ot.rebuild_cache_manifest(cache_root))
+  
+  # Normal loads trust the manifest, pruning is asked for
+  os.remove(gone)
+  assert sorted(ot.load_cache_manifest(cache_root)) == ["20210301", "20210302"]
+  assert sorted(ot.load_cache_manifest(cache_root, prune = True)) == ["20210301"]
+  assert sorted(ot.load_cache_manifest(cache_root)) == ["20210301"]
+
+
+def test_build_annual_uses_only_update_year(box_root):
+  write_daily_file(box_root, "2020-01-05", 5.0)
+  write_daily_file(box_root, "2021-01-01", 1.0)
+  write_daily_file(box_root, "2021-01-02", 2.0)
+  write_daily_file(box_root, "2021-02-01", 3.0)
+  
+  annual = ot.build_annual_from_cache("01", "02", workspace = "docker", verbose = False, update_yr = 2021)
+  assert [str(day)[0:10] for day in annual.time.values] == ["2021-01-01", "2021-01-02", "2021-02-01"]
+  np.testing.assert_allclose(annual.sst.values[:, 1, 1], [1.0, 2.0, 3.0])
+  
+  # Months after this_month are left out
+  annual = ot.build_annual_from_cache("12", "01", workspace = "docker", verbose = False, update_yr = 2021)
+  assert len(annual.time) == 2
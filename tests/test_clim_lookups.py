@@ -0,0 +1,91 @@
+# Regional climatology lookups by MOD, against the per-row merge they replaced
+
+import math
+
+import numpy as np
+import pandas as pd
+
+import oisstools as ot
+
+
+def merge_climatology(old_ts, new_ts):
+  # The merge on modified_ordinal_day rejoin_climatology() used before the lookups
+  clim = old_ts[["modified_ordinal_day", "sst_clim", "clim_sd"]].drop_duplicates()
+  new_ts = ot.add_mod_to_ts(new_ts.copy())
+  anom_timeline = new_ts.merge(clim, how = "left", on = "modified_ordinal_day")
+  anom_timeline["sst_anom"] = anom_timeline["sst"] - anom_timeline["sst_clim"]
+  return anom_timeline
+
+
+def make_clim_ts(start = "2019-01-01", end = "2020-12-31", skip_mods = (), seed = 0):
+  # Two years of a timeline, the climatology columns repeat by MOD
+  rng = np.random.default_rng(seed)
+  clim_mu, clim_sd = rng.normal(10, 3, 366), rng.uniform(0.5, 2, 366)
+  clim_ts = ot.add_mod_to_ts(pd.DataFrame({"time" : pd.date_range(start, end)}))
+  clim_ts = clim_ts[~clim_ts["modified_ordinal_day"].isin(skip_mods)].reset_index(drop = True)
+  mod_idx = clim_ts["modified_ordinal_day"].values - 1
+  clim_ts["sst"] = clim_mu[mod_idx] + rng.normal(0, 1, len(clim_ts))
+  clim_ts["sst_clim"], clim_ts["clim_sd"] = clim_mu[mod_idx], clim_sd[mod_idx]
+  clim_ts["sst_anom"] = clim_ts["sst"] - clim_ts["sst_clim"]
+  return clim_ts
+
+
+def make_new_ts(seed = 1):
+  # End of February into March in a non-leap and a leap year, and both year ends
+  times = pd.DatetimeIndex(list(pd.date_range("2021-02-25", "2021-03-03")) + list(pd.date_range("2024-02-27", "2024-03-02"))
+                           + [pd.Timestamp("2021-12-31"), pd.Timestamp("2022-01-01"), pd.Timestamp("2024-12-31")]).sort_values()
+  return pd.DataFrame({"time" : times, "sst" : np.random.default_rng(seed).normal(10, 3, len(times))})
+
+
+def test_rejoin_climatology_matches_merge():
+  old_ts, new_ts = make_clim_ts(), make_new_ts()
+  rejoined = ot.rejoin_climatology(old_ts, new_ts)
+  pd.testing.assert_frame_equal(rejoined, merge_climatology(old_ts, new_ts), check_dtype = False)
+
+  # Dec 31 is MOD 366 in any year, Feb 28 and Mar 1 of 2021 step over MOD 60
+  mods = rejoined.set_index("time")["modified_ordinal_day"]
+  assert mods[pd.Timestamp("2021-12-31")] == 366 and mods[pd.Timestamp("2024-12-31")] == 366
+  assert list(mods["2021-02-27":"2021-03-02"]) == [58, 59, 61, 62]
+  assert list(mods["2024-02-28":"2024-03-01"]) == [59, 60, 61]
+
+  # The same from a lookup passed in
+  from_lookup = ot.rejoin_climatology(None, new_ts, clim_lookup = ot.build_clim_lookup(old_ts))
+  pd.testing.assert_frame_equal(from_lookup, rejoined)
+
+
+def test_missing_mods_are_nan_like_the_merge():
+  # A timeline that has never had a Feb 29 or the last days of December
+  old_ts = make_clim_ts(start = "2021-01-01", end = "2021-12-27", skip_mods = (60,))
+  new_ts = make_new_ts()
+  clim_lookup = ot.build_clim_lookup(old_ts)
+  assert np.isnan(clim_lookup[[59, 362, 363, 364, 365]]).all()
+  rejoined = ot.rejoin_climatology(old_ts, new_ts, clim_lookup = clim_lookup)
+  pd.testing.assert_frame_equal(rejoined, merge_climatology(old_ts, new_ts), check_dtype = False)
+  assert rejoined.set_index("time").loc[pd.Timestamp("2024-02-29"), ["sst_clim", "sst_anom"]].isna().all()
+
+
+def test_build_clim_lookups_from_csvs(box_root):
+  region_names = ot.get_region_names("nelme_regions")
+  ts_paths = ot.get_timeseries_paths(box_root, region_names, "nelme_regions")
+  for region_num, ts_path in enumerate(ts_paths[0:2]):
+    ot.update_timeseries_csv(ts_path, make_clim_ts(seed = region_num))
+
+  clim_lookups = ot.build_clim_lookups(box_root, "nelme_regions", verbose = False)
+  assert sorted(clim_lookups) == sorted(region_names[0:2])
+  loaded = ot.load_clim_lookups(box_root, "nelme_regions")
+  new_ts = make_new_ts()
+  for region_num, region_name in enumerate(region_names[0:2]):
+    np.testing.assert_array_equal(loaded[region_name], clim_lookups[region_name])
+    old_ts = pd.read_csv(ts_paths[region_num], parse_dates = ["time"])
+    pd.testing.assert_frame_equal(ot.rejoin_climatology(None, new_ts, clim_lookup = loaded[region_name]),
+                                  merge_climatology(old_ts, new_ts), check_dtype = False)
+
+
+def test_calc_ll_columns_match_rows():
+  anom_ts = ot.calc_anomaly_columns(make_new_ts(), ot.build_clim_lookup(make_clim_ts()), add_stats = True)
+  by_row = anom_ts.apply(lambda row : math.log(2 * math.pi * row["clim_sd"] ** 2) / 2
+                         + (row["sst"] - row["sst_clim"]) ** 2 / (2 * row["clim_sd"] ** 2), axis = 1)
+  np.testing.assert_allclose(ot.calc_ll(anom_ts, "sst", "sst_clim", "clim_sd").values, by_row.values)
+  np.testing.assert_allclose(anom_ts["log_lik"].values, by_row.values)
+  np.testing.assert_allclose(ot.calc_ll(anom_ts.iloc[3], "sst", "sst_clim", "clim_sd"), by_row.values[3])
+  np.testing.assert_allclose(anom_ts["sst_zscore"].values, (anom_ts["sst_anom"] / anom_ts["clim_sd"]).values)
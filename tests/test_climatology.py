@@ -0,0 +1,115 @@
+# Streaming (Welford) climatology and rolling it forward by single years
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+import oisstools as ot
+from conftest import GRID_LAT, GRID_LON, write_annual_file
+
+
+def write_years(box_root, years, seed = 0):
+  rng = np.random.default_rng(seed)
+  year_data = {}
+  for yr in years:
+    n_days = len(pd.date_range(f"{yr}-01-01", f"{yr}-12-31"))
+    sst = rng.normal(12 + 0.1 * (yr - 2000), 3, (n_days, len(GRID_LAT), len(GRID_LON)))
+    sst[:, 0, 0] = np.nan
+    sst[rng.random(sst.shape) < 0.05] = np.nan
+    year_data[yr] = write_annual_file(box_root, yr, sst)
+  return year_data
+
+
+def expected_climatology(year_data, years):
+  # Stack every day by MOD with plain pandas/numpy
+  stacked = xr.concat([year_data[yr]["sst"].astype("float64") for yr in years], dim = "time")
+  days = pd.DatetimeIndex(stacked["time"].values)
+  mods = days.dayofyear + ((~days.is_leap_year) & (days.month >= 3))
+  stacked = stacked.assign_coords(modified_ordinal_day = ("time", np.asarray(mods)))
+  by_mod = stacked.groupby("modified_ordinal_day")
+  return by_mod.mean("time"), by_mod.std("time", ddof = 1), by_mod.count("time")
+
+
+def test_build_climatology_matches_direct_mean_and_sd(box_root):
+  year_data = write_years(box_root, range(2001, 2005))
+  daily_clims = ot.build_oisst_climatology(box_root, 2001, 2004, save = False, verbose = False)
+  clim_mean, clim_sd, clim_n = expected_climatology(year_data, range(2001, 2005))
+
+  np.testing.assert_allclose(daily_clims["sst"].values, clim_mean.values, rtol = 1e-5)
+  np.testing.assert_allclose(daily_clims["sst_sd"].values, clim_sd.values, rtol = 1e-4)
+  np.testing.assert_array_equal(daily_clims["n_obs"].values, clim_n.values)
+  assert np.isnan(daily_clims["sst"].values[:, 0, 0]).all()
+
+  # Feb 29 (MOD 60) is only in the leap year
+  assert daily_clims["n_obs"].sel(modified_ordinal_day = 60).max() == 1
+  assert np.isnan(daily_clims["sst_sd"].sel(modified_ordinal_day = 60).values).all()
+
+
+def test_roll_climatology_matches_rebuild(box_root):
+  write_years(box_root, range(2001, 2006))
+  ot.build_oisst_climatology(box_root, 2001, 2004, verbose = False)
+  rolled  = ot.roll_oisst_climatology(box_root, 2001, 2004, steps = 1, verbose = False)
+  rebuilt = ot.build_oisst_climatology(box_root, 2002, 2005, save = False, verbose = False)
+
+  np.testing.assert_array_equal(rolled["n_obs"].values, rebuilt["n_obs"].values)
+  np.testing.assert_allclose(rolled["sst"].values, rebuilt["sst"].values, rtol = 1e-5)
+  np.testing.assert_allclose(rolled["sst_sd"].values, rebuilt["sst_sd"].values, rtol = 1e-4)
+  assert ot.load_clim_state(box_root, 2002, 2005).attrs["years"] == "2002 2003 2004 2005"
+
+
+def test_clim_state_tracks_its_years(box_root):
+  year_data = write_years(box_root, [2001, 2002])
+  clim_state = ot.new_clim_state(GRID_LAT, GRID_LON)
+  ot.update_clim_state(clim_state, year_data[2001])
+  with pytest.raises(ValueError):
+    ot.update_clim_state(clim_state, year_data[2001])
+  with pytest.raises(ValueError):
+    ot.update_clim_state(clim_state, year_data[2002], remove = True)
+
+  # Adding and removing a year leaves the state as it was
+  before = clim_state.copy(deep = True)
+  ot.update_clim_state(clim_state, year_data[2002])
+  ot.update_clim_state(clim_state, year_data[2002], remove = True)
+  np.testing.assert_array_equal(clim_state["n_obs"].values, before["n_obs"].values)
+  np.testing.assert_allclose(clim_state["sst_mean"].values, before["sst_mean"].values, atol = 1e-10)
+  np.testing.assert_allclose(clim_state["sst_m2"].values, before["sst_m2"].values, atol = 1e-8)
+
+
+def test_clim_state_is_packed_to_ocean_cells(box_root):
+  year_data = write_years(box_root, range(2001, 2004))
+  ot.build_ocean_mask(box_root, 2001, verbose = False)
+  daily_clims = ot.build_oisst_climatology(box_root, 2001, 2003, verbose = False)
+  clim_state = ot.load_clim_state(box_root, 2001, 2003)
+  assert dict(clim_state["n_obs"].sizes) == {"modified_ordinal_day" : 366, "cell" : len(GRID_LAT) * len(GRID_LON) - 1}
+  assert 0 not in clim_state["cell"].values
+
+  # Unpacked onto the grid with land empty
+  clim_mean, _, _ = expected_climatology(year_data, range(2001, 2004))
+  np.testing.assert_allclose(daily_clims["sst"].sel(modified_ordinal_day = clim_mean["modified_ordinal_day"]).values, clim_mean.values, rtol = 1e-5)
+  assert (daily_clims["n_obs"].values[:, 0, 0] == 0).all() and np.isnan(daily_clims["sst"].values[:, 0, 0]).all()
+
+  # States saved on the full grid are packed on load
+  full_state = xr.Dataset({state_var : (("modified_ordinal_day", "lat", "lon"), ot.unpack_cells(clim_state[state_var].values, clim_state["cell"].values, len(GRID_LAT), len(GRID_LON), fill_value = 0))
+                           for state_var in clim_state.data_vars},
+                          coords = {"modified_ordinal_day" : np.arange(1, 367), "lat" : GRID_LAT, "lon" : GRID_LON}, attrs = clim_state.attrs)
+  full_state.to_netcdf(ot.get_clim_state_path(box_root, 2001, 2003))
+  full_clims = ot.clim_from_state(ot.load_clim_state(box_root, 2001, 2003), 2001, 2003)
+  np.testing.assert_array_equal(full_clims["sst"].values, daily_clims["sst"].values)
+
+
+def test_sliding_climatologies_match_fresh_builds(box_root):
+  # Windows across two leap years, with an ocean mask so the states are packed
+  write_years(box_root, range(2001, 2010))
+  ot.build_ocean_mask(box_root, 2001, verbose = False)
+  ot.build_sliding_climatologies(box_root, 2001, 2009, window = 4, verbose = False)
+
+  for start_yr in range(2001, 2007):
+    end_yr = start_yr + 3
+    fresh = ot.build_oisst_climatology(box_root, start_yr, end_yr, save = False, verbose = False)
+    with ot.load_oisst_climatology(box_root, reference_period = f"{start_yr}-{end_yr}") as slid:
+      np.testing.assert_array_equal(slid["n_obs"].values, fresh["n_obs"].values)
+      np.testing.assert_allclose(slid["sst"].values, fresh["sst"].values, rtol = 1e-5)
+      np.testing.assert_allclose(slid["sst_sd"].values, fresh["sst_sd"].values, rtol = 1e-4)
+    years = " ".join(str(yr) for yr in range(start_yr, end_yr + 1))
+    assert ot.load_clim_state(box_root, start_yr, end_yr).attrs["years"] == years
@@ -0,0 +1,90 @@
+# Downloader checks against a local http.server standing in for the NCEI month listing
+
+import functools
+import http.server
+import os
+import threading
+
+import pytest
+
+import oisstools as ot
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+  def log_message(self, *args):
+    pass
+
+
+@pytest.fixture
+def month_server(tmp_path):
+  """
+  Serve a folder of fake daily files, yields the folder and its url
+  """
+  served = tmp_path / "served"
+  served.mkdir()
+  for day in ["01", "02", "03"]:
+    (served / f"oisst-avhrr-v02r01.202103{day}.nc").write_bytes(os.urandom(2048))
+  (served / "readme.txt").write_text("not a daily file")
+  
+  handler = functools.partial(QuietHandler, directory = str(served))
+  server  = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+  thread  = threading.Thread(target = server.serve_forever, daemon = True)
+  thread.start()
+  try:
+    yield served, f"http://127.0.0.1:{server.server_address[1]}/"
+  finally:
+    server.shutdown()
+    server.server_close()
+
+
+def test_list_oisst_files_keeps_nc_only(month_server):
+  served, url = month_server
+  assert sorted(ot.list_oisst_files(url)) == sorted(f.name for f in served.glob("*.nc"))
+
+
+def test_download_month_files_skips_unchanged(month_server, tmp_path):
+  served, url = month_server
+  month_cache = f"{tmp_path / 'cache'}/"
+  
+  first = ot.download_month_files(url, month_cache, max_workers = 2, verbose = False)
+  assert len(first) == 3
+  for fpath in first:
+    fname = os.path.basename(fpath)
+    assert open(fpath, "rb").read() == (served / fname).read_bytes()
+  
+  # Nothing changed on the server
+  assert ot.download_month_files(url, month_cache, max_workers = 2, verbose = False) == []
+  
+  # A re-processed day comes back with a new size and time, only it is fetched again
+  changed = served / "oisst-avhrr-v02r01.20210302.nc"
+  changed.write_bytes(os.urandom(4096))
+  stat = changed.stat()
+  os.utime(changed, (stat.st_atime, stat.st_mtime + 3600))
+  again = ot.download_month_files(url, month_cache, max_workers = 2, verbose = False)
+  assert [os.path.basename(fpath) for fpath in again] == [changed.name]
+  assert open(again[0], "rb").read() == changed.read_bytes()
+  
+  # No temporary files are left in the cache
+  assert not any(fname.endswith(".part") for fname in os.listdir(month_cache))
+
+
+def test_preliminary_files_for_final_days_are_not_fetched(month_server, tmp_path):
+  served, url = month_server
+  month_cache = f"{tmp_path / 'cache'}/"
+  (served / "oisst-avhrr-v02r01.20210304_preliminary.nc").write_bytes(os.urandom(1024))
+  (served / "oisst-avhrr-v02r01.20210301_preliminary.nc").write_bytes(os.urandom(1024))
+
+  # 20210301 is already final, its preliminary copy is left on the server every run
+  for _ in range(2):
+    downloads = ot.download_month_files(url, month_cache, max_workers = 2, verbose = False, final_dates = ["20210301"])
+    assert "oisst-avhrr-v02r01.20210301_preliminary.nc" not in [os.path.basename(fpath) for fpath in downloads]
+  assert not os.path.exists(f"{month_cache}oisst-avhrr-v02r01.20210301_preliminary.nc")
+  assert os.path.exists(f"{month_cache}oisst-avhrr-v02r01.20210304_preliminary.nc")
+
+
+def test_cached_file_current_compares_size(tmp_path):
+  dl_path = tmp_path / "day.nc"
+  dl_path.write_bytes(b"1234")
+  assert ot.cached_file_current(str(dl_path), {"Content-Length" : "4"}) == True
+  assert ot.cached_file_current(str(dl_path), {"Content-Length" : "5"}) == False
+  assert ot.cached_file_current(str(tmp_path / "missing.nc"), {}) == False
@@ -0,0 +1,151 @@
+# Heatwave / cold-spell detection on (cells, days) blocks
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+import oisstools as ot
+from conftest import GRID_LAT, GRID_LON, write_annual_file, write_climatology
+
+
+def loop_events(exceed, min_duration = 5, max_gap = 2):
+  # One cell at a time: runs long enough, then join across short gaps
+  events = []
+  for cell, row in enumerate(exceed):
+    runs, day = [], 0
+    while day < len(row):
+      if row[day]:
+        start = day
+        while day < len(row) and row[day]:
+          day += 1
+        if day - start >= min_duration:
+          runs.append([start, day])
+      else:
+        day += 1
+    joined = []
+    for start, end in runs:
+      if len(joined) > 0 and start - joined[-1][1] <= max_gap:
+        joined[-1][1] = end
+      else:
+        joined.append([start, end])
+    events += [(cell, start, end) for start, end in joined]
+  return events
+
+
+def test_find_events_by_hand():
+  exceed = np.zeros((3, 30), dtype = bool)
+  exceed[0, 2:6]   = True    # 4 days, too short
+  exceed[0, 10:15] = True    # 5 days
+  exceed[0, 17:23] = True    # gap of 2, joined
+  exceed[1, 0:5]   = True    # starts on the first day
+  exceed[1, 8:13]  = True    # gap of 3, kept apart
+  exceed[2, 25:30] = True    # runs to the last day
+  cell, start, end = ot.find_events(exceed, min_duration = 5, max_gap = 2)
+  assert list(zip(cell, start, end)) == [(0, 10, 23), (1, 0, 5), (1, 8, 13), (2, 25, 30)]
+
+  none = ot.find_events(np.zeros((2, 10), dtype = bool))
+  assert all(len(arr) == 0 for arr in none)
+
+
+def test_find_events_matches_loop():
+  rng = np.random.default_rng(1)
+  exceed = rng.random((50, 365)) < 0.7
+  for min_duration, max_gap in [(5, 2), (3, 0), (1, 4)]:
+    cell, start, end = ot.find_events(exceed, min_duration = min_duration, max_gap = max_gap)
+    assert list(zip(cell, start, end)) == loop_events(exceed, min_duration, max_gap)
+
+
+def test_detect_events_intensity_and_category():
+  thresholds = np.full((2, 20), 1.0)
+  anoms = np.zeros((2, 20))
+  anoms[0, 3:10] = [1.5, 2.0, 3.5, 2.5, 1.2, 1.1, 1.3]   # peak 3.5x threshold, severe
+  anoms[1, 5:11] = [1.5, 1.5, np.nan, 1.5, 1.5, 1.5]      # missing day breaks the run
+  anoms[1, 12:18] = 4.5                                  # capped at extreme
+  events = ot.detect_events(anoms, thresholds)
+  assert list(events["cell"]) == [0, 1] and list(events["start"]) == [3, 12] and list(events["end"]) == [10, 18]
+  np.testing.assert_allclose(events["max_intensity"], [3.5, 4.5])
+  assert list(events["category"]) == [3, 4]
+  assert events["in_event"].sum() == 13 and events["in_event"][0, 3:10].all()
+
+  # Cold spells mirror heatwaves
+  cold = ot.detect_events(-anoms, -thresholds, cold_spells = True)
+  np.testing.assert_array_equal(cold["in_event"], events["in_event"])
+  np.testing.assert_allclose(cold["max_intensity"], [-3.5, -4.5])
+  assert list(cold["category"]) == [3, 4]
+
+
+def test_detect_events_matches_loop():
+  rng = np.random.default_rng(2)
+  anoms = rng.normal(0, 1.5, (40, 400))
+  anoms[rng.random(anoms.shape) < 0.02] = np.nan
+  thresholds = rng.uniform(0.5, 1.0, anoms.shape)
+  events = ot.detect_events(anoms, thresholds)
+
+  with np.errstate(invalid = "ignore"):
+    expected = loop_events(anoms > thresholds)
+  assert list(zip(events["cell"], events["start"], events["end"])) == expected
+  for idx, (cell, start, end) in enumerate(expected):
+    peak_day = start + np.nanargmax(anoms[cell, start:end])
+    assert events["max_intensity"][idx] == anoms[cell, peak_day]
+    ratio = anoms[cell, peak_day] / thresholds[cell, peak_day]
+    assert events["category"][idx] == min(max(int(np.floor(ratio)), 1), 4)
+    assert events["in_event"][cell, start:end].all()
+  assert events["in_event"].sum() == sum(end - start for cell, start, end in expected)
+
+
+def test_summarize_events_by_year():
+  # Two years of 10 days, one event across the new year
+  day_years = np.repeat([2001, 2002], 10)
+  anoms = np.zeros((2, 20))
+  anoms[0, 7:14]  = 2.5
+  anoms[0, 17:20] = 1.5
+  anoms[1, 1:6]   = 1.5
+  events = ot.detect_events(anoms, np.ones((2, 20)), min_duration = 3)
+  summary = ot.summarize_events_by_year(events, day_years, np.array([2001, 2002]))
+  np.testing.assert_array_equal(summary["events"], [[1, 1], [1, 0]])
+  np.testing.assert_array_equal(summary["days"], [[3, 5], [7, 0]])
+  np.testing.assert_allclose(summary["max_intensity"], [[2.5, 1.5], [1.5, np.nan]])
+  np.testing.assert_array_equal(summary["max_category"], [[2, 1], [1, 0]])
+
+
+def test_gridded_heatwaves_match_detect_events_by_cell(box_root):
+  # A non-leap then a leap year of anomalies, land in the corner
+  rng = np.random.default_rng(3)
+  write_climatology(box_root, "1982-2011")
+  with ot.load_oisst_climatology(box_root, reference_period = "1982-2011") as daily_clims:
+    clim_vals = daily_clims["sst"].transpose("modified_ordinal_day", "lat", "lon").values
+  for yr in [2003, 2004]:
+    days = pd.date_range(f"{yr}-01-01", f"{yr}-12-31")
+    mods = np.asarray(days.dayofyear + ((~days.is_leap_year) & (days.month >= 3)))
+    sst = clim_vals[mods - 1] + rng.normal(0, 1.5, (len(days), len(GRID_LAT), len(GRID_LON)))
+    sst[:, 0, 0] = np.nan
+    if yr == 2003:
+      sst[-4:, 9, 9] += 20      # runs into the next year
+    else:
+      sst[0:4, 9, 9] += 20
+    write_annual_file(box_root, yr, sst)
+  ot.build_ocean_mask(box_root, 2003, verbose = False)
+  ot.export_annual_anomalies(box_root, 2003, 2004, reference_period = "1982-2011", verbose = False)
+
+  # Thresholds that change a lot from one MOD to the next, so a misaligned day shows
+  thresholds = xr.DataArray(0.5 + 1.5 * rng.random((366, len(GRID_LAT), len(GRID_LON))), dims = ("modified_ordinal_day", "lat", "lon"),
+                            coords = {"modified_ordinal_day" : np.arange(1, 367), "lat" : GRID_LAT, "lon" : GRID_LON})
+  grids = ot.calc_gridded_heatwaves(box_root, 2003, 2004, thresholds, lat_chunk = 5, save = False, verbose = False)
+
+  anom_years = [xr.open_dataset(ot.get_annual_path(box_root, yr, anomalies = True, reference_period = "1982-2011")).load() for yr in [2003, 2004]]
+  anoms = xr.concat(anom_years, dim = "time")["sst"].transpose("time", "lat", "lon")
+  day_mods = ot.get_mod_values(anoms.indexes["time"])
+  day_years = np.asarray(anoms.indexes["time"].year)
+  assert day_mods[58:60].tolist() == [59, 61] and day_mods[365 + 58:365 + 61].tolist() == [59, 60, 61]
+  day_thresh = thresholds.values[day_mods - 1]
+  for lat_i in range(len(GRID_LAT)):
+    for lon_i in range(len(GRID_LON)):
+      cell_events = ot.detect_events(anoms.values[None, :, lat_i, lon_i], day_thresh[None, :, lat_i, lon_i])
+      expected = ot.summarize_events_by_year(cell_events, day_years, np.array([2003, 2004]))
+      for stat in ["events", "days", "max_intensity", "max_category"]:
+        np.testing.assert_array_equal(grids[f"mhw_{stat}"].values[:, lat_i, lon_i], expected[stat][:, 0].astype(grids[f"mhw_{stat}"].dtype))
+
+  # Land has no events, the event across the new year is counted in both years
+  assert grids["mhw_events"].values.sum() > 100
+  assert (grids["mhw_events"].values[:, 0, 0] == 0).all()
+  assert (grids["mhw_days"].values[:, 9, 9] >= 4).all()
@@ -0,0 +1,122 @@
+# Loading annual files with ot.load_box_oisst() and its saved file index
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+import oisstools as ot
+from conftest import GRID_LAT, GRID_LON, write_annual_file
+
+
+def write_anomaly_file(box_root, yr, value, reference_period):
+  times = pd.date_range(f"{yr}-01-01", periods = 3)
+  anom_ds = xr.Dataset({"sst" : (("time", "lat", "lon"), np.full((3, len(GRID_LAT), len(GRID_LON)), value, dtype = "float32"))},
+                       coords = {"time" : times, "lat" : GRID_LAT, "lon" : GRID_LON})
+  anom_path = ot.get_annual_path(box_root, yr, anomalies = True, reference_period = reference_period)
+  os.makedirs(os.path.dirname(anom_path), exist_ok = True)
+  anom_ds.to_netcdf(anom_path)
+
+
+def test_anomalies_load_for_their_reference_period(box_root):
+  for yr in [2020, 2021]:
+    write_anomaly_file(box_root, yr, 1.0, "1982-2011")
+    write_anomaly_file(box_root, yr, 2.0, "1991-2020")
+
+  for reference_period, value in [("1982-2011", 1.0), ("1991-2020", 2.0)]:
+    with ot.load_box_oisst(box_root, 2020, 2021, anomalies = True, profile = "map", reference_period = reference_period) as anoms:
+      assert anoms.sizes["time"] == 6
+      np.testing.assert_allclose(anoms["sst"].values, value)
+    index_path = ot.get_load_index_path(box_root, anomalies = True, reference_period = reference_period)
+    assert index_path.endswith(f"annual_anomalies_{reference_period.replace('-', 'to')}_index.json")
+    assert os.path.exists(index_path)
+
+
+def make_box_grid():
+  sst = np.arange(10 * len(GRID_LAT) * len(GRID_LON), dtype = "float64").reshape(10, len(GRID_LAT), len(GRID_LON))
+  return xr.Dataset({"sst" : (("time", "lat", "lon"), sst), "ice" : (("time", "lat", "lon"), sst * 0)},
+                    coords = {"time" : pd.date_range("2020-01-01", periods = 10), "lat" : GRID_LAT, "lon" : GRID_LON})
+
+
+def test_subset_oisst_box_dates_and_vars():
+  grid = make_box_grid()
+  sub = ot.subset_oisst(grid, lon_range = (-72, -52), lat_range = (30, 46), date_range = ("2020-01-03", "2020-01-05"), var_names = ["sst"])
+  assert list(sub.data_vars) == ["sst"]
+  np.testing.assert_array_equal(sub["lon"].values, [290.125, 300.125])
+  np.testing.assert_array_equal(sub["lat"].values, [30.125, 40.125])
+  assert sub.sizes["time"] == 3 and str(sub["time"].values[0])[0:10] == "2020-01-03"
+  np.testing.assert_array_equal(sub["sst"].values, grid["sst"].sel(lon = [290.125, 300.125], lat = [30.125, 40.125]).values[2:5])
+
+  # Same box in 0 to 360 longitudes
+  xr.testing.assert_identical(ot.subset_oisst(grid, lon_range = (288, 308), lat_range = (30, 46)), 
+                              ot.subset_oisst(grid, lon_range = (-72, -52), lat_range = (30, 46)))
+
+  # Across the longitude edge, relabelled to increase through 0
+  seam = ot.subset_oisst(grid, lon_range = (-15, 15))
+  np.testing.assert_array_equal(seam["lon"].values, [-9.875, 0.125, 10.125])
+  np.testing.assert_array_equal(seam["sst"].values, grid["sst"].isel(lon = [35, 0, 1]).values)
+
+  # A -180 to 180 grid with a box across the dateline
+  flipped = grid.assign_coords(lon = ((grid["lon"] + 180) % 360) - 180).sortby("lon")
+  dateline = ot.subset_oisst(flipped, lon_range = (170, -170))
+  np.testing.assert_array_equal(dateline["lon"].values, [170.125, 180.125])
+
+  with pytest.raises(ValueError):
+    ot.subset_oisst(grid, lat_range = (41, 45))
+  with pytest.raises(ValueError):
+    ot.subset_oisst(grid, lon_range = (1, 5))
+
+
+def test_load_box_oisst_subsets_each_year(box_root):
+  for yr in [2020, 2021, 2022]:
+    write_annual_file(box_root, yr, np.full((5, len(GRID_LAT), len(GRID_LON)), float(yr)))
+
+  for profile in [None, "map"]:
+    with ot.load_box_oisst(box_root, 2020, 2022, profile = profile, lon_range = (-15, 15), lat_range = (30, 46),
+                           date_range = ("2021-01-02", "2022-01-03")) as box_sst:
+      np.testing.assert_array_equal(box_sst["lon"].values, [-9.875, 0.125, 10.125])
+      np.testing.assert_array_equal(box_sst["lat"].values, [30.125, 40.125])
+      assert list(pd.DatetimeIndex(box_sst["time"].values).year) == [2021] * 4 + [2022] * 3
+      np.testing.assert_allclose(box_sst["sst"].values[:, 0, 0], [2021] * 4 + [2022] * 3)
+
+  # Years outside the date range are not opened
+  os.remove(ot.get_annual_path(box_root, 2020))
+  with ot.load_box_oisst(box_root, 2020, 2022, date_range = ("2021-01-04", "2022-12-31")) as late_sst:
+    assert late_sst.sizes["time"] == 7
+  with pytest.raises(ValueError):
+    ot.load_box_oisst(box_root, 2020, 2022, date_range = ("2024-01-01", "2024-12-31"))
+
+
+def expected_chunks(chunk_size, dim_size):
+  # Dask chunks of one dimension, -1 for the whole dimension
+  if chunk_size == -1 or chunk_size >= dim_size:
+    return (dim_size,)
+  return tuple(min(chunk_size, dim_size - start) for start in range(0, dim_size, chunk_size))
+
+
+@pytest.mark.parametrize("profile", ["map", "timeseries", "region", "full"])
+def test_profiles_give_their_chunks(box_root, profile):
+  # A 40 day and a 70 day year, chunks restart at each file
+  rng = np.random.default_rng(0)
+  for yr, n_days in [(2020, 40), (2021, 70)]:
+    write_annual_file(box_root, yr, rng.normal(10, 3, (n_days, len(GRID_LAT), len(GRID_LON))))
+  profile_chunks = ot.get_load_profile(profile)["chunks"]
+  with ot.load_box_oisst(box_root, 2020, 2021, profile = profile) as grid_obj:
+    assert list(grid_obj.data_vars) == ["sst"]
+    sst_chunks = dict(zip(grid_obj["sst"].dims, grid_obj["sst"].chunks))
+  assert sst_chunks["time"] == expected_chunks(profile_chunks["time"], 40) + expected_chunks(profile_chunks["time"], 70)
+  assert sst_chunks["lat"] == expected_chunks(profile_chunks["lat"], len(GRID_LAT))
+  assert sst_chunks["lon"] == expected_chunks(profile_chunks["lon"], len(GRID_LON))
+
+
+def test_profile_chunk_sizes_on_the_full_grid():
+  # The sizes in the ot.get_load_profile() docstring, float32 on the 720 x 1440 grid
+  documented = {"map" : 129e6, "timeseries" : 21e6, "region" : 5e6, "full" : 95e6}
+  for profile, doc_bytes in documented.items():
+    chunks = ot.get_load_profile(profile)["chunks"]
+    sizes = [{"time" : 366, "lat" : 720, "lon" : 1440}[dim] if size == -1 else size for dim, size in chunks.items()]
+    chunk_bytes = 4 * np.prod(sizes)
+    assert chunk_bytes <= 128 * 2 ** 20
+    assert abs(chunk_bytes - doc_bytes) / doc_bytes < 0.1
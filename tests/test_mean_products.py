@@ -0,0 +1,67 @@
+# Monthly and annual mean products kept up to date one month at a time
+
+import numpy as np
+import pandas as pd
+
+import oisstools as ot
+from conftest import GRID_LAT, GRID_LON, write_annual_file
+
+
+def write_mean_years(box_root, years, offset = 0.0, seed = 0):
+  rng = np.random.default_rng(seed)
+  year_data = {}
+  for yr in years:
+    n_days = len(pd.date_range(f"{yr}-01-01", f"{yr}-12-31"))
+    sst = rng.normal(12, 3, (n_days, len(GRID_LAT), len(GRID_LON))) + offset
+    sst[:, 0, 0] = np.nan
+    sst[rng.random(sst.shape) < 0.1] = np.nan
+    year_data[yr] = write_annual_file(box_root, yr, sst)
+  return year_data
+
+
+def test_mean_products_match_groupby(box_root):
+  year_data = write_mean_years(box_root, [2001, 2002])
+  ot.build_mean_products(box_root, 2001, 2002, verbose = False)
+
+  with ot.load_mean_product(box_root, "monthly") as monthly, ot.load_mean_product(box_root, "annual") as annual:
+    for yr, year_ds in year_data.items():
+      sst = year_ds["sst"].astype("float64")
+      month_slots = monthly.sel(time = slice(f"{yr}-01-01", f"{yr}-12-31"))
+      assert list(pd.DatetimeIndex(month_slots["time"].values).month) == list(range(1, 13))
+      np.testing.assert_allclose(month_slots["sst"].values, sst.groupby("time.month").mean("time").values, rtol = 1e-5)
+      np.testing.assert_array_equal(month_slots["n_days"].values, sst.groupby("time.month").count("time").values)
+
+      year_slot = annual.sel(time = f"{yr}-01-01")
+      np.testing.assert_allclose(year_slot["sst"].values, sst.groupby("time.year").mean("time").values[0], rtol = 1e-5)
+      np.testing.assert_array_equal(year_slot["n_days"].values, sst.count("time").values)
+      assert np.isnan(year_slot["sst"].values[0, 0]) and year_slot["n_days"].values[0, 0] == 0
+
+    # Slots before the first year are there but empty
+    assert np.isnan(monthly["sst"].sel(time = "2000-12-01").values).all()
+
+
+def test_update_only_rewrites_given_months(box_root):
+  write_mean_years(box_root, [2002])
+  ot.update_mean_products(box_root, 2002, verbose = False)
+  with ot.load_mean_product(box_root, "monthly") as monthly:
+    before = monthly.load()
+
+  # New data for the whole year, only March is refreshed
+  new_data = write_mean_years(box_root, [2002], offset = 5.0, seed = 1)[2002]["sst"].astype("float64")
+  ot.update_mean_products(box_root, 2002, months = [3], verbose = False)
+  with ot.load_mean_product(box_root, "monthly") as monthly, ot.load_mean_product(box_root, "annual") as annual:
+    after = monthly.load()
+    annual_mean = annual["sst"].sel(time = "2002-01-01").values
+  for month in range(1, 13):
+    month_after  = after.sel(time = f"2002-{month:02d}-01")
+    month_before = before.sel(time = f"2002-{month:02d}-01")
+    if month == 3:
+      np.testing.assert_allclose(month_after["sst"].values, new_data.sel(time = "2002-03").mean("time").values, rtol = 1e-5)
+    else:
+      np.testing.assert_array_equal(month_after["sst"].values, month_before["sst"].values)
+      np.testing.assert_array_equal(month_after["n_days"].values, month_before["n_days"].values)
+
+  # The annual mean is rolled up from the stored months, weighted by their days
+  year_slots = after.sel(time = slice("2002-01-01", "2002-12-31"))
+  weighted = (year_slots["sst"] * year_slots["n_days"]).sum("time") / year_slots["n_days"].sum("time")
+  np.testing.assert_allclose(annual_mean, weighted.values, rtol = 1e-5)
@@ -0,0 +1,59 @@
+# Ocean mask, pack/unpack and the packed region timeseries
+
+import numpy as np
+import pandas as pd
+
+import oisstools as ot
+from conftest import GRID_LAT, GRID_LON, write_annual_file
+
+
+def make_land_year(box_root, yr = 2020, n_days = 40, seed = 0):
+  rng = np.random.default_rng(seed)
+  sst = rng.normal(15, 4, (n_days, len(GRID_LAT), len(GRID_LON)))
+  sst[:, 3:6, 10:15] = np.nan
+  return write_annual_file(box_root, yr, sst)
+
+
+def test_ocean_cells_warn_without_mask(box_root, capsys):
+  cells = ot.get_ocean_cells(box_root, GRID_LAT, GRID_LON)
+  assert len(cells) == len(GRID_LAT) * len(GRID_LON)
+  assert "ot.build_ocean_mask()" in capsys.readouterr().out
+
+
+def test_pack_unpack_round_trip(box_root):
+  year_ds = make_land_year(box_root)
+  ocean_mask = ot.build_ocean_mask(box_root, 2020, verbose = False)
+  assert int(ocean_mask.sum()) == len(GRID_LAT) * len(GRID_LON) - 15
+
+  cells  = ot.get_ocean_cells(box_root, GRID_LAT, GRID_LON)
+  packed = ot.pack_cells(year_ds["sst"].values, cells)
+  assert packed.shape == (40, len(cells))
+  assert np.isfinite(packed).all()
+  np.testing.assert_array_equal(ot.unpack_cells(packed, cells, len(GRID_LAT), len(GRID_LON)), year_ds["sst"].values)
+
+
+def test_calc_ts_regions_packed_matches_full_grid(box_root, monkeypatch):
+  year_ds = make_land_year(box_root)
+  ot.build_ocean_mask(box_root, 2020, verbose = False)
+
+  # Hand built masks, one touching the land block and one wrapped in it
+  def region_mask(lat_idx, lon_idx):
+    sub_mask = np.ones((lat_idx[1] - lat_idx[0], lon_idx[1] - lon_idx[0]), dtype = bool)
+    return {"lat_idx" : lat_idx, "lon_idx" : lon_idx, "sub_mask" : sub_mask,
+            "sub_weights" : ot.get_region_weights(year_ds, lat_idx, sub_mask)}
+  masks = {"coast" : region_mask((2, 5), (8, 12)), "inland" : region_mask((3, 6), (10, 15)),
+           "open" : region_mask((10, 12), (20, 30))}
+  monkeypatch.setattr(ot, "build_region_mask", lambda grid_obj, shp_obj, shp_name: masks[shp_name])
+
+  names  = list(masks)
+  full   = ot.calc_ts_regions(year_ds, [None] * 3, names, time_chunk = 7, area_weighted = True)
+  packed = ot.calc_ts_regions(year_ds, [None] * 3, names, box_root = box_root, time_chunk = 7, area_weighted = True)
+  pd.testing.assert_frame_equal(full, packed)
+  assert packed.loc[packed["region"] == "inland", "sst"].isna().all()
+
+  # Against a plain nan-aware weighted mean of the coast window
+  coast   = year_ds["sst"].values[:, 2:5, 8:12]
+  weights = np.broadcast_to(ot.get_area_weights(GRID_LAT[2:5])[:, None], coast.shape[1:])
+  weights = np.where(np.isfinite(coast), weights, 0)
+  expected = np.nansum(coast * weights, axis = (1, 2)) / weights.sum(axis = (1, 2))
+  np.testing.assert_allclose(packed.loc[packed["region"] == "coast", "sst"].values, expected)
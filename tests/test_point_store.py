@@ -0,0 +1,75 @@
+# Time-major point store and extracting points from it
+
+import numpy as np
+import pandas as pd
+
+import oisstools as ot
+from conftest import GRID_LAT, GRID_LON, write_annual_file
+
+
+def write_point_year(box_root, yr, n_days, seed = 0):
+  rng = np.random.default_rng(seed)
+  sst = rng.normal(12, 3, (n_days, len(GRID_LAT), len(GRID_LON)))
+  sst[:, 0, 0] = np.nan
+  return write_annual_file(box_root, yr, sst)
+
+
+def test_snap_points_to_grid():
+  point_lat = [40.2, 40.2, 0.0, -89.9]
+  point_lon = [-5.0, 359.0, -179.9, 185.0]
+  lat_idx, lon_idx = ot.snap_points_to_grid(point_lat, point_lon, GRID_LAT, GRID_LON)
+  np.testing.assert_array_equal(GRID_LAT[lat_idx], [40.125, 40.125, 0.125, -89.875])
+  np.testing.assert_array_equal(GRID_LON[lon_idx], [350.125, 0.125, 180.125, 180.125])
+
+  # Same answer when the grid runs -180 to 180
+  flip_lon = np.sort(((GRID_LON + 180) % 360) - 180)
+  _, flip_idx = ot.snap_points_to_grid(point_lat, point_lon, GRID_LAT, flip_lon)
+  np.testing.assert_array_equal(flip_lon[flip_idx] % 360, GRID_LON[lon_idx])
+
+
+def test_extract_points_matches_sel(box_root):
+  year_ds = write_point_year(box_root, 2001, 365)
+  ot.build_ocean_mask(box_root, 2001, verbose = False)
+  ot.build_point_store(box_root, 2001, 2002, verbose = False)
+
+  # Two points share a cell, one is on land
+  points = pd.DataFrame({"station" : ["a", "b", "c", "land"],
+                         "lat" : [42.0, 41.0, -20.3, -89.9], "lon" : [-69.0, -71.0, 151.0, 0.2]})
+  dates = pd.date_range("2001-03-01", "2001-03-10")
+  point_ts = ot.extract_points(box_root, points, dates = dates)
+  assert len(point_ts) == len(points) * len(dates)
+  assert list(point_ts.columns) == ["station", "lat", "lon", "grid_lat", "grid_lon", "time", "sst"]
+  for _, point in points.iterrows():
+    expected = year_ds["sst"].sel(lat = point["lat"], lon = point["lon"] % 360, method = "nearest").sel(time = dates)
+    station_ts = point_ts[point_ts["station"] == point["station"]]
+    np.testing.assert_allclose(station_ts["sst"].values, expected.values, rtol = 1e-6)
+    np.testing.assert_array_equal(station_ts["time"].values, dates.values)
+  assert point_ts.loc[point_ts["station"] == "land", "sst"].isna().all()
+  np.testing.assert_array_equal(point_ts.loc[point_ts["station"] == "a", "sst"].values,
+                                point_ts.loc[point_ts["station"] == "b", "sst"].values)
+
+  # One date per point, days past the record are NaN
+  survey = points.assign(date = ["2001-01-05", "2001-12-31", "2002-06-01", "2001-01-01"])
+  survey_ts = ot.extract_points(box_root, survey, date_col = "date")
+  assert len(survey_ts) == len(survey)
+  np.testing.assert_allclose(survey_ts["sst"].values[0], year_ds["sst"].sel(lat = 42.0, lon = 291.0, method = "nearest").values[4], rtol = 1e-6)
+  assert np.isnan(survey_ts["sst"].values[2:]).all()
+
+
+def test_update_point_store_adds_new_days_only(box_root):
+  write_point_year(box_root, 2001, 365)
+  write_point_year(box_root, 2002, 10, seed = 1)
+  ot.build_point_store(box_root, 2001, 2002, verbose = False)
+  _, cells_path = ot.get_point_store_paths(box_root)
+  before = np.load(cells_path).copy()
+  assert np.isnan(before[:, 365 + 10:]).all()
+
+  # 2001 changes on disk but only 2002 is updated, with ten more days
+  write_point_year(box_root, 2001, 365, seed = 2)
+  year_2002 = write_point_year(box_root, 2002, 20, seed = 1)
+  ot.update_point_store(box_root, 2002, verbose = False)
+  after = np.load(cells_path)
+  np.testing.assert_array_equal(after[:, 0:375], before[:, 0:375])
+  cells = ot.load_point_index(box_root)["cells"]
+  np.testing.assert_allclose(after[:, 375:385], year_2002["sst"].values[10:20].reshape(10, -1)[:, cells].T, rtol = 1e-6)
+  assert np.isnan(after[:, 385:]).all()
@@ -0,0 +1,58 @@
+# Region masks across the grid's longitude edge, rasterized with regionmask
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import xarray as xr
+from shapely.geometry import box
+
+import oisstools as ot
+from conftest import GRID_LAT, GRID_LON
+
+
+def make_grid(seed = 0, n_days = 20):
+  rng = np.random.default_rng(seed)
+  sst = rng.normal(15, 4, (n_days, len(GRID_LAT), len(GRID_LON)))
+  sst[:, 9, 35] = np.nan
+  return xr.Dataset({"sst" : (("time", "lat", "lon"), sst)},
+                    coords = {"time" : pd.date_range("2020-01-01", periods = n_days), "lat" : GRID_LAT, "lon" : GRID_LON})
+
+
+def region_shape(west, south, east, north):
+  return gpd.GeoDataFrame(geometry = [box(west, south, east, north)])
+
+
+def test_seam_window_is_two_slices():
+  lat_idx, lon_runs = ot.get_bounds_window(make_grid(), region_shape(-25, -25, 25, 25))
+  assert lat_idx == (6, 13)
+  assert lon_runs == [(33, 36), (0, 4)]
+  assert ot.get_lon_runs((34, 39), 36) == [(34, 36), (0, 3)]
+
+
+def test_seam_mask_matches_flipped_grid():
+  grid = make_grid()
+  seam = region_shape(-25, -25, 25, 25)
+  region_mask = ot.build_region_mask(grid, seam, "seam")
+  assert region_mask["lat_idx"] == (7, 12)
+  assert region_mask["lon_idx"] == (34, 39)
+  assert region_mask["sub_mask"].all()
+
+  # Same box on the grid relabelled -180 to 180, where it does not cross an edge
+  flipped = grid.assign_coords(lon = ((grid["lon"] + 180) % 360) - 180).sortby("lon")
+  seam_ts = ot.calc_ts_mask(grid, seam, "seam", area_weighted = True)
+  flip_ts = ot.calc_ts_mask(flipped, seam, "seam", area_weighted = True)
+  np.testing.assert_allclose(seam_ts["sst"].values, flip_ts["sst"].values)
+
+  # Against the cells picked out by hand
+  cells = grid["sst"].values[:, 7:12][:, :, [34, 35, 0, 1, 2]]
+  np.testing.assert_allclose(ot.calc_ts_mask(grid, seam, "seam")["sst"].values, np.nanmean(cells, axis = (1, 2)))
+
+
+def test_calc_ts_regions_across_seam_matches_calc_ts_mask():
+  grid = make_grid()
+  shapes = [region_shape(-25, -25, 25, 25), region_shape(100, 30, 140, 60), region_shape(-45, -5, -15, 15)]
+  names  = ["seam", "pacific", "atlantic"]
+  batched = ot.calc_ts_regions(grid, shapes, names, time_chunk = 6, area_weighted = True)
+  for shp_obj, shp_name in zip(shapes, names):
+    one_ts = ot.calc_ts_mask(grid, shp_obj, shp_name, area_weighted = True)
+    np.testing.assert_allclose(batched.loc[batched["region"] == shp_name, "sst"].values, one_ts["sst"].values)
@@ -0,0 +1,129 @@
+# Region masks from the mask cache and the regional means built on them
+
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import xarray as xr
+from shapely.geometry import box
+
+import oisstools as ot
+from conftest import GRID_LAT, GRID_LON
+
+
+def make_grid(seed = 0, n_days = 12):
+  rng = np.random.default_rng(seed)
+  sst = rng.normal(15, 4, (n_days, len(GRID_LAT), len(GRID_LON)))
+  sst[:, 8:10, 4:6] = np.nan
+  sst[rng.random(sst.shape) < 0.05] = np.nan
+  return xr.Dataset({"sst" : (("time", "lat", "lon"), sst)},
+                    coords = {"time" : pd.date_range("2020-01-01", periods = n_days), "lat" : GRID_LAT, "lon" : GRID_LON})
+
+
+def hand_mask(grid, lat_idx, lon_idx, sub_mask = None):
+  # Region mask dict as ot.build_region_mask() makes them, without rasterizing
+  if sub_mask is None:
+    sub_mask = np.ones((lat_idx[1] - lat_idx[0], lon_idx[1] - lon_idx[0]), dtype = bool)
+  return {"lat_idx" : lat_idx, "lon_idx" : lon_idx, "sub_mask" : sub_mask,
+          "sub_weights" : ot.get_region_weights(grid, lat_idx, sub_mask)}
+
+
+def use_hand_masks(monkeypatch, masks):
+  built = []
+  def build_region_mask(grid_obj, shp_obj, shp_name):
+    built.append(shp_name)
+    return masks[shp_name]
+  monkeypatch.setattr(ot, "build_region_mask", build_region_mask)
+  return built
+
+
+def test_region_mask_cache_reuses_and_rebuilds(box_root, monkeypatch):
+  grid = make_grid()
+  triangle = np.tril(np.ones((3, 4), dtype = bool))
+  built = use_hand_masks(monkeypatch, {"GoM" : hand_mask(grid, (12, 15), (28, 32), triangle)})
+  shp_obj = gpd.GeoDataFrame(geometry = [box(-70, 40, -60, 50)])
+
+  first  = ot.load_region_mask(grid, shp_obj, "GoM", "nelme_regions", box_root)
+  second = ot.load_region_mask(grid, shp_obj, "GoM", "nelme_regions", box_root)
+  assert built == ["GoM"]
+  assert second["lat_idx"] == (12, 15) and second["lon_idx"] == (28, 32)
+  np.testing.assert_array_equal(second["sub_mask"], triangle)
+  np.testing.assert_allclose(second["sub_weights"], first["sub_weights"])
+  assert not any(fname.endswith(".part.npz") for fname in os.listdir(f"{box_root}RES_Data/OISST/oisst_mainstays/mask_cache/nelme_regions/"))
+
+  # New outline or a different grid means a new mask
+  ot.load_region_mask(grid, gpd.GeoDataFrame(geometry = [box(-70, 40, -61, 50)]), "GoM", "nelme_regions", box_root)
+  ot.load_region_mask(grid.isel(lat = slice(1, None)), shp_obj, "GoM", "nelme_regions", box_root)
+  assert built == ["GoM", "GoM", "GoM"]
+
+  # Masked timeseries from the cache match the hand built mask
+  cached_ts = ot.calc_ts_mask(grid, shp_obj, "GoM", region_group = "nelme_regions", box_root = box_root)
+  window = grid["sst"].values[:, 12:15, 28:32]
+  expected = np.nanmean(np.where(triangle, window, np.nan), axis = (1, 2))
+  np.testing.assert_allclose(cached_ts["sst"].values, expected)
+
+
+def test_calc_ts_regions_matches_calc_ts_mask(monkeypatch):
+  grid = make_grid()
+  ring = np.ones((4, 5), dtype = bool)
+  ring[1:3, 1:4] = False
+  masks = {"ring"    : hand_mask(grid, (6, 10), (2, 7), ring),
+           "overlap" : hand_mask(grid, (7, 9), (3, 9)),
+           "far"     : hand_mask(grid, (14, 16), (30, 33)),
+           "empty"   : hand_mask(grid, (0, 0), (0, 0), np.zeros((0, 0), dtype = bool))}
+  use_hand_masks(monkeypatch, masks)
+  names = list(masks)
+
+  batched = ot.calc_ts_regions(grid, [None] * len(names), names, time_chunk = 5)
+  assert list(batched.columns) == ["time", "region", "sst", "sst_sd"]
+  assert batched.loc[batched["region"] == "empty", "sst"].isna().all()
+  for name in names[0:3]:
+    one_ts = ot.calc_ts_mask(grid, None, name)
+    region_ts = batched[batched["region"] == name]
+    np.testing.assert_array_equal(region_ts["time"].values, one_ts["time"].values)
+    np.testing.assert_allclose(region_ts["sst"].values, one_ts["sst"].values)
+
+  # Spatial sd is the population sd of the cells with data
+  window = np.where(ring, grid["sst"].values[:, 6:10, 2:7], np.nan)
+  np.testing.assert_allclose(batched.loc[batched["region"] == "ring", "sst_sd"].values, np.nanstd(window, axis = (1, 2)))
+
+  # Climatologies come out by modified_ordinal_day
+  clim = grid.rename(time = "modified_ordinal_day").assign_coords(modified_ordinal_day = np.arange(1, 13))
+  clim_ts = ot.calc_ts_regions(clim, [None] * len(names), names)
+  np.testing.assert_allclose(clim_ts.loc[clim_ts["region"] == "far", "sst"].values, 
+                             batched.loc[batched["region"] == "far", "sst"].values)
+  assert list(clim_ts.columns[0:2]) == ["modified_ordinal_day", "region"]
+
+
+def test_area_weighted_means_and_sd(monkeypatch):
+  grid = make_grid()
+  masks = {"tall" : hand_mask(grid, (3, 15), (4, 8))}
+  use_hand_masks(monkeypatch, masks)
+
+  # Cos latitude weights, cells without data drop out
+  window  = grid["sst"].values[:, 3:15, 4:8]
+  weights = np.where(np.isfinite(window), np.cos(np.deg2rad(GRID_LAT[3:15]))[:, None], 0)
+  w_mean  = np.nansum(weights * window, axis = (1, 2)) / weights.sum(axis = (1, 2))
+  w_var   = np.nansum(weights * (window - w_mean[:, None, None]) ** 2, axis = (1, 2)) / weights.sum(axis = (1, 2))
+
+  masked_ts = ot.calc_ts_mask(grid, None, "tall", area_weighted = True)
+  np.testing.assert_allclose(masked_ts["sst"].values, w_mean)
+  batched = ot.calc_ts_regions(grid, [None], ["tall"], area_weighted = True)
+  np.testing.assert_allclose(batched["sst"].values, w_mean)
+  np.testing.assert_allclose(batched["sst_sd"].values, np.sqrt(w_var))
+
+  # Weighted and plain means differ once the rows span a range of latitudes
+  plain_ts = ot.calc_ts_mask(grid, None, "tall")
+  assert not np.allclose(plain_ts["sst"].values, w_mean)
+
+  # Boxes across the longitude edge weight the same as the joined window
+  seam = hand_mask(grid, (3, 15), (34, 38))
+  masked = ot.apply_region_mask(grid, seam)["sst"]
+  seam_mean, seam_sd = ot.calc_weighted_stats(masked, seam)
+  window  = np.concatenate([grid["sst"].values[:, 3:15, 34:36], grid["sst"].values[:, 3:15, 0:2]], axis = 2)
+  weights = np.where(np.isfinite(window), np.cos(np.deg2rad(GRID_LAT[3:15]))[:, None], 0)
+  w_mean  = np.nansum(weights * window, axis = (1, 2)) / weights.sum(axis = (1, 2))
+  w_var   = np.nansum(weights * (window - w_mean[:, None, None]) ** 2, axis = (1, 2)) / weights.sum(axis = (1, 2))
+  np.testing.assert_allclose(seam_mean.values, w_mean)
+  np.testing.assert_allclose(seam_sd.values, np.sqrt(w_var))
@@ -0,0 +1,87 @@
+# Partitioned Parquet store of regional timeseries
+
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+import oisstools as ot
+
+
+def make_region_ts(start, end, offset = 0.0):
+  times = pd.date_range(start, end)
+  sst   = np.linspace(5, 15, len(times)) + offset
+  return pd.DataFrame({"time" : times, "sst" : sst, "sst_clim" : sst - 1, "clim_sd" : 0.5, "sst_anom" : 1.0})
+
+
+def test_partitions_replace_overlapping_days(box_root):
+  written = ot.write_regional_partitions(box_root, "nelme_regions", "GoM", make_region_ts("2019-12-20", "2020-01-10"))
+  assert [path.split("year=")[1][0:4] for path in written] == ["2019", "2020"]
+  
+  # An update for the last few days only rewrites 2020
+  update = make_region_ts("2020-01-08", "2020-01-15", offset = 100)
+  written = ot.write_regional_partitions(box_root, "nelme_regions", "GoM", update)
+  assert len(written) == 1 and "year=2020" in written[0]
+  
+  stored = ot.load_regional_store(box_root)
+  assert stored["time"].is_unique and len(stored) == 12 + 15
+  new_days = stored[stored["time"] >= "2020-01-08"]
+  np.testing.assert_allclose(new_days["sst"].values, update["sst"].values)
+  assert stored["time"].min() == pd.Timestamp("2019-12-20")
+  
+  # The rewritten partition holds only the value columns, filtered reads still merge
+  assert pq.read_schema(written[0]).names == ["time", "sst", "sst_clim", "clim_sd", "sst_anom"]
+  assert len(ot.load_regional_store(box_root, regions = ["GoM"], start_date = "2020-01-01")) == 15
+
+
+def test_load_regional_store_filters(box_root):
+  ot.write_regional_partitions(box_root, "nelme_regions", "GoM", make_region_ts("2019-01-01", "2021-12-31"))
+  ot.write_regional_partitions(box_root, "nelme_regions", "GB", make_region_ts("2019-01-01", "2021-12-31", offset = 1))
+  ot.write_regional_partitions(box_root, "gmri_sst_focal_areas", "apershing_gulf_of_maine", make_region_ts("2020-01-01", "2020-12-31"))
+  
+  subset = ot.load_regional_store(box_root, region_groups = ["nelme_regions"], regions = ["GB"], 
+                                  start_date = "2020-03-01", end_date = "2020-03-31", columns = ["sst_anom"])
+  assert list(subset.columns) == ["region_group", "region", "time", "sst_anom"]
+  assert set(subset["region"]) == {"GB"} and len(subset) == 31
+  assert subset["time"].min() == pd.Timestamp("2020-03-01")
+  
+  everything = ot.load_regional_store(box_root)
+  assert sorted(everything["region_group"].unique()) == ["gmri_sst_focal_areas", "nelme_regions"]
+  assert len(everything) == 2 * 1096 + 366
+
+
+def write_region_csv(box_root, region_name, start, end, offset = 0.0):
+  # Same columns as the timeseries CSVs, MOD included
+  region_ts = make_region_ts(start, end, offset = offset)
+  region_ts["sst"] = region_ts["sst"] + np.random.default_rng(5).normal(0, 0.1, len(region_ts))
+  region_ts.insert(1, "modified_ordinal_day", region_ts["time"].dt.dayofyear)
+  ts_path = ot.get_timeseries_paths(box_root, [region_name], "nelme_regions")[0]
+  ot.update_timeseries_csv(ts_path, region_ts)
+  return pd.read_csv(ts_path, parse_dates = ["time"])
+
+
+def test_convert_timeseries_csvs_round_trip(box_root):
+  csv_ts = {"GoM" : write_region_csv(box_root, "GoM", "2018-11-01", "2020-02-29"),
+            "NELME" : write_region_csv(box_root, "NELME", "2019-06-01", "2020-06-30", offset = 2)}
+  ot.convert_timeseries_csvs(box_root, "nelme_regions", verbose = False)
+  
+  # One partition per region and year, SNEandMAB has no CSV
+  for region_name, region_ts in csv_ts.items():
+    for yr in region_ts["time"].dt.year.unique():
+      assert os.path.exists(ot.get_parquet_partition_path(box_root, "nelme_regions", region_name, yr))
+  assert not os.path.exists(f"{ot.get_parquet_store_root(box_root)}region_group=nelme_regions/region=SNEandMAB")
+  
+  # The store gives back the CSV rows, whole or by region and year
+  ts_columns = ["time", "sst", "sst_clim", "clim_sd", "sst_anom"]
+  stored = ot.load_regional_store(box_root, region_groups = ["nelme_regions"])
+  for region_name, region_ts in csv_ts.items():
+    region_stored = stored[stored["region"] == region_name].reset_index(drop = True)
+    pd.testing.assert_frame_equal(region_stored[ts_columns], region_ts[ts_columns])
+    for yr in region_ts["time"].dt.year.unique():
+      year_stored = ot.load_regional_store(box_root, regions = [region_name], start_date = f"{yr}-01-01", end_date = f"{yr}-12-31")
+      pd.testing.assert_frame_equal(year_stored[ts_columns], region_ts.loc[region_ts["time"].dt.year == yr, ts_columns].reset_index(drop = True))
+  
+  # Converting again leaves the same rows
+  ot.convert_timeseries_csvs(box_root, "nelme_regions", verbose = False)
+  pd.testing.assert_frame_equal(ot.load_regional_store(box_root), stored)
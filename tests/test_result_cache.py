@@ -0,0 +1,156 @@
+# Result cache keys and the products that go through ot.cached_product()
+
+import json
+import os
+import time
+
+import numpy as np
+import xarray as xr
+
+import oisstools as ot
+from conftest import GRID_LAT, GRID_LON, write_annual_file, write_climatology
+
+
+def write_warming_years(box_root, years = range(2000, 2005), n_days = 4):
+  for yr in years:
+    write_annual_file(box_root, yr, np.full((n_days, len(GRID_LAT), len(GRID_LON)), 10.0 + 0.5 * (yr - 2000)))
+
+
+def count_calls(monkeypatch, func_name):
+  calls = []
+  func = getattr(ot, func_name)
+  def counted(*args, **kwargs):
+    calls.append(args)
+    return func(*args, **kwargs)
+  monkeypatch.setattr(ot, func_name, counted)
+  return calls
+
+
+def test_code_version_follows_function_and_helper_source(monkeypatch):
+  def product_a(x):
+    return x + 1
+  def product_b(x):
+    return x + 2
+  version_a = ot.get_code_version(product_a)
+  assert version_a == ot.get_code_version(product_a)
+  assert version_a != ot.get_code_version(product_b)
+
+  # Helpers the product reaches, directly or through other helpers
+  helpers = ot.get_code_helpers(ot.calc_warming_trends)
+  assert {"calc_annual_mean", "get_annual_path", "pack_cells", "cached_product"} <= set(helpers)
+  assert "calc_robust_trends" not in helpers
+
+  # An edited helper changes the version, an edit elsewhere does not
+  trend_version = ot.get_code_version(ot.calc_warming_trends)
+  def calc_robust_trends(box_root, start_yr, end_yr):
+    return None
+  calc_robust_trends.__module__ = ot.__name__
+  monkeypatch.setattr(ot, "calc_robust_trends", calc_robust_trends)
+  assert ot.get_code_version(ot.calc_warming_trends) == trend_version
+  def get_annual_path(box_root, yr, anomalies = False, reference_period = "1982-2011"):
+    return f"{box_root}{yr}.nc"
+  get_annual_path.__module__ = ot.__name__
+  monkeypatch.setattr(ot, "get_annual_path", get_annual_path)
+  assert ot.get_code_version(ot.calc_warming_trends) != trend_version
+
+
+def test_warming_trends_cached_until_inputs_change(box_root, monkeypatch):
+  write_warming_years(box_root)
+  calls = count_calls(monkeypatch, "calc_annual_mean")
+
+  first = ot.calc_warming_trends(box_root, 2000, 2004, use_cache = True, verbose = False)
+  assert len(calls) == 5
+  np.testing.assert_allclose(first["annual_warming_rate"].values, 0.5, rtol = 1e-5)
+
+  # Hit, same values and nothing read
+  second = ot.calc_warming_trends(box_root, 2000, 2004, use_cache = True, verbose = False)
+  assert len(calls) == 5
+  xr.testing.assert_allclose(first, second)
+
+  # A changed year or a missing saved file is a miss
+  write_annual_file(box_root, 2004, np.full((4, len(GRID_LAT), len(GRID_LON)), 13.0))
+  ot.calc_warming_trends(box_root, 2000, 2004, use_cache = True, verbose = False)
+  assert len(calls) == 10
+  os.remove(ot.get_trends_path(box_root, 2000, 2004))
+  ot.calc_warming_trends(box_root, 2000, 2004, use_cache = True, verbose = False)
+  assert len(calls) == 15
+  assert os.path.exists(ot.get_trends_path(box_root, 2000, 2004))
+
+
+def test_anomalies_and_climatology_cached(box_root, monkeypatch):
+  write_warming_years(box_root, years = [2000, 2001])
+  write_climatology(box_root, "1982-2011")
+  anom_calls = count_calls(monkeypatch, "calc_daily_anoms")
+
+  out_paths = ot.export_annual_anomalies(box_root, 2000, 2001, use_cache = True, verbose = False)
+  assert ot.export_annual_anomalies(box_root, 2000, 2001, use_cache = True, verbose = False) == out_paths
+  assert len(anom_calls) == 2
+
+  # Anomaly files removed since, written again
+  os.remove(out_paths[1])
+  ot.export_annual_anomalies(box_root, 2000, 2001, use_cache = True, verbose = False)
+  assert len(anom_calls) == 4 and os.path.exists(out_paths[1])
+
+  state_calls = count_calls(monkeypatch, "update_clim_state")
+  first  = ot.build_oisst_climatology(box_root, 2000, 2001, use_cache = True, verbose = False)
+  second = ot.build_oisst_climatology(box_root, 2000, 2001, use_cache = True, verbose = False)
+  assert len(state_calls) == 2
+  xr.testing.assert_allclose(first, second)
+  assert os.path.exists(ot.get_climatology_path(box_root, 2000, 2001))
+
+  # Saved climatologies are cached by path and opened from daily_climatologies/
+  assert os.path.samefile(second.encoding["source"], ot.get_climatology_path(box_root, 2000, 2001))
+  cache_files = os.listdir(ot.get_result_cache_root(box_root))
+  assert not any(cache_file.endswith(".nc") for cache_file in cache_files)
+  first.close()
+  second.close()
+
+
+def make_values(n):
+  return {"values" : list(range(n))}
+
+
+def cache_values(box_root, n):
+  # Cache one result and return its key
+  cache_root = ot.get_result_cache_root(box_root)
+  before = set(os.listdir(cache_root)) if os.path.exists(cache_root) else set()
+  ot.cached_product(box_root, make_values, {"n" : n}, verbose = False)
+  meta_name = [name for name in set(os.listdir(cache_root)) - before if name.endswith(".meta.json")][0]
+  return meta_name[:-len(".meta.json")]
+
+
+def set_last_used(box_root, result_key, last_used):
+  meta_path = f"{ot.get_result_cache_root(box_root)}{result_key}.meta.json"
+  with open(meta_path) as meta_file:
+    result_meta = json.load(meta_file)
+  result_meta["last_used"] = last_used
+  with open(meta_path, "w") as meta_file:
+    json.dump(result_meta, meta_file)
+  return result_meta
+
+
+def test_evict_results_by_age(box_root, monkeypatch):
+  keys = [cache_values(box_root, n) for n in [10, 20, 30]]
+  set_last_used(box_root, keys[1], time.time() - 10 * 86400)
+  assert ot.evict_result_cache(box_root, max_age_days = 5, verbose = False) == [keys[1]]
+  cache_files = os.listdir(ot.get_result_cache_root(box_root))
+  assert not any(cache_file.startswith(keys[1]) for cache_file in cache_files)
+
+  # The others are still hits, the evicted one is made again
+  calls = count_calls(monkeypatch, "save_cached_result")
+  for n in [10, 30]:
+    assert ot.cached_product(box_root, make_values, {"n" : n}, verbose = False) == make_values(n)
+  assert len(calls) == 0
+  ot.cached_product(box_root, make_values, {"n" : 20}, verbose = False)
+  assert len(calls) == 1
+
+
+def test_evict_results_least_recently_used_first(box_root):
+  keys = [cache_values(box_root, n) for n in [100, 200, 300]]
+  sizes = [set_last_used(box_root, result_key, last_used)["size"] for result_key, last_used in zip(keys, [300, 100, 200])]
+
+  # Oldest use goes first, then the next until the cache fits
+  assert ot.evict_result_cache(box_root, max_bytes = sizes[0] + sizes[2], verbose = False) == [keys[1]]
+  assert ot.evict_result_cache(box_root, max_bytes = sizes[0], verbose = False) == [keys[2]]
+  assert ot.evict_result_cache(box_root, max_bytes = 0, verbose = False) == [keys[0]]
+  assert os.listdir(ot.get_result_cache_root(box_root)) == []
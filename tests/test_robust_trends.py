@@ -0,0 +1,61 @@
+# Theil-Sen slopes and Mann-Kendall tests by pixel
+
+import numpy as np
+import xarray as xr
+from scipy import stats
+
+import oisstools as ot
+from conftest import GRID_LAT, GRID_LON, write_annual_file
+
+
+def direct_mann_kendall(y):
+  # S from the sign of every later minus earlier year, tie corrected variance
+  n = len(y)
+  s = sum(np.sign(y[j] - y[i]) for i in range(n) for j in range(i + 1, n))
+  _, tie_counts = np.unique(y, return_counts = True)
+  var = (n * (n - 1) * (2 * n + 5) - np.sum(tie_counts * (tie_counts - 1) * (2 * tie_counts + 5))) / 18
+  z = (s - np.sign(s)) / np.sqrt(var)
+  return s, z, 2 * stats.norm.sf(abs(z))
+
+
+def test_sen_mk_tile_matches_direct():
+  rng = np.random.default_rng(0)
+  years = np.arange(2001, 2013)
+  values = np.round(0.05 * (years - 2001) + rng.normal(0, 0.3, (30, len(years))), 1)
+  values[0] = 5.0                          # every year tied
+  values[1, [2, 5, 6]] = np.nan            # missing years
+  values[2, 0:6] = values[2, 6:12]         # repeated values
+  values[rng.random(values.shape) < 0.05] = np.nan
+  tile = ot.calc_sen_mk_tile(values, years)
+
+  for cell in range(1, len(values)):
+    valid = np.isfinite(values[cell])
+    y, x = values[cell, valid], years[valid]
+    assert tile["n_years"][cell] == valid.sum()
+    np.testing.assert_allclose(tile["sen_slope"][cell], stats.theilslopes(y, x)[0], atol = 1e-12)
+    mk_s, mk_z, mk_p = direct_mann_kendall(y)
+    assert tile["mk_s"][cell] == mk_s
+    np.testing.assert_allclose(tile["mk_z"][cell], mk_z)
+    np.testing.assert_allclose(tile["mk_p_value"][cell], mk_p)
+
+  # No trend at all when every year is the same
+  assert tile["sen_slope"][0] == 0 and tile["mk_s"][0] == 0
+
+
+def test_robust_trends_tiles_and_workers_match(box_root):
+  rng = np.random.default_rng(1)
+  for yr in range(2001, 2009):
+    sst = 10 + 0.03 * (yr - 2001) + rng.normal(0, 0.2, (2, len(GRID_LAT), len(GRID_LON)))
+    sst[:, 0, 0] = np.nan
+    if yr > 2003:
+      sst[:, 1, 1] = np.nan
+    write_annual_file(box_root, yr, sst)
+
+  serial = ot.calc_robust_trends(box_root, 2001, 2008, save = False, verbose = False)
+  tiled  = ot.calc_robust_trends(box_root, 2001, 2008, tile_size = 100, n_workers = 2, save = False, verbose = False)
+  xr.testing.assert_identical(serial, tiled)
+
+  # Land and cells with too few years stay empty
+  assert np.isnan(serial["sen_slope"][0, 0]) and np.isnan(serial["sen_slope"][1, 1])
+  annual = np.stack([ot.calc_annual_mean(box_root, yr).values[5, 7] for yr in range(2001, 2009)])
+  np.testing.assert_allclose(float(serial["sen_slope"][5, 7]), stats.theilslopes(annual, np.arange(2001, 2009))[0], rtol = 1e-5)
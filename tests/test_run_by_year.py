@@ -0,0 +1,34 @@
+# Per-year process pool: year order, merging and memory limit parsing
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+import oisstools as ot
+from conftest import GRID_LAT, GRID_LON, write_annual_file
+
+
+def test_parse_memory_limit():
+  assert ot.parse_memory_limit(None) is None
+  assert ot.parse_memory_limit(1024) == 1024
+  assert ot.parse_memory_limit("8GB") == 8 * 1024 ** 3
+  assert ot.parse_memory_limit(" 1.5 mb ") == int(1.5 * 1024 ** 2)
+  assert ot.parse_memory_limit("2048") == 2048
+
+
+def test_merge_year_results_keeps_year_order():
+  frames = [pd.DataFrame({"yr" : [yr]}) for yr in [2001, 2002]]
+  assert list(ot.merge_year_results([2001, 2002], frames)["yr"]) == [2001, 2002]
+  assert ot.merge_year_results([2001, 2002], [[1], [2, 3]]) == [1, 2, 3]
+  assert ot.merge_year_results([2001, 2002], ["a", "b"]) == {2001 : "a", 2002 : "b"}
+
+
+def test_run_by_year_workers_match_serial(box_root):
+  for yr in range(2001, 2004):
+    write_annual_file(box_root, yr, np.full((3, len(GRID_LAT), len(GRID_LON)), float(yr)))
+
+  serial   = ot.run_by_year(ot.calc_annual_mean, range(2001, 2004), {"box_root" : box_root}, verbose = False)
+  parallel = ot.run_by_year(ot.calc_annual_mean, range(2001, 2004), {"box_root" : box_root}, n_workers = 2, verbose = False)
+  assert list(serial["year"].values) == [2001, 2002, 2003]
+  xr.testing.assert_allclose(serial, parallel)
+  np.testing.assert_allclose(parallel.sel(year = 2003).values, 2003.0)
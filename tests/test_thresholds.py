@@ -0,0 +1,61 @@
+# Percentile thresholds by MOD from windows of days pooled over the reference period
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import oisstools as ot
+from conftest import GRID_LAT, GRID_LON, write_annual_file, write_climatology
+
+
+def write_threshold_years(box_root, years, seed = 0):
+  # Full years, land in the corner and a cell with only a few days of data
+  rng = np.random.default_rng(seed)
+  by_mod = np.full((len(years), 366, len(GRID_LAT) * len(GRID_LON)), np.nan)
+  for yr_num, yr in enumerate(years):
+    days = pd.date_range(f"{yr}-01-01", f"{yr}-12-31")
+    sst = rng.normal(15, 3, (len(days), len(GRID_LAT), len(GRID_LON)))
+    sst[:, 0, 0] = np.nan
+    sst[rng.random(len(days)) < 0.97, 5, 5] = np.nan
+    sst[rng.random(sst.shape) < 0.05] = np.nan
+    year_ds = write_annual_file(box_root, yr, sst)
+    mods = days.dayofyear + ((~days.is_leap_year) & (days.month >= 3))
+    by_mod[yr_num, np.asarray(mods) - 1] = year_ds["sst"].values.reshape(len(days), -1)
+  return by_mod
+
+
+def test_thresholds_match_nanpercentile(box_root):
+  years = [2003, 2004, 2005]
+  by_mod = write_threshold_years(box_root, years)
+  ot.build_ocean_mask(box_root, years[0], verbose = False)
+  thresholds = ot.build_oisst_thresholds(box_root, 2003, 2005, lat_chunk = 7, verbose = False)
+
+  # MOD 1 pools the end of December, MOD 366 the start of January
+  for mod in [1, 2, 60, 183, 365, 366]:
+    window = (mod - 1 + np.arange(-5, 6)) % 366
+    pooled = by_mod[:, window].reshape(-1, by_mod.shape[2])
+    with warnings.catch_warnings():
+      warnings.simplefilter("ignore", RuntimeWarning)
+      expected = np.nanpercentile(pooled, [90, 10], axis = 0).reshape(2, len(GRID_LAT), len(GRID_LON))
+    np.testing.assert_allclose(thresholds["sst_p90"].sel(modified_ordinal_day = mod).values, expected[0], rtol = 1e-6)
+    np.testing.assert_allclose(thresholds["sst_p10"].sel(modified_ordinal_day = mod).values, expected[1], rtol = 1e-6)
+
+  # Land stays NaN, the mostly missing cell still gets thresholds where it has data
+  assert np.isnan(thresholds["sst_p90"].values[:, 0, 0]).all()
+  assert np.isfinite(thresholds["sst_p90"].values[:, 5, 5]).any()
+
+  # Thresholds as anomalies from the climatology of the same period
+  write_climatology(box_root, "2003-2005")
+  thresh_anoms = ot.load_oisst_thresholds(box_root, reference_period = "2003-2005", anomalies = True)
+  daily_clims = ot.load_oisst_climatology(box_root, reference_period = "2003-2005")
+  np.testing.assert_allclose(thresh_anoms["sst_p90"].values, thresholds["sst_p90"].values - daily_clims["sst"].values, rtol = 1e-6)
+
+
+def test_calc_nan_percentiles_small_columns():
+  values = np.array([[1.0, np.nan, np.nan], [3.0, 2.0, np.nan], [2.0, np.nan, np.nan], [np.nan, np.nan, np.nan]])
+  result = ot.calc_nan_percentiles(values, [0, 50, 90, 100])
+  with warnings.catch_warnings():
+    warnings.simplefilter("ignore", RuntimeWarning)
+    expected = np.nanpercentile(values, [0, 50, 90, 100], axis = 0)
+  np.testing.assert_allclose(result, expected)
@@ -0,0 +1,186 @@
+# Incremental pipeline: annual file -> anomalies -> regional timeseries CSVs and store
+
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import xarray as xr
+from shapely.geometry import box
+
+import oisstools as ot
+from conftest import GRID_LAT, GRID_LON, write_annual_file, write_climatology, write_daily_file
+
+
+def read_file(file_path):
+  with xr.open_dataset(file_path) as file_ds:
+    return file_ds.load()
+
+
+def test_run_oisst_update_only_processes_changed_days(box_root):
+  cache_root = ot.set_cache_root(box_root)
+  write_climatology(box_root, "1982-2011")
+  for day_num in range(1, 4):
+    write_daily_file(box_root, f"2020-12-0{day_num}", 10.0 + day_num, preliminary = day_num == 2)
+
+  first_plan = ot.run_oisst_update(workspace = "docker", products = ["anomaly", "means"], download = False, verbose = False)
+  assert first_plan["anomaly"] == ["20201201", "20201202", "20201203"]
+
+  # A new day and a finalized day, only those two move through every stage
+  manifest = ot.load_cache_manifest(cache_root)
+  for day, value in [("2020-12-04", 14.0), ("2020-12-02", 12.5)]:
+    ot.record_cache_file(manifest, cache_root, write_daily_file(box_root, day, value), verbose = False)
+  ot.save_cache_manifest(cache_root, manifest)
+  second_plan = ot.run_oisst_update(workspace = "docker", products = ["anomaly", "means"], download = False, verbose = False)
+  assert all(date_ids == ["20201202", "20201204"] for date_ids in second_plan.values())
+
+  # Anomaly file updated in place matches anomalies of the whole annual file
+  annual = read_file(ot.get_annual_path(box_root, 2020))
+  anoms  = read_file(ot.get_annual_path(box_root, 2020, anomalies = True, reference_period = "1982-2011"))
+  np.testing.assert_allclose(annual["sst"].values[:, 1, 1], [11.0, 12.5, 13.0, 14.0])
+  with ot.load_oisst_climatology(box_root, reference_period = "1982-2011") as daily_clims:
+    expected = ot.calc_daily_anoms(annual, daily_clims)
+  np.testing.assert_array_equal(anoms.time.values, annual.time.values)
+  np.testing.assert_allclose(anoms["sst"].values, expected["sst"].transpose("time", "lat", "lon").values, rtol = 1e-5)
+
+  # Nothing left to do
+  third_plan = ot.run_oisst_update(workspace = "docker", products = ["anomaly", "means"], download = False, verbose = False)
+  assert all(len(date_ids) == 0 for date_ids in third_plan.values())
+
+
+def test_update_timeseries_csv_replaces_and_appends(tmp_path):
+  ts_path = f"{tmp_path}/OISSTv2_anom_GoM.csv"
+  old_ts  = pd.DataFrame({"time" : pd.date_range("2020-12-01", periods = 3), "sst" : [1.0, 2.0, 3.0], "note" : ["a", "b", "c"]})
+  old_ts.to_csv(ts_path, index = False)
+
+  update_ts = pd.DataFrame({"time" : pd.date_range("2020-12-03", periods = 2), "sst" : [3.5, 4.0]})
+  ot.update_timeseries_csv(ts_path, update_ts)
+  region_ts = pd.read_csv(ts_path, parse_dates = ["time"])
+  assert list(region_ts.columns) == ["time", "sst", "note"]
+  assert list(region_ts["time"].dt.day) == [1, 2, 3, 4]
+  np.testing.assert_allclose(region_ts["sst"].values, [1.0, 2.0, 3.5, 4.0])
+  assert not os.path.exists(f"{ts_path}.part")
+
+
+def write_region_inputs(box_root, old_days):
+  # Polygons for the nelme regions, timelines covering every MOD for two of them, 
+  # the third has no climatology yet
+  region_names = ot.get_region_names("nelme_regions")
+  poly_paths   = ot.get_timeseries_paths(box_root, region_names, "nelme_regions", polygons = True)
+  ts_paths     = ot.get_timeseries_paths(box_root, region_names, "nelme_regions", polygons = False)
+  for poly_num, poly_path in enumerate(poly_paths):
+    os.makedirs(os.path.dirname(poly_path), exist_ok = True)
+    west = -75 + 20 * poly_num
+    gpd.GeoDataFrame(geometry = [box(west, 25, west + 15, 45)], crs = "EPSG:4326").to_file(poly_path)
+  for ts_path in ts_paths[0:2]:
+    old_ts = ot.add_mod_to_ts(pd.DataFrame({"time" : old_days, "sst" : 5.0}))
+    old_ts["sst_clim"], old_ts["clim_sd"] = 4.0, 1.0
+    old_ts["sst_anom"] = old_ts["sst"] - old_ts["sst_clim"]
+    os.makedirs(os.path.dirname(ts_path), exist_ok = True)
+    old_ts.to_csv(ts_path, index = False)
+  return region_names, poly_paths, ts_paths
+
+
+def test_update_regional_store_refreshes_csvs(box_root):
+  old_days = pd.date_range("2019-12-01", "2020-12-02")
+  region_names, _, ts_paths = write_region_inputs(box_root, old_days)
+
+  # Annual file with one value per day
+  write_annual_file(box_root, 2020, np.repeat(np.arange(1.0, 367.0), len(GRID_LAT) * len(GRID_LON)).reshape(366, len(GRID_LAT), len(GRID_LON)))
+  ot.update_regional_store(box_root, "nelme_regions", ["20201201", "20201202", "20201203"], verbose = False)
+
+  for ts_path in ts_paths[0:2]:
+    region_ts = pd.read_csv(ts_path, parse_dates = ["time"])
+    assert list(region_ts.columns) == ["time", "sst", "modified_ordinal_day", "sst_clim", "clim_sd", "sst_anom"]
+    assert len(region_ts) == len(old_days) + 1
+    assert list(region_ts["time"].dt.strftime("%m%d")[-4:]) == ["1130", "1201", "1202", "1203"]
+    np.testing.assert_allclose(region_ts["sst"].values[-4:], [5.0, 336.0, 337.0, 338.0])
+    np.testing.assert_allclose(region_ts["sst_anom"].values, region_ts["sst"].values - 4.0)
+  assert not os.path.exists(ts_paths[2])
+
+  store_ts = ot.load_regional_store(box_root, region_groups = ["nelme_regions"])
+  assert sorted(store_ts["region"].unique()) == sorted(region_names[0:2])
+  np.testing.assert_allclose(store_ts.loc[store_ts["region"] == region_names[0], "sst"].values, [336.0, 337.0, 338.0])
+
+
+def test_run_oisst_update_regions_end_to_end(box_root):
+  cache_root = ot.set_cache_root(box_root)
+  write_climatology(box_root, "1982-2011")
+  region_names, poly_paths, _ = write_region_inputs(box_root, pd.date_range("2019-01-01", "2019-12-31"))
+  for day_num in range(1, 4):
+    write_daily_file(box_root, f"2020-12-0{day_num}", 10.0 + day_num)
+  
+  products = ["anomaly", "means", "regions"]
+  first_plan = ot.run_oisst_update(workspace = "docker", products = products, region_groups = ["nelme_regions"], 
+                                   download = False, verbose = False)
+  assert first_plan["regions:nelme_regions"] == ["20201201", "20201202", "20201203"]
+  
+  # Masks cached on the first run, store matches each region masked on its own
+  mask_folder = f"{box_root}RES_Data/OISST/oisst_mainstays/mask_cache/nelme_regions/"
+  assert len(os.listdir(mask_folder)) == len(region_names)
+  annual = read_file(ot.get_annual_path(box_root, 2020))
+  store_ts = ot.load_regional_store(box_root, region_groups = ["nelme_regions"])
+  assert sorted(store_ts["region"].unique()) == sorted(region_names[0:2])
+  for region_name, poly_path in zip(region_names[0:2], poly_paths):
+    region_ts = store_ts[store_ts["region"] == region_name]
+    one_ts = ot.calc_ts_mask(annual, gpd.read_file(poly_path), region_name)
+    np.testing.assert_allclose(region_ts["sst"].values, one_ts["sst"].values, rtol = 1e-6)
+    np.testing.assert_allclose(region_ts["sst_anom"].values, region_ts["sst"].values - 4.0, rtol = 1e-6)
+  
+  # A revised day goes through to the regions, the others are left alone
+  manifest = ot.load_cache_manifest(cache_root)
+  ot.record_cache_file(manifest, cache_root, write_daily_file(box_root, "2020-12-02", 20.0), verbose = False)
+  ot.save_cache_manifest(cache_root, manifest)
+  second_plan = ot.run_oisst_update(workspace = "docker", products = products, region_groups = ["nelme_regions"], 
+                                    download = False, verbose = False)
+  assert second_plan["regions:nelme_regions"] == ["20201202"]
+  store_ts = ot.load_regional_store(box_root, regions = [region_names[0]])
+  np.testing.assert_allclose(store_ts["sst"].values, [11.0, 20.0, 13.0], rtol = 1e-6)
+
+
+def list_files(box_root):
+  # Every file under the box root with its size and modified time
+  listing = {}
+  for folder, _, fnames in os.walk(box_root):
+    for fname in fnames:
+      file_stat = os.stat(os.path.join(folder, fname))
+      listing[os.path.join(folder, fname)] = (file_stat.st_size, file_stat.st_mtime_ns)
+  return listing
+
+
+def test_plan_dry_run_writes_nothing_and_requeues_changed_days(box_root, capsys):
+  cache_root = ot.set_cache_root(box_root)
+  write_climatology(box_root, "1982-2011")
+  write_region_inputs(box_root, pd.date_range("2019-01-01", "2019-12-31"))
+  manifest = ot.load_cache_manifest(cache_root)
+  for day_num in range(1, 5):
+    ot.record_cache_file(manifest, cache_root, write_daily_file(box_root, f"2020-12-0{day_num}", 10.0 + day_num), verbose = False)
+  ot.save_cache_manifest(cache_root, manifest)
+  plan_args = {"products" : ["anomaly", "means", "regions"], "region_groups" : ["nelme_regions"]}
+  run_args  = dict(plan_args, workspace = "docker")
+
+  # Every stage is stale for every day, and the dry run leaves the files alone
+  before = list_files(box_root)
+  dry_plan = ot.run_oisst_update(**run_args, dry_run = True, verbose = False)
+  assert list(dry_plan) == ["annual", "anomaly", "means", "regions:nelme_regions"]
+  assert all(date_ids == ["20201201", "20201202", "20201203", "20201204"] for date_ids in dry_plan.values())
+  assert "regions:nelme_regions : 4 days: 20201201 - 20201204" in capsys.readouterr().out
+  assert list_files(box_root) == before
+  assert ot.plan_oisst_update(cache_root, **plan_args, since = "20201203")["means"] == ["20201203", "20201204"]
+
+  # After a run nothing is stale
+  ot.run_oisst_update(**run_args, download = False, verbose = False)
+  manifest = ot.load_cache_manifest(cache_root)
+  assert all(len(date_ids) == 0 for date_ids in ot.plan_oisst_update(cache_root, **plan_args).values())
+
+  # A new checksum for one day queues only that day, from the annual file down
+  ot.record_cache_file(manifest, cache_root, write_daily_file(box_root, "2020-12-03", 30.0), verbose = False)
+  ot.save_cache_manifest(cache_root, manifest)
+  assert ot.plan_oisst_update(cache_root, **plan_args) == {stage : ["20201203"] for stage in dry_plan}
+
+  # A stage that was interrupted keeps its days queued while the ones before it are done
+  manifest = ot.load_cache_manifest(cache_root)
+  manifest["20201203"]["annual_checksum"] = manifest["20201203"]["checksum"]
+  manifest["20201203"][ot.get_stage_key("anomaly")] = manifest["20201203"]["checksum"]
+  new_plan = ot.plan_oisst_update(cache_root, **plan_args, manifest = manifest)
+  assert new_plan == {"annual" : [], "anomaly" : [], "means" : ["20201203"], "regions:nelme_regions" : ["20201203"]}
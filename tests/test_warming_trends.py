@@ -0,0 +1,63 @@
+# Per-pixel warming trends from streamed least squares sums
+
+import numpy as np
+from scipy import stats
+
+import oisstools as ot
+from conftest import GRID_LAT, GRID_LON, write_annual_file
+
+
+def write_trend_years(box_root, years, seed = 0):
+  # Two days a year, a trend that varies by cell, land in the corner and missing years
+  rng = np.random.default_rng(seed)
+  rates = rng.uniform(-0.05, 0.1, (len(GRID_LAT), len(GRID_LON)))
+  annual_means = {}
+  for yr in years:
+    sst = 10 + rates * (yr - years[0]) + rng.normal(0, 0.2, (2, len(GRID_LAT), len(GRID_LON)))
+    sst[:, 0, 0] = np.nan
+    if yr in [years[2], years[4]]:
+      sst[:, 1, 1] = np.nan
+    if yr not in years[0:2]:
+      sst[:, 2, 2] = np.nan
+    annual_means[yr] = write_annual_file(box_root, yr, sst)["sst"].mean("time").values.astype("float64")
+  return annual_means
+
+
+def test_trends_match_linregress(box_root):
+  years = list(range(2001, 2009))
+  annual_means = write_trend_years(box_root, years)
+  ot.build_ocean_mask(box_root, years[0], verbose = False)
+  trends = ot.calc_warming_trends(box_root, years[0], years[-1], min_years = 3, save = False, verbose = False)
+
+  for lat_i in range(len(GRID_LAT)):
+    for lon_i in range(len(GRID_LON)):
+      cell_yrs = [yr for yr in years if np.isfinite(annual_means[yr][lat_i, lon_i])]
+      cell = trends.isel(lat = lat_i, lon = lon_i)
+      assert int(cell["n_years"]) == len(cell_yrs)
+      if len(cell_yrs) < 3:
+        assert np.isnan(cell["annual_warming_rate"]) and np.isnan(cell["p_value"])
+        continue
+      fit = stats.linregress(cell_yrs, [annual_means[yr][lat_i, lon_i] for yr in cell_yrs])
+      np.testing.assert_allclose(float(cell["annual_warming_rate"]), fit.slope, rtol = 1e-4, atol = 1e-6)
+      np.testing.assert_allclose(float(cell["intercept"]), fit.intercept, rtol = 1e-4)
+      np.testing.assert_allclose(float(cell["slope_se"]), fit.stderr, rtol = 1e-4, atol = 1e-6)
+      np.testing.assert_allclose(float(cell["p_value"]), fit.pvalue, rtol = 1e-3, atol = 1e-6)
+
+  # Land, a pixel fit with the six years it has, and one with too few
+  assert int(trends["n_years"][0, 0]) == 0 and int(trends["n_years"][1, 1]) == 6
+  assert np.isnan(trends["annual_warming_rate"][2, 2])
+  assert np.isnan(trends["rate_percentile"][0, 0])
+  assert float(trends["rate_percentile"].max()) == 1 and float(trends["rate_percentile"].min()) == 0
+
+
+def test_min_years_and_polyfit(box_root):
+  years = list(range(2001, 2009))
+  annual_means = write_trend_years(box_root, years, seed = 1)
+  trends = ot.calc_warming_trends(box_root, years[0], years[-1], min_years = 7, save = False, verbose = False)
+
+  # Only cells with seven or more years get a trend
+  assert np.isnan(trends["annual_warming_rate"][1, 1])
+  y = [annual_means[yr][5, 5] for yr in years]
+  slope, intercept = np.polyfit(years, y, 1)
+  np.testing.assert_allclose(float(trends["annual_warming_rate"][5, 5]), slope, rtol = 1e-4, atol = 1e-6)
+  np.testing.assert_allclose(float(trends["intercept"][5, 5]), intercept, rtol = 1e-4)
@@ -0,0 +1,121 @@
+# Zarr stores kept in sync with the annual files
+
+import os
+
+import numpy as np
+import pytest
+import xarray as xr
+import zarr
+
+import oisstools as ot
+from conftest import GRID_LAT, GRID_LON, write_annual_file
+
+
+@pytest.fixture
+def two_years(box_root):
+  rng = np.random.default_rng(3)
+  write_annual_file(box_root, 2000, rng.normal(10, 3, (366, len(GRID_LAT), len(GRID_LON))))
+  write_annual_file(box_root, 2001, rng.normal(10, 3, (200, len(GRID_LAT), len(GRID_LON))))
+  return box_root
+
+
+def read_store(box_root, layout):
+  with xr.open_zarr(ot.get_zarr_store_path(box_root, layout), consolidated = True) as store_ds:
+    return store_ds.load()
+
+
+def read_years(box_root, years):
+  return xr.concat([xr.open_dataset(ot.get_annual_path(box_root, yr)).load() for yr in years], dim = "time")
+
+
+def test_build_zarr_store_matches_annual_files(two_years):
+  ot.build_zarr_store(two_years, 2000, 2001, verbose = False)
+  annual = read_years(two_years, [2000, 2001])
+  for layout in ["map", "timeseries"]:
+    store_ds = read_store(two_years, layout)
+    np.testing.assert_array_equal(store_ds.time.values, annual.time.values)
+    np.testing.assert_allclose(store_ds.sst.values, annual.sst.values.astype("float32"))
+  ts_arr = zarr.open_group(ot.get_zarr_store_path(two_years, "timeseries"), mode = "r")["sst"]
+  assert ts_arr.chunks == (1461, 18, 20)
+
+
+def test_update_zarr_store_writes_only_changed_days(two_years, monkeypatch):
+  ot.build_zarr_store(two_years, 2000, 2001, verbose = False)
+  
+  # Append a week and revise one day
+  rng = np.random.default_rng(4)
+  sst = xr.open_dataset(ot.get_annual_path(two_years, 2001)).load().sst.values
+  sst = np.concatenate([sst, rng.normal(10, 3, (7, len(GRID_LAT), len(GRID_LON)))])
+  sst[150] += 1
+  write_annual_file(two_years, 2001, sst)
+  
+  # Record the days of every sst write
+  writes = []
+  original_setitem = zarr.Array.__setitem__
+  def record_setitem(arr, key, value):
+    if arr.name.endswith("sst"):
+      writes.extend(range(key[0].start, key[0].stop))
+    return original_setitem(arr, key, value)
+  monkeypatch.setattr(zarr.Array, "__setitem__", record_setitem)
+  
+  ot.update_zarr_store(two_years, 2001, verbose = False)
+  assert sorted(set(writes)) == [366 + 150] + list(range(366 + 200, 366 + 207))
+  
+  annual = read_years(two_years, [2000, 2001])
+  np.testing.assert_allclose(read_store(two_years, "map").sst.values, annual.sst.values.astype("float32"))
+  
+  # The timeseries store is left for the rechunk
+  assert read_store(two_years, "timeseries").sizes["time"] == 366 + 200
+  
+  # Nothing changed, nothing written
+  writes.clear()
+  ot.update_zarr_store(two_years, 2001, verbose = False)
+  assert writes == []
+  
+  # Days flagged by the caller are the only ones checked
+  sst[10] += 1
+  sst[20] += 1
+  write_annual_file(two_years, 2001, sst)
+  ot.update_zarr_store(two_years, 2001, date_ids = ["20010111"], verbose = False)
+  assert sorted(set(writes)) == [366 + 10]
+
+
+def test_update_zarr_store_rejects_earlier_year(two_years):
+  ot.build_zarr_store(two_years, 2001, 2001, layouts = ["map"], verbose = False)
+  with pytest.raises(ValueError):
+    ot.update_zarr_store(two_years, 2000, verbose = False)
+
+
+def test_rechunk_zarr_store_matches_map_store(two_years):
+  ot.build_zarr_store(two_years, 2000, 2001, layouts = ["map"], verbose = False)
+  map_path = ot.get_zarr_store_path(two_years, "map")
+  ts_path  = ot.get_zarr_store_path(two_years, "timeseries")
+  assert zarr.open_group(map_path, mode = "r")["sst"].chunks == (31, 18, 36)
+  assert not os.path.exists(ts_path)
+  
+  # Checksums sit next to the store, not in the zarr hierarchy
+  assert os.path.exists(ot.get_zarr_checksum_path(map_path))
+  assert not os.path.exists(f"{map_path}/day_checksums.json")
+  
+  ot.rechunk_zarr_store(two_years, band_rows = 5, verbose = False)
+  assert zarr.open_group(ts_path, mode = "r")["sst"].chunks == (1461, 18, 20)
+  map_ds, ts_ds = read_store(two_years, "map"), read_store(two_years, "timeseries")
+  xr.testing.assert_identical(ts_ds, map_ds)
+  assert ot.load_zarr_checksums(ts_path) == ot.load_zarr_checksums(map_path)
+  assert len(ot.load_zarr_checksums(ts_path)) == 366 + 200
+
+
+def test_checksums_inside_old_stores_are_moved(two_years):
+  ot.build_zarr_store(two_years, 2000, 2001, layouts = ["map"], verbose = False)
+  map_path = ot.get_zarr_store_path(two_years, "map")
+  checksum_path = ot.get_zarr_checksum_path(map_path)
+  day_sums = ot.load_zarr_checksums(map_path)
+  os.replace(checksum_path, f"{map_path}/day_checksums.json")
+  assert ot.load_zarr_checksums(map_path) == day_sums
+  
+  # The next sync that writes a day saves them next to the store
+  sst = xr.open_dataset(ot.get_annual_path(two_years, 2001)).load().sst.values
+  sst[5] += 1
+  write_annual_file(two_years, 2001, sst)
+  ot.update_zarr_store(two_years, 2001, verbose = False)
+  assert os.path.exists(checksum_path) and not os.path.exists(f"{map_path}/day_checksums.json")